@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+PiGlow Monitor Benchmark
+Measures the monitor's own cost without PiGlow hardware or a live Pi-hole:
+a recording fake PiGlow counts I2C traffic and a local stand-in server
+answers api.php / ?summaryRaw with configurable latency and failures. A
+stand-in resolver answers the DNS probe, delaying uncached names.
+
+Usage: python3 benchmark.py [--ticks N] [--latency S] [--failure-rate F]
+                            [--bulk] [--output results.json]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import random
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pihole_monitor
+from pihole_monitor import PiHolePiGlowMonitor
+
+class RecordingPiGlow:
+    """Fake PiGlow that counts calls and the I2C traffic they would cause"""
+
+    # SN3218: every write is register + value(s), and the chip needs a write
+    # to its update register (0x16) before new PWM values show
+    UPDATE_BYTES = 2
+
+    def __init__(self):
+        self.values = [0] * 18
+        self.calls = {}
+        self.transactions = 0
+        self.bytes = 0
+
+    def _record(self, name, transactions, payload):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.transactions += transactions
+        self.bytes += payload
+
+    def led(self, index, value):
+        self.values[index] = value
+        self._record('led', 2, 2 + self.UPDATE_BYTES)
+
+    def arm(self, arm, value):
+        self.values[arm * 6:arm * 6 + 6] = [value] * 6
+        self._record('arm', 7, 6 * 2 + self.UPDATE_BYTES)
+
+    def color(self, color, value):
+        index = pihole_monitor.LED_COLORS.index(color)
+        for arm in range(3):
+            self.values[arm * 6 + index] = value
+        self._record('color', 4, 3 * 2 + self.UPDATE_BYTES)
+
+    def all(self, value):
+        self.values = [value] * 18
+        self._record('all', 2, 19 + self.UPDATE_BYTES)
+
+    def reset(self):
+        self.calls = {}
+        self.transactions = 0
+        self.bytes = 0
+
+class RecordingBulkPiGlow(RecordingPiGlow):
+    """Recording fake for drivers with a buffered set()/show() interface"""
+
+    def set(self, start, values):
+        self.values[start:start + len(values)] = values
+        self._record('set', 0, 0)
+
+    def show(self):
+        # One 18-byte block write from register 0x01, then the update
+        self._record('show', 2, 19 + self.UPDATE_BYTES)
+
+class FakePiHoleHandler(BaseHTTPRequestHandler):
+    """Serves the legacy api.php endpoints with growing counters"""
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; without this, Nagle plus
+    # delayed ACK adds ~40 ms to every keep-alive response
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        server.requests += 1
+        if server.latency:
+            time.sleep(server.latency)
+        if server.failure_rate and server.rng.random() < server.failure_rate:
+            self.send_error(500)
+            return
+
+        with server.lock:
+            server.queries += server.rng.randint(0, 40)
+            server.blocked += server.rng.randint(0, 8)
+            queries, blocked = server.queries, server.blocked
+
+        data = {"status": "enabled", "domains_being_blocked": 120000}
+        if self.path.endswith("?summaryRaw"):
+            data.update({
+                "dns_queries_today": queries,
+                "ads_blocked_today": blocked,
+                "ads_percentage_today": blocked / queries * 100 if queries else 0,
+                "unique_clients": 12
+            })
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_fake_pihole(latency=0.0, failure_rate=0.0, seed=1):
+    """Start the stand-in Pi-hole on a free localhost port"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakePiHoleHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.failure_rate = failure_rate
+    server.rng = random.Random(seed)
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.queries = 10000
+    server.blocked = 1500
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+class FakeResolver:
+    """Stand-in DNS server on a free localhost UDP port
+
+    Answers every A query with one record: 0.0.0.0 for names in blocked,
+    192.0.2.1 otherwise. Names under a random hex label (the probe's
+    uncached queries) are answered after uncached_latency seconds.
+    """
+
+    def __init__(self, uncached_latency=0.02, blocked=("blocked.example",)):
+        self.uncached_latency = uncached_latency
+        self.blocked = blocked
+        self.queries = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def reply(self, query, client):
+        question_end = query.index(b"\x00", 12) + 5
+        labels, offset = [], 12
+        while query[offset]:
+            labels.append(query[offset + 1:offset + 1 + query[offset]].decode())
+            offset += query[offset] + 1
+        address = "0.0.0.0" if ".".join(labels) in self.blocked else "192.0.2.1"
+        header = struct.pack("!6H", struct.unpack_from("!H", query)[0], 0x8180, 1, 1, 0, 0)
+        answer = struct.pack("!HHHIH", 0xC00C, 1, 1, 60, 4) + socket.inet_aton(address)
+        self.sock.sendto(header + query[12:question_end] + answer, client)
+
+    def serve(self):
+        while True:
+            try:
+                query, client = self.sock.recvfrom(512)
+            except OSError:
+                return
+            self.queries += 1
+            first_label = query[13:13 + query[12]]
+            if len(first_label) == 8 and all(c in b"0123456789abcdef" for c in first_label):
+                threading.Timer(self.uncached_latency, self.reply, (query, client)).start()
+            else:
+                self.reply(query, client)
+
+    def close(self):
+        self.sock.close()
+
+def build_monitor(server, piglow, config_dir):
+    """Monitor wired to the fake server and fake PiGlow, quiet and sensor-free"""
+    config = {
+        "pihole_api_url": f"http://127.0.0.1:{server.server_port}/admin/api.php",
+        "api_timeout": 2,
+        "temperature_sensor": "none",
+        "history": {"path": os.path.join(config_dir, "history.bin")}
+    }
+    config_file = os.path.join(config_dir, "config.json")
+    with open(config_file, "w") as f:
+        json.dump(config, f)
+    with contextlib.redirect_stdout(sys.stderr):
+        return PiHolePiGlowMonitor(config_file, piglow=piglow)
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def summarize(samples):
+    """Mean/p50/p95/max of a list of milliseconds"""
+    return {
+        'mean': sum(samples) / len(samples) if samples else 0.0,
+        'p50': percentile(samples, 0.50),
+        'p95': percentile(samples, 0.95),
+        'max': max(samples) if samples else 0.0
+    }
+
+def bench_ticks(monitor, ticks):
+    """Full tick (poll, sample, render) timed in wall and CPU time"""
+    piglow = monitor.piglow
+    piglow.reset()
+    wall, cpu = [], []
+    with contextlib.redirect_stdout(sys.stderr):
+        for _ in range(ticks):
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            state = {'pihole': monitor.get_pihole_status(), 'system': monitor.get_system_metrics()}
+            monitor.record_rates(state['pihole'])
+            state['rates'] = monitor.state.snapshot().get('rates')
+            monitor.render_frame(state, time.monotonic())
+            wall.append((time.perf_counter() - wall_start) * 1000)
+            cpu.append((time.process_time() - cpu_start) * 1000)
+    return {
+        'ticks': ticks,
+        'wall_ms': summarize(wall),
+        'cpu_ms': summarize(cpu),
+        'i2c_transactions_per_tick': piglow.transactions / ticks,
+        'i2c_bytes_per_tick': piglow.bytes / ticks,
+        'driver_calls': dict(piglow.calls)
+    }
+
+def bench_render(monitor, frames):
+    """Render-only cost at steady state and with every frame changing"""
+    piglow = monitor.piglow
+    pihole = {'status': 'enabled', 'domains_blocked': 1, 'queries_today': 5000,
+              'blocked_today': 700, 'percent_blocked': 14.0, 'clients': 5}
+    system = {'cpu_percent': 20.0, 'memory_percent': 40.0, 'temperature': 50.0,
+              'disk_percent': 30.0, 'cpu_avg': 20.0, 'memory_avg': 40.0}
+    results = {}
+    for name, vary in (('steady', False), ('changing', True)):
+        piglow.reset()
+        start = time.perf_counter()
+        for frame in range(frames):
+            if vary:
+                system = dict(system, cpu_percent=10 + frame % 80)
+            monitor.render_frame({'pihole': pihole, 'system': system}, frame / 10.0)
+        elapsed = time.perf_counter() - start
+        results[name] = {
+            'frames': frames,
+            'us_per_frame': elapsed / frames * 1e6,
+            'i2c_transactions_per_frame': piglow.transactions / frames,
+            'i2c_bytes_per_frame': piglow.bytes / frames
+        }
+    return results
+
+def bench_allocations(monitor, ticks):
+    """Python allocations across repeated ticks"""
+    with contextlib.redirect_stdout(sys.stderr):
+        monitor.get_pihole_status()
+        tracemalloc.start()
+        baseline, _ = tracemalloc.get_traced_memory()
+        blocks_before = sys.getallocatedblocks()
+        for _ in range(ticks):
+            state = {'pihole': monitor.get_pihole_status(), 'system': monitor.get_system_metrics()}
+            monitor.render_frame(state, time.monotonic())
+        current, peak = tracemalloc.get_traced_memory()
+        blocks_after = sys.getallocatedblocks()
+        tracemalloc.stop()
+    return {
+        'ticks': ticks,
+        'retained_bytes_per_tick': (current - baseline) / ticks,
+        'peak_bytes': peak - baseline,
+        'allocated_blocks_delta': blocks_after - blocks_before
+    }
+
+def bench_dns_probe(resolver, rounds):
+    """CPU cost of a probe round (the stand-in resolver's share included) and what it reports"""
+    probe = pihole_monitor.DNSProbe("127.0.0.1", resolver.port, {
+        "cached": ["pi.hole", "example.com"],
+        "uncached": ["example.com"],
+        "blocked": ["blocked.example"]
+    }, timeout=1.0)
+    cpu_ms = []
+    for _ in range(rounds):
+        start = time.process_time()
+        summary = probe.probe()
+        cpu_ms.append((time.process_time() - start) * 1000)
+    probe.close()
+    return {
+        'rounds': rounds,
+        'round_cpu_ms': summarize(cpu_ms),
+        'p50_ms': {kind: stats['p50_ms'] for kind, stats in summary['kinds'].items()},
+        'timeout_rate': summary['timeout_rate'],
+        'blocking_rate': summary['blocking_rate'],
+        'resolver_queries': resolver.queries
+    }
+
+def bench_scheduler(monitor, seconds):
+    """Run the real scheduler and check the frame loop keeps its rate"""
+    import asyncio
+
+    piglow = monitor.piglow
+    piglow.reset()
+    frame_times = []
+    render_frame = monitor.render_frame
+
+    def timed_render(state, now):
+        frame_times.append(time.perf_counter())
+        return render_frame(state, now)
+
+    monitor.render_frame = timed_render
+    collectors = monitor.build_collectors(monitor.config["update_interval"])
+    monitor.collectors = collectors
+    scheduler = pihole_monitor.MonitorScheduler(monitor, collectors, fps=monitor.config["animation_fps"])
+
+    async def run_for():
+        task = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(seconds)
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+    with contextlib.redirect_stdout(sys.stderr):
+        asyncio.run(run_for())
+    monitor.render_frame = render_frame
+
+    gaps = [(b - a) * 1000 for a, b in zip(frame_times, frame_times[1:])]
+    return {
+        'seconds': seconds,
+        'frames': len(frame_times),
+        'frame_gap_ms': summarize(gaps),
+        'i2c_transactions': piglow.transactions
+    }
+
+def main():
+    """Run all benchmarks and print JSON results"""
+    parser = argparse.ArgumentParser(description="Benchmark the Pi-hole PiGlow monitor")
+    parser.add_argument("--ticks", type=int, default=50)
+    parser.add_argument("--frames", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds added to every fake API response")
+    parser.add_argument("--failure-rate", type=float, default=0.0,
+                        help="fraction of fake API requests answered with HTTP 500")
+    parser.add_argument("--scheduler-seconds", type=float, default=3.0)
+    parser.add_argument("--dns-rounds", type=int, default=50)
+    parser.add_argument("--bulk", action="store_true",
+                        help="use a fake driver with a set()/show() bulk interface")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    server = start_fake_pihole(args.latency, args.failure_rate)
+    resolver = FakeResolver()
+    piglow = RecordingBulkPiGlow() if args.bulk else RecordingPiGlow()
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        monitor = build_monitor(server, piglow, config_dir)
+        results = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': sys.version.split()[0],
+            'params': vars(args),
+            'tick': bench_ticks(monitor, args.ticks),
+            'render': bench_render(monitor, args.frames),
+            'allocations': bench_allocations(monitor, args.ticks),
+            'scheduler': bench_scheduler(monitor, args.scheduler_seconds),
+            'dns_probe': bench_dns_probe(resolver, args.dns_rounds),
+            'api_requests': server.requests
+        }
+    server.shutdown()
+    resolver.close()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return True
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
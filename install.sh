@@ -157,6 +157,12 @@ EOF
         cp -r examples "$INSTALL_DIR/"
     fi
     
+    # Dashboard page served when dashboard.enabled is set
+    if [[ -f "docs/index.html" ]]; then
+        mkdir -p "$INSTALL_DIR/docs"
+        cp docs/index.html "$INSTALL_DIR/docs/"
+    fi
+    
     # Set ownership
     chown -R pi:pi "$INSTALL_DIR"
     
@@ -176,11 +182,13 @@ After=network.target pihole-FTL.service
 Wants=pihole-FTL.service
 
 [Service]
-Type=simple
+Type=notify
 User=pi
 Group=pi
 WorkingDirectory=$INSTALL_DIR
 ExecStart=/usr/bin/python3 $INSTALL_DIR/pihole_monitor.py
+ExecReload=/bin/kill -HUP \$MAINPID
+WatchdogSec=30
 Restart=always
 RestartSec=10
 StandardOutput=journal
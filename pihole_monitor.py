@@ -10,45 +10,3095 @@ Requirements:
 """
 
 import time
+
+# Measured from here so the time-to-first-frame report covers imports too
+PROCESS_START = time.monotonic()
+
 import json
-import requests
-import psutil
-from piglow import PiGlow
+import asyncio
 import subprocess
 import os
 import sys
+import threading
+import glob
+import shutil
+import random
+import math
+import signal
+import socket
+import select
+import struct
+import mmap
+import contextlib
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from types import MappingProxyType
+from urllib.parse import urlsplit
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
+
+# The service runs from the install directory, but the CLI may be started from
+# anywhere; config.json and the files it names are found relative to the script
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CONFIG = os.path.join(SCRIPT_DIR, "config.json")
+
+class PiHoleAPIClient:
+    """Keep-alive client for the legacy Pi-hole api.php endpoint"""
+
+    def __init__(self, api_url, timeout=5):
+        self.api_url = api_url
+        self.timeout = timeout
+
+        # requests takes ~0.1 s to import on a Pi; only pay for it when an
+        # API source is actually built
+        import requests
+
+        # One pooled connection is reused for every poll; the second slot is
+        # only needed when the base and summary endpoints are fetched in parallel
+        self.session = requests.Session()
+        self.adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2)
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+        self.executor = None
+
+        # None until the first summaryRaw response tells us whether it also
+        # carries the blocking status (newer v5 releases include it)
+        self.combined = None
+
+        # Validators and bodies for conditional requests, per endpoint
+        self.cache = {}
+        self.endpoint_stats = {}
+        self.instrumentation = None
+
+    def _record_latency(self, endpoint, elapsed_ms):
+        """Accumulate per-endpoint latency figures"""
+        stats = self.endpoint_stats.setdefault(
+            endpoint, {'count': 0, 'last_ms': 0.0, 'avg_ms': 0.0, 'max_ms': 0.0})
+        stats['count'] += 1
+        stats['last_ms'] = elapsed_ms
+        stats['avg_ms'] += (elapsed_ms - stats['avg_ms']) / stats['count']
+        stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+        if self.instrumentation:
+            self.instrumentation.record(f"api:{endpoint}", int(elapsed_ms * 1e6))
+
+    def _get(self, endpoint, timeout=None):
+        """GET one endpoint, using ETag/Last-Modified when the server sent them"""
+        url = self.api_url if endpoint == 'status' else f"{self.api_url}?{endpoint}"
+        headers = {}
+        cached = self.cache.get(endpoint)
+        if cached:
+            if cached['etag']:
+                headers['If-None-Match'] = cached['etag']
+            if cached['last_modified']:
+                headers['If-Modified-Since'] = cached['last_modified']
+
+        start = time.perf_counter()
+        response = self.session.get(url, headers=headers, timeout=timeout or self.timeout)
+        self._record_latency(endpoint, (time.perf_counter() - start) * 1000)
+
+        if response.status_code == 304 and cached:
+            return cached['data']
+        response.raise_for_status()
+        data = response.json()
+
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if etag or last_modified:
+            self.cache[endpoint] = {'etag': etag, 'last_modified': last_modified, 'data': data}
+        return data
+
+    def fetch_status(self, timeout=None):
+        """Fetch status and summary, raising on any request or parse error"""
+        if self.combined is False:
+            # Older API: base and summary are separate, fetch them concurrently
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=2)
+            status_future = self.executor.submit(self._get, 'status', timeout)
+            stats_data = self._get('summaryRaw', timeout)
+            data = status_future.result()
+        else:
+            stats_data = self._get('summaryRaw', timeout)
+            if self.combined is None:
+                self.combined = 'status' in stats_data
+            data = stats_data if self.combined else self._get('status', timeout)
+
+        return {
+            'status': data.get('status', 'unknown'),
+            'domains_blocked': int(data.get('domains_being_blocked', 0)),
+            'queries_today': int(stats_data.get('dns_queries_today', 0)),
+            'blocked_today': int(stats_data.get('ads_blocked_today', 0)),
+            'percent_blocked': float(stats_data.get('ads_percentage_today', 0)),
+            'clients': int(stats_data.get('unique_clients', 0))
+        }
+
+    def stats(self):
+        """Connection reuse and per-endpoint latency"""
+        pools = self.adapter.poolmanager.pools
+        pools = [pools[key] for key in pools.keys()]
+        requests_made = sum(pool.num_requests for pool in pools)
+        connections = sum(pool.num_connections for pool in pools)
+        reuse_rate = 1 - connections / requests_made if requests_made else 0.0
+        return {
+            'requests': requests_made,
+            'connections': connections,
+            'reuse_rate': reuse_rate,
+            'combined': bool(self.combined),
+            'endpoints': {name: dict(stats) for name, stats in self.endpoint_stats.items()}
+        }
+
+    def stats_line(self):
+        """One-line summary for the periodic log"""
+        stats = self.stats()
+        latencies = ", ".join(f"{name} {endpoint['last_ms']:.0f}ms"
+                              for name, endpoint in stats['endpoints'].items())
+        return f"API: {latencies} | Connection reuse {stats['reuse_rate'] * 100:.0f}%"
+
+    def close(self):
+        """Release pooled connections and worker threads"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+        self.session.close()
+
+class PiHoleV6Client(PiHoleAPIClient):
+    """Pi-hole v6 REST client that authenticates once and reuses the session"""
+
+    # Blocking state is not part of /api/stats/summary and rarely changes
+    BLOCKING_REFRESH = 60
+
+    def __init__(self, api_url, password="", timeout=5):
+        super().__init__(api_url, timeout)
+        parts = urlsplit(api_url)
+        self.base_url = f"{parts.scheme}://{parts.netloc}"
+        self.password = password
+        self.sid = None
+        self.sid_expires = 0.0
+        self.sid_validity = 300
+        self.auths = 0
+        self.blocking = 'unknown'
+        self.blocking_checked = 0.0
+
+    def _authenticate(self, timeout):
+        """Log in and cache the SID; FTL rate-limits logins and caps sessions"""
+        response = self.session.post(f"{self.base_url}/api/auth", json={"password": self.password},
+                                     timeout=timeout or self.timeout)
+        response.raise_for_status()
+        session = response.json()["session"]
+        if not session.get("valid"):
+            raise RuntimeError(session.get("message") or "Pi-hole rejected the password")
+        self.auths += 1
+        self.sid = session.get("sid")
+        self.sid_validity = session.get("validity", 300)
+        self.sid_expires = time.monotonic() + self.sid_validity
+
+    def _get(self, endpoint, timeout=None):
+        """GET /api/<endpoint>, re-authenticating only on expiry or a 401"""
+        if self.password and (self.sid is None or time.monotonic() >= self.sid_expires):
+            self._authenticate(timeout)
+
+        for attempt in range(2):
+            headers = {'X-FTL-SID': self.sid} if self.sid else {}
+            start = time.perf_counter()
+            response = self.session.get(f"{self.base_url}/api/{endpoint}", headers=headers,
+                                        timeout=timeout or self.timeout)
+            self._record_latency(endpoint, (time.perf_counter() - start) * 1000)
+            if response.status_code == 401 and self.password and attempt == 0:
+                self.sid = None
+                self._authenticate(timeout)
+                continue
+            break
+
+        response.raise_for_status()
+        if self.sid:
+            # Validity is sliding: every authenticated request extends it
+            self.sid_expires = time.monotonic() + self.sid_validity
+        return response.json()
+
+    def fetch_status(self, timeout=None):
+        """One summary request per poll; blocking state refreshed once a minute"""
+        summary = self._get("stats/summary", timeout)
+        now = time.monotonic()
+        if now - self.blocking_checked >= self.BLOCKING_REFRESH or self.blocking == 'unknown':
+            self.blocking = self._get("dns/blocking", timeout).get("blocking", "unknown")
+            self.blocking_checked = now
+
+        queries = summary.get("queries", {})
+        return {
+            'status': self.blocking,
+            'domains_blocked': int(summary.get("gravity", {}).get("domains_being_blocked", 0)),
+            'queries_today': int(queries.get("total", 0)),
+            'blocked_today': int(queries.get("blocked", 0)),
+            'percent_blocked': float(queries.get("percent_blocked", 0)),
+            'clients': int(summary.get("clients", {}).get("active", 0))
+        }
+
+    def stats(self):
+        stats = super().stats()
+        stats['auths'] = self.auths
+        return stats
+
+    def stats_line(self):
+        return f"{super().stats_line()} | v6, {self.auths} logins"
+
+    def close(self):
+        """Log out so the session slot is freed, then drop connections"""
+        if self.sid:
+            try:
+                self.session.delete(f"{self.base_url}/api/auth",
+                                    headers={'X-FTL-SID': self.sid}, timeout=self.timeout)
+            except Exception as e:
+                print(f"Pi-hole logout failed: {e}")
+            self.sid = None
+        super().close()
+
+def detect_api_version(api_url, timeout=5):
+    """6 if the server answers the v6 /api/auth endpoint, otherwise 5"""
+    import requests
+    parts = urlsplit(api_url)
+    response = requests.get(f"{parts.scheme}://{parts.netloc}/api/auth", timeout=timeout)
+    if response.status_code in (200, 401):
+        try:
+            body = response.json()
+        except ValueError:
+            return 5
+        if isinstance(body, dict) and ("session" in body or "error" in body):
+            return 6
+    return 5
+
+class AutoDetectAPIClient:
+    """Probes the API version on the first successful contact, then delegates"""
+
+    def __init__(self, api_url, password="", timeout=5):
+        self.api_url = api_url
+        self.password = password
+        self.timeout = timeout
+        self.client = None
+        self.instrumentation = None
+
+    def fetch_status(self, timeout=None):
+        if self.client is None:
+            # An unreachable Pi-hole raises here and is simply probed again
+            # on the next poll
+            version = detect_api_version(self.api_url, timeout or self.timeout)
+            print(f"Detected Pi-hole API v{version} at {self.api_url}")
+            if version == 6:
+                self.client = PiHoleV6Client(self.api_url, self.password, self.timeout)
+            else:
+                self.client = PiHoleAPIClient(self.api_url, self.timeout)
+            self.client.instrumentation = self.instrumentation
+        return self.client.fetch_status(timeout)
+
+    def stats(self):
+        return self.client.stats() if self.client else {}
+
+    def stats_line(self):
+        return self.client.stats_line() if self.client else "API: version not detected yet"
+
+    def close(self):
+        if self.client:
+            self.client.close()
+
+# pihole-FTL query status codes (v5 and v6)
+FTL_BLOCKED_STATUSES = frozenset((1, 4, 5, 6, 7, 8, 9, 10, 11, 15, 16, 18))
+FTL_FORWARDED_STATUSES = frozenset((2, 14))
+FTL_CACHED_STATUSES = frozenset((3, 17))
+
+def _setup_vars_blocking(lines):
+    """BLOCKING_ENABLED from a v5 setupVars.conf"""
+    status = 'enabled'
+    for line in lines:
+        if line.startswith("BLOCKING_ENABLED="):
+            value = line.split("=", 1)[1].strip().lower()
+            status = 'enabled' if value == 'true' else 'disabled'
+    return status
+
+def _pihole_toml_blocking(lines):
+    """dns.blocking.active from a v6 pihole.toml"""
+    status = 'enabled'
+    section = None
+    for line in lines:
+        line = line.split("#", 1)[0].strip()
+        if line.startswith("["):
+            section = line.strip("[] ")
+        elif section == "dns.blocking" and line.split("=", 1)[0].strip() == "active":
+            status = 'enabled' if line.split("=", 1)[1].strip() == 'true' else 'disabled'
+    return status
+
+class FTLDatabaseSource:
+    """Incremental read-only reader for the pihole-FTL long-term database"""
+
+    # Same SQL text every poll, so sqlite3's statement cache keeps them prepared
+    DAY_START_SQL = "SELECT id FROM queries WHERE timestamp < ? ORDER BY timestamp DESC LIMIT 1"
+    NEW_ROWS_SQL = "SELECT id, status, client, domain FROM queries WHERE id > ? AND timestamp >= ? ORDER BY id"
+
+    def __init__(self, db_path="/etc/pihole/pihole-FTL.db",
+                 gravity_path="/etc/pihole/gravity.db",
+                 setup_vars="/etc/pihole/setupVars.conf",
+                 pihole_toml="/etc/pihole/pihole.toml"):
+        self.db_path = db_path
+        self.gravity_path = gravity_path
+        self.setup_vars = setup_vars
+        self.pihole_toml = pihole_toml
+        self.conn = None
+
+        # Cursor over the queries table and today's running totals
+        self.last_id = 0
+        self.day = None
+        self.day_start = 0
+        self.counts = {'total': 0, 'blocked': 0, 'forwarded': 0, 'cached': 0}
+        self.clients = set()
+
+        self.blocking_status = 'enabled'
+        # (path, mtime) the blocking status was last read from
+        self.blocking_source = None
+        self.domains_blocked = 0
+        self.gravity_checked = 0.0
+
+        self.rows_read = 0
+        self.last_ms = 0.0
+        # Optional QueryAggregator fed with every new row
+        self.aggregator = None
+
+    def _connect(self):
+        """Open the database once, read-only; FTL keeps writing to it"""
+        # sqlite3 only loads for the ftl_db source, not with the default API one
+        import sqlite3
+        uri = f"file:{self.db_path}?mode=ro"
+        self.conn = sqlite3.connect(uri, uri=True, timeout=2, check_same_thread=False)
+
+    def _start_day(self, today):
+        """Reset totals and move the cursor to the last row before midnight"""
+        midnight = datetime.combine(today, datetime.min.time()).timestamp()
+        row = self.conn.execute(self.DAY_START_SQL, (midnight,)).fetchone()
+        self.day = today
+        self.day_start = midnight
+        self.last_id = row[0] if row else 0
+        self.counts = dict.fromkeys(self.counts, 0)
+        self.clients = set()
+
+    def _read_blocking_status(self):
+        """Blocking state from pihole.toml (v6) or setupVars.conf (v5),
+        re-read only when the file changes. Timed disables on v6 are not
+        written to pihole.toml and read as 'enabled'."""
+        for path, parse in ((self.pihole_toml, _pihole_toml_blocking),
+                            (self.setup_vars, _setup_vars_blocking)):
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                continue
+            if (path, mtime) != self.blocking_source:
+                self.blocking_source = (path, mtime)
+                with open(path) as f:
+                    self.blocking_status = parse(f)
+            break
+        return self.blocking_status
+
+    def _read_domains_blocked(self):
+        """Gravity size, refreshed hourly since it only changes on gravity updates"""
+        now = time.monotonic()
+        if self.gravity_checked and now - self.gravity_checked < 3600:
+            return self.domains_blocked
+        self.gravity_checked = now
+        import sqlite3
+        try:
+            gravity = sqlite3.connect(f"file:{self.gravity_path}?mode=ro", uri=True, timeout=2)
+            try:
+                row = gravity.execute(
+                    "SELECT value FROM info WHERE property = 'gravity_count'").fetchone()
+            finally:
+                gravity.close()
+            if row:
+                self.domains_blocked = int(row[0])
+        except (sqlite3.Error, ValueError) as e:
+            print(f"Cannot read gravity count: {e}")
+        return self.domains_blocked
+
+    def fetch_status(self, timeout=None):
+        """Read rows added since the last poll and return today's totals"""
+        start = time.perf_counter()
+        if self.conn is None:
+            self._connect()
+
+        today = datetime.now().date()
+        if today != self.day:
+            self._start_day(today)
+
+        new = {'total': 0, 'blocked': 0, 'forwarded': 0, 'cached': 0}
+        aggregator = self.aggregator
+        last_id = self.last_id
+        for row_id, status, client, domain in self.conn.execute(self.NEW_ROWS_SQL, (last_id, self.day_start)):
+            last_id = row_id
+            new['total'] += 1
+            if aggregator is not None:
+                aggregator.add('query', domain, client)
+            if status in FTL_BLOCKED_STATUSES:
+                new['blocked'] += 1
+                if aggregator is not None:
+                    aggregator.add('blocked', domain, client)
+            elif status in FTL_FORWARDED_STATUSES:
+                new['forwarded'] += 1
+            elif status in FTL_CACHED_STATUSES:
+                new['cached'] += 1
+            self.clients.add(client)
+        self.last_id = last_id
+        for key, value in new.items():
+            self.counts[key] += value
+
+        self.rows_read += new['total']
+        self.last_ms = (time.perf_counter() - start) * 1000
+
+        total = self.counts['total']
+        return {
+            'status': self._read_blocking_status(),
+            'domains_blocked': self._read_domains_blocked(),
+            'queries_today': total,
+            'blocked_today': self.counts['blocked'],
+            'percent_blocked': self.counts['blocked'] / total * 100 if total else 0.0,
+            'clients': len(self.clients),
+            'forwarded_today': self.counts['forwarded'],
+            'cached_today': self.counts['cached'],
+            'new_queries': new['total'],
+            'new_blocked': new['blocked']
+        }
+
+    def stats(self):
+        """Rows scanned and last poll duration"""
+        return {'rows_read': self.rows_read, 'last_id': self.last_id, 'last_ms': self.last_ms}
+
+    def stats_line(self):
+        """One-line summary for the periodic log"""
+        return f"FTL DB: {self.rows_read} rows read, last poll {self.last_ms:.1f}ms"
+
+    def close(self):
+        """Close the long-lived connection"""
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+# dnsmasq actions in pihole.log that mean the query was blocked
+LOG_BLOCKED_ACTIONS = frozenset(('gravity', 'regex', 'exactly', 'special', 'blacklisted'))
+
+def parse_log_lines(lines):
+    """Turn dnsmasq log lines into (event, domain, peer) tuples"""
+    for line in lines:
+        marker = line.find(b"]: ")
+        if marker < 0:
+            continue
+        fields = line[marker + 3:].split()
+        if len(fields) < 4:
+            continue
+        action = fields[0]
+        if action.startswith(b"query["):
+            yield 'query', fields[1], fields[3]
+        elif action == b"forwarded":
+            yield 'forwarded', fields[1], fields[3]
+        elif action.startswith(b"cached"):
+            yield 'cached', fields[1], fields[3]
+        elif action.decode(errors="replace") in LOG_BLOCKED_ACTIONS and len(fields) >= 5:
+            # "gravity blocked example.com is 0.0.0.0"
+            yield 'blocked', fields[2], fields[4]
+
+class PiholeLogTail:
+    """Follows pihole.log across logrotate and keeps per-second event counts"""
+
+    EVENTS = ('query', 'blocked', 'forwarded', 'cached')
+    # Bytes before the read offset kept to notice the file being rewritten
+    TAIL_SIZE = 64
+
+    def __init__(self, path="/var/log/pihole/pihole.log", history=60, clock=time.time):
+        self.path = path
+        self.history = history
+        self.clock = clock
+        self.handle = None
+        self.inode = None
+        self.partial = b""
+        self.tail = b""
+
+        # One slot per second of history; slot_seconds says which second a
+        # slot currently holds so stale slots read as zero
+        self.slot_seconds = array('q', [-1]) * history
+        self.counters = {event: array('l', [0]) * history for event in self.EVENTS}
+        self.lines_read = 0
+        self.rotations = 0
+        # Optional QueryAggregator fed with every parsed event
+        self.aggregator = None
+
+    def _open(self, seek_end):
+        """Open the log, optionally skipping what is already there"""
+        self.handle = open(self.path, "rb")
+        self.inode = os.fstat(self.handle.fileno()).st_ino
+        if seek_end:
+            self.handle.seek(0, os.SEEK_END)
+        self.partial = b""
+        self._remember_tail()
+
+    def _remember_tail(self):
+        """Keep the bytes just before the read offset"""
+        offset = self.handle.tell()
+        size = min(offset, self.TAIL_SIZE)
+        self.tail = os.pread(self.handle.fileno(), size, offset - size)
+
+    def _rewritten(self, size):
+        """True if the file was truncated, even if it has since regrown
+        past the read offset: the bytes before the offset no longer match"""
+        offset = self.handle.tell()
+        if size < offset:
+            return True
+        tail = self.tail
+        return bool(tail) and os.pread(self.handle.fileno(), len(tail), offset - len(tail)) != tail
+
+    def _lines(self):
+        """Complete lines appended since the last poll; a trailing fragment waits"""
+        partial = self.partial
+        while True:
+            line = self.handle.readline()
+            if not line:
+                break
+            if not line.endswith(b"\n"):
+                # Writer is mid-line; keep the fragment for the next poll
+                partial += line
+                continue
+            self.lines_read += 1
+            yield partial + line
+            partial = b""
+        self.partial = partial
+
+    def _consume(self):
+        """Run new lines through the parser pipeline and count events"""
+        second = int(self.clock())
+        aggregator = self.aggregator
+        events = 0
+        for event, domain, peer in parse_log_lines(self._lines()):
+            self._count(event, second)
+            if aggregator is not None:
+                aggregator.add(event, domain, peer)
+            events += 1
+        self._remember_tail()
+        return events
+
+    def _count(self, event, second):
+        """Increment the counter for this second"""
+        slot = second % self.history
+        if self.slot_seconds[slot] != second:
+            self.slot_seconds[slot] = second
+            for counter in self.counters.values():
+                counter[slot] = 0
+        self.counters[event][slot] += 1
+
+    def poll(self):
+        """Read new log lines, following rotation and truncation"""
+        if self.handle is None:
+            self._open(seek_end=True)
+            return 0
+
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            # Rotated away and not yet recreated
+            return self._consume()
+
+        events = 0
+        if stat.st_ino != self.inode:
+            # logrotate moved the file: drain the old handle, then read the
+            # new file from its start
+            events = self._consume()
+            self.handle.close()
+            self._open(seek_end=False)
+            self.rotations += 1
+        elif self._rewritten(stat.st_size):
+            # copytruncate: same inode, checked before reading so the middle
+            # of the new content is never parsed as a continuation
+            self.handle.seek(0)
+            self.partial = b""
+            self.rotations += 1
+        return events + self._consume()
+
+    def count(self, event, seconds):
+        """Events of one kind in the last `seconds` seconds"""
+        now = int(self.clock())
+        counter = self.counters[event]
+        total = 0
+        for second in range(now - min(seconds, self.history) + 1, now + 1):
+            slot = second % self.history
+            if self.slot_seconds[slot] == second:
+                total += counter[slot]
+        return total
+
+    def cover(self, seconds):
+        """Grow the per-second history so windows up to `seconds` are complete"""
+        if seconds <= self.history:
+            return
+        slot_seconds = array('q', [-1]) * seconds
+        counters = {event: array('l', [0]) * seconds for event in self.EVENTS}
+        for slot, second in enumerate(self.slot_seconds):
+            if second >= 0:
+                slot_seconds[second % seconds] = second
+                for event, counter in counters.items():
+                    counter[second % seconds] = self.counters[event][slot]
+        self.history, self.slot_seconds, self.counters = seconds, slot_seconds, counters
+
+    def rates(self, windows):
+        """{window: (queries/min, blocked/min)} from the per-second counts"""
+        if windows:
+            # A window longer than the history would count only its last
+            # `history` seconds and under-report
+            self.cover(max(windows))
+        return {window: (self.count('query', window) * 60.0 / window,
+                         self.count('blocked', window) * 60.0 / window)
+                for window in windows}
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+class SpaceSaving:
+    """Top-k heavy hitters in fixed memory (Space-Saving, Metwally et al.)
+
+    At most `capacity` keys are tracked. A new key replaces the smallest
+    one and inherits its count as an error bound, so every key with more
+    than total/capacity of the traffic is guaranteed to be listed.
+    decay() scales everything by 2^(-elapsed/half_life) so the ranking
+    follows recent traffic rather than the whole day.
+    """
+
+    def __init__(self, capacity, half_life=300, clock=time.monotonic):
+        self.capacity = capacity
+        self.half_life = half_life
+        self.clock = clock
+        self.counts = {}
+        self.errors = {}
+        self.total = 0.0
+        self.last_decay = clock()
+
+    def add(self, key, weight=1.0):
+        counts = self.counts
+        if key in counts:
+            counts[key] += weight
+        elif len(counts) < self.capacity:
+            counts[key] = weight
+            self.errors[key] = 0.0
+        else:
+            victim = min(counts, key=counts.get)
+            floor = counts.pop(victim)
+            del self.errors[victim]
+            counts[key] = floor + weight
+            self.errors[key] = floor
+        self.total += weight
+
+    def decay(self, now=None):
+        """Age the counts; cheap enough to call on every snapshot"""
+        if now is None:
+            now = self.clock()
+        elapsed = now - self.last_decay
+        if elapsed <= 0:
+            return
+        factor = 0.5 ** (elapsed / self.half_life)
+        for key in self.counts:
+            self.counts[key] *= factor
+            self.errors[key] *= factor
+        self.total *= factor
+        self.last_decay = now
+
+    def top(self, n):
+        """[(key, count, error)] for the n largest counts"""
+        ranked = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:n]
+        return [(key, count, self.errors[key]) for key, count in ranked]
+
+    def error_bound(self):
+        """Largest overcount of any tracked key: 0 until a key is replaced,
+        never more than total/capacity"""
+        return max(self.errors.values(), default=0.0)
+
+class QueryAggregator:
+    """Decaying top clients, domains and blocked domains from per-query events
+
+    Fed by PiholeLogTail or FTLDatabaseSource, possibly from several
+    collector threads, so updates take a lock.
+    """
+
+    def __init__(self, capacity=64, half_life=300, clock=time.monotonic):
+        self.clock = clock
+        self.clients = SpaceSaving(capacity, half_life, clock)
+        self.domains = SpaceSaving(capacity, half_life, clock)
+        self.blocked_domains = SpaceSaving(capacity, half_life, clock)
+        self.lock = threading.Lock()
+
+    def add(self, event, domain, client):
+        """One parsed query event; only queries and blocks are counted"""
+        with self.lock:
+            if event == 'query':
+                self.clients.add(client)
+                self.domains.add(domain)
+            elif event == 'blocked':
+                self.blocked_domains.add(domain)
+
+    @staticmethod
+    def _name(key):
+        return key.decode(errors="replace") if isinstance(key, bytes) else str(key)
+
+    def snapshot(self, n=10):
+        """Decayed top-n lists with each entry's share of recent traffic,
+        plus the top share and error bound (as a share) per list"""
+        now = self.clock()
+        result = {'dominant': {}, 'error_bound': {}}
+        with self.lock:
+            for name, sketch in (('clients', self.clients), ('domains', self.domains),
+                                 ('blocked_domains', self.blocked_domains)):
+                sketch.decay(now)
+                total = sketch.total
+                result[name] = [(self._name(key), count, count / total if total else 0.0)
+                                for key, count, error in sketch.top(n)]
+                result['dominant'][name] = result[name][0][2] if result[name] else 0.0
+                result['error_bound'][name] = sketch.error_bound() / total if total else 0.0
+            result['recent_queries'] = self.clients.total
+        return result
+
+# What leaves the process unless top_talkers.expose_names is set: no
+# client addresses, no domain names
+TALKER_SUMMARY_KEYS = ('recent_queries', 'dominant', 'error_bound')
+
+def talker_summary(talkers):
+    """Top-talkers snapshot reduced to name-free aggregates"""
+    if not talkers:
+        return talkers
+    return {key: talkers[key] for key in TALKER_SUMMARY_KEYS if key in talkers}
+
+# Status arm precedence when merging a fleet: the worst instance wins
+STATUS_RANK = {'enabled': 0, 'unknown': 1, 'disabled': 2, 'error': 3}
+
+def encode_dns_query(txid, name, qtype=1):
+    """Recursive query packet for name (type A by default)"""
+    qname = b""
+    for label in name.rstrip(".").split("."):
+        label = label.encode("ascii")
+        if not 0 < len(label) < 64:
+            raise ValueError(f"invalid DNS name {name!r}")
+        qname += bytes([len(label)]) + label
+    # Header: ID, flags with RD set, one question
+    return struct.pack("!6H", txid, 0x0100, 1, 0, 0, 0) + qname + b"\x00" + struct.pack("!HH", qtype, 1)
+
+def _skip_dns_name(packet, offset):
+    """Offset just past the (possibly compressed) name at offset"""
+    while True:
+        length = packet[offset]
+        if length & 0xC0 == 0xC0:
+            return offset + 2
+        offset += length + 1
+        if length == 0:
+            return offset
+
+def parse_dns_response(packet):
+    """(txid, rcode, first A record address or None); ValueError if malformed"""
+    try:
+        txid, flags, qdcount, ancount, _, _ = struct.unpack_from("!6H", packet)
+        if not flags & 0x8000:
+            raise ValueError("not a DNS response")
+        offset = 12
+        for _ in range(qdcount):
+            offset = _skip_dns_name(packet, offset) + 4
+        address = None
+        for _ in range(ancount):
+            offset = _skip_dns_name(packet, offset)
+            rtype, _, _, rdlength = struct.unpack_from("!HHIH", packet, offset)
+            offset += 10
+            if rtype == 1 and rdlength == 4:
+                address = socket.inet_ntoa(packet[offset:offset + 4])
+                break
+            offset += rdlength
+        if address is None and flags & 0x0200:
+            # TC set and no address made it in: "no data" would be a guess
+            raise ValueError("truncated DNS response")
+        return txid, flags & 0x000F, address
+    except (struct.error, IndexError) as e:
+        raise ValueError(f"malformed DNS response: {e}")
+
+class DNSProbe:
+    """Times queries to the local resolver, the way clients see it
+
+    Each round sends every configured name at once from one non-blocking
+    UDP socket and matches the replies by transaction ID. Cached names
+    show the resolver's own latency; uncached ones get a random label
+    prepended so they always go upstream; blocked ones check that
+    blocking answers (0.0.0.0, NXDOMAIN or no data). The last `window`
+    results per kind feed the percentiles and the timeout rate.
+    """
+
+    KINDS = ('cached', 'uncached', 'blocked')
+
+    def __init__(self, server="127.0.0.1", port=53, names=None, timeout=1.0, window=60):
+        self.server = server
+        self.port = port
+        names = names or {}
+        self.names = {kind: list(names.get(kind, [])) for kind in self.KINDS}
+        for kind_names in self.names.values():
+            for name in kind_names:
+                encode_dns_query(0, name)
+        self.timeout = timeout
+        # Latency in ms per query, None for no usable answer
+        self.samples = {kind: deque(maxlen=window) for kind in self.KINDS}
+        self.blocked = deque(maxlen=window)
+        self.sock = None
+        self.rounds = 0
+        self.queries = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.late = 0
+
+    def _socket(self):
+        if self.sock is None:
+            family, kind, proto, _, address = socket.getaddrinfo(self.server, self.port,
+                                                                 type=socket.SOCK_DGRAM)[0]
+            sock = socket.socket(family, kind, proto)
+            sock.setblocking(False)
+            # Connected, so only the resolver's replies are delivered
+            sock.connect(address)
+            self.sock = sock
+        return self.sock
+
+    def _drain(self, sock):
+        """Discard replies that arrived after their round timed out"""
+        while True:
+            try:
+                sock.recv(4096)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                # ICMP unreachable from an earlier send surfaces here
+                return
+            self.late += 1
+
+    def probe(self):
+        """Collector: one round of queries, returns the rolling summary"""
+        sock = self._socket()
+        self._drain(sock)
+        self.rounds += 1
+        outstanding = {}
+        for kind in self.KINDS:
+            for name in self.names[kind]:
+                if kind == 'uncached':
+                    name = f"{random.getrandbits(32):08x}.{name}"
+                txid = random.getrandbits(16)
+                while txid in outstanding:
+                    txid = random.getrandbits(16)
+                try:
+                    sock.send(encode_dns_query(txid, name))
+                except OSError:
+                    self.samples[kind].append(None)
+                    self.errors += 1
+                    continue
+                outstanding[txid] = (kind, time.perf_counter_ns())
+        self.queries += len(outstanding)
+
+        deadline = time.perf_counter() + self.timeout
+        while outstanding:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            if not select.select([sock], [], [], remaining)[0]:
+                break
+            try:
+                packet = sock.recv(4096)
+            except (BlockingIOError, InterruptedError):
+                continue
+            except OSError:
+                # Connection refused: nothing is listening, the rest won't come
+                break
+            received = time.perf_counter_ns()
+            try:
+                txid, rcode, address = parse_dns_response(packet)
+            except ValueError:
+                self.errors += 1
+                # The ID in an unusable reply still settles its query, as
+                # unanswered, instead of leaving it to time out
+                if len(packet) >= 2:
+                    entry = outstanding.pop(struct.unpack_from("!H", packet)[0], None)
+                    if entry is not None:
+                        self.samples[entry[0]].append(None)
+                continue
+            entry = outstanding.pop(txid, None)
+            if entry is None:
+                self.late += 1
+                continue
+            kind, sent = entry
+            self.samples[kind].append((received - sent) / 1e6)
+            if rcode in (2, 5):
+                # SERVFAIL/REFUSED: answered, but not usefully
+                self.errors += 1
+            if kind == 'blocked':
+                self.blocked.append(rcode == 3 or (rcode == 0 and address in (None, "0.0.0.0")))
+
+        for kind, _ in outstanding.values():
+            self.samples[kind].append(None)
+        self.timeouts += len(outstanding)
+        return self.summary()
+
+    @staticmethod
+    def _summarize(samples):
+        """LatencyHistogram summary of the answered samples plus the timeout rate"""
+        histogram = LatencyHistogram()
+        for latency_ms in samples:
+            if latency_ms is not None:
+                histogram.observe(int(latency_ms * 1e6))
+        summary = histogram.summary()
+        summary['timeout_rate'] = (len(samples) - histogram.count) / len(samples)
+        return summary
+
+    def summary(self):
+        """Percentiles per kind and over every query, timeout rate, blocking check"""
+        kinds = {kind: self._summarize(self.samples[kind])
+                 for kind in self.KINDS if self.samples[kind]}
+        overall = self._summarize([latency for samples in self.samples.values() for latency in samples]
+                                  ) if kinds else None
+        return {
+            'kinds': kinds,
+            'p50_ms': overall['p50_ms'] if overall else None,
+            'p95_ms': overall['p95_ms'] if overall else None,
+            'timeout_rate': overall['timeout_rate'] if overall else None,
+            'blocking_rate': sum(self.blocked) / len(self.blocked) if self.blocked else None,
+            'queries': self.queries,
+            'timeouts': self.timeouts,
+            'errors': self.errors
+        }
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+class PollController:
+    """Backoff, circuit breaker and adaptive interval for one polled source
+
+    The interval stretches while the query rate is steady and falls back
+    to the configured one when the rate steps. A step is judged against
+    Poisson noise around an EWMA of past rates, so ordinary jitter in
+    home traffic doesn't count. Only a blocking status change polls
+    faster than the configured interval, down to min_interval.
+
+    The circuit opens after failure_threshold failures; the first poll
+    after the backoff is a half-open probe that closes it on success and
+    reopens it on failure.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+    # EWMA weight of the newest rate, and how many standard deviations of
+    # Poisson noise a new rate must be off to count as a change
+    RATE_ALPHA = 0.3
+    CHANGE_Z = 3.0
+
+    def __init__(self, interval, min_interval=2, max_interval=60, failure_threshold=3,
+                 max_backoff=300, jitter=0.2, adaptive=True, rng=random.random):
+        self.base_interval = interval
+        self.interval = interval
+        self.min_interval = min(min_interval, interval)
+        self.max_interval = max(max_interval, interval)
+        self.failure_threshold = failure_threshold
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.adaptive = adaptive
+        self.rng = rng
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.last_sample = None
+        self.rate_ewma = None
+
+    def _jittered(self, delay):
+        """Spread retries so several monitors don't hit the API in lockstep"""
+        return delay * (1 + self.jitter * (2 * self.rng() - 1))
+
+    def next_delay(self):
+        """Seconds until the next poll"""
+        if self.failures:
+            backoff = self.base_interval * 2 ** (self.failures - 1)
+            return self._jittered(min(self.max_backoff, backoff))
+        return self.interval
+
+    def start_poll(self):
+        """Called before each poll; one made while open is the half-open probe"""
+        if self.state == self.OPEN:
+            self.state = self.HALF_OPEN
+
+    def _rate_changed(self, count, elapsed):
+        """True if `count` queries in `elapsed` seconds is off the EWMA by
+        more than Poisson noise allows"""
+        rate = count / elapsed
+        if self.rate_ewma is None:
+            self.rate_ewma = rate
+            return False
+        expected = self.rate_ewma * elapsed
+        # Poisson: variance equals the mean; floor it so near-idle
+        # instances don't trip on a query or two
+        z = abs(count - expected) / math.sqrt(max(expected, 1.0))
+        if z > self.CHANGE_Z:
+            # Re-centre on the new level instead of crawling towards it
+            self.rate_ewma = rate
+            return True
+        self.rate_ewma += self.RATE_ALPHA * (rate - self.rate_ewma)
+        return False
+
+    def record_success(self, data, now=None):
+        """Close the circuit and adapt the interval to how fast values move"""
+        if now is None:
+            now = time.monotonic()
+        self.failures = 0
+        self.state = self.CLOSED
+        if not self.adaptive:
+            return
+
+        sample = (now, data['queries_today'], data['status'])
+        previous = self.last_sample
+        self.last_sample = sample
+        if previous is None:
+            return
+        elapsed = now - previous[0]
+        count = sample[1] - previous[1]
+        if sample[2] != previous[2]:
+            self.interval = max(self.min_interval, min(self.interval, self.base_interval) / 2)
+        elif elapsed <= 0 or count < 0:
+            # Midnight reset or a clock hiccup: no rate from this pair
+            return
+        elif self._rate_changed(count, elapsed):
+            self.interval = self.base_interval
+        else:
+            self.interval = min(self.max_interval, max(self.interval, self.base_interval) * 1.25)
+
+    def record_failure(self):
+        """Count a failure; open the circuit at the threshold or when a probe fails"""
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+        # Rates across an outage are meaningless; start adapting afresh
+        self.last_sample = None
+        self.rate_ewma = None
+
+    @property
+    def is_open(self):
+        """Open or half-open: polls are short probes"""
+        return self.state != self.CLOSED
+
+class PiHoleInstance:
+    """One Pi-hole in the fleet with its own data source and health record"""
+
+    def __init__(self, name, source, timeout, controller=None, probe_timeout=2, clock=time.monotonic):
+        self.name = name
+        self.clock = clock
+        self.source = source
+        self.timeout = timeout
+        self.probe_timeout = probe_timeout
+        self.controller = controller
+        self.data = None
+        self.healthy = False
+        self.failures = 0
+        self.polls = 0
+        self.errors = 0
+        self.latency_ms = None
+        self.last_ok = None
+
+    def current_timeout(self):
+        """Request timeout: a short probe while the circuit is open"""
+        if self.controller and self.controller.is_open:
+            return min(self.probe_timeout, self.timeout)
+        return self.timeout
+
+    def next_delay(self):
+        """Seconds until this instance should be polled again"""
+        return self.controller.next_delay()
+
+    def poll(self):
+        """Fetch from the source, timing the call; raises on failure"""
+        if self.controller:
+            self.controller.start_poll()
+        start = time.perf_counter()
+        try:
+            return self.source.fetch_status(timeout=self.current_timeout())
+        finally:
+            self.latency_ms = (time.perf_counter() - start) * 1000
+
+    def record(self, data):
+        """Update health from a poll result (None = failed or timed out)"""
+        self.polls += 1
+        if data:
+            self.data = data
+            self.healthy = True
+            self.failures = 0
+            self.last_ok = self.clock()
+            if self.controller:
+                self.controller.record_success(data)
+        else:
+            self.healthy = False
+            self.failures += 1
+            self.errors += 1
+            if self.controller:
+                self.controller.record_failure()
+
+    def health(self):
+        """Per-instance figures for logs and exporters"""
+        return {
+            'healthy': self.healthy,
+            'status': self.data['status'] if self.healthy else 'error',
+            'latency_ms': self.latency_ms,
+            'failures': self.failures,
+            'polls': self.polls,
+            'errors': self.errors,
+            'age': self.clock() - self.last_ok if self.last_ok else None,
+            'circuit': self.controller.state if self.controller else None,
+            'interval': self.controller.next_delay() if self.controller else None
+        }
+
+def merge_fleet(instances, stale_max_age=0):
+    """Fleet totals and worst status, None once nothing usable is left
+
+    While every instance is down the last good data keeps being served for
+    up to stale_max_age seconds, marked with its age and an error status.
+    """
+    stale_age = None
+    if not any(instance.healthy for instance in instances):
+        ages = [instance.health()['age'] for instance in instances if instance.last_ok]
+        if not ages or min(ages) > stale_max_age:
+            return None
+        stale_age = min(ages)
+
+    # Failing instances keep contributing their last good counters so the
+    # totals (and the rates derived from them) don't dip during an outage
+    known = [instance for instance in instances if instance.data]
+    queries = sum(instance.data['queries_today'] for instance in known)
+    blocked = sum(instance.data['blocked_today'] for instance in known)
+    status = max((instance.data['status'] if instance.healthy else 'error'
+                  for instance in instances),
+                 key=lambda value: STATUS_RANK.get(value, 1))
+    return {
+        'status': status,
+        'domains_blocked': max(instance.data['domains_blocked'] for instance in known),
+        'queries_today': queries,
+        'blocked_today': blocked,
+        'percent_blocked': blocked / queries * 100 if queries else 0.0,
+        'clients': sum(instance.data['clients'] for instance in known),
+        'instances': {instance.name: instance.health() for instance in instances},
+        'stale_age': stale_age
+    }
+
+class TemperatureSensor:
+    """Null temperature backend, used when no sensor is available"""
+    name = "none"
+
+    def read(self):
+        """Temperature in degrees Celsius, or None if unavailable"""
+        return None
+
+    def close(self):
+        pass
+
+class SysfsTemperatureSensor(TemperatureSensor):
+    """Millidegree sysfs attribute read through a reused file descriptor"""
+
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
+        self.fd = os.open(path, os.O_RDONLY)
+
+    def read(self):
+        return int(os.pread(self.fd, 32, 0)) / 1000.0
+
+    def close(self):
+        os.close(self.fd)
+
+class VcgencmdTemperatureSensor(TemperatureSensor):
+    """Firmware query via vcgencmd; forks a process per read, last resort only"""
+    name = "vcgencmd"
+
+    def read(self):
+        output = subprocess.check_output(['vcgencmd', 'measure_temp'], timeout=2)
+        return float(output.decode().strip().split('=')[1].split("'")[0])
+
+def _thermal_zone_candidates(sysfs_root):
+    """Thermal zone temp files, CPU/SoC zones first"""
+    zones = sorted(glob.glob(os.path.join(sysfs_root, "class/thermal/thermal_zone*")))
+    preferred, others = [], []
+    for zone in zones:
+        try:
+            with open(os.path.join(zone, "type")) as f:
+                zone_type = f.read().strip()
+        except OSError:
+            zone_type = ""
+        target = preferred if ("cpu" in zone_type or "soc" in zone_type) else others
+        target.append((os.path.join(zone, "temp"), f"thermal:{os.path.basename(zone)}"))
+    return preferred + others
+
+def _hwmon_candidates(sysfs_root):
+    """hwmon temperature inputs"""
+    paths = sorted(glob.glob(os.path.join(sysfs_root, "class/hwmon/hwmon*/temp*_input")))
+    return [(path, f"hwmon:{os.path.basename(os.path.dirname(path))}") for path in paths]
+
+def detect_temperature_sensor(backend="auto", sysfs_root="/sys"):
+    """Pick the cheapest working temperature backend once at startup"""
+    candidates = []
+    if backend in ("auto", "thermal"):
+        candidates += [(SysfsTemperatureSensor, path, name)
+                       for path, name in _thermal_zone_candidates(sysfs_root)]
+    if backend in ("auto", "hwmon"):
+        candidates += [(SysfsTemperatureSensor, path, name)
+                       for path, name in _hwmon_candidates(sysfs_root)]
+    if backend in ("auto", "vcgencmd") and shutil.which("vcgencmd"):
+        candidates.append((VcgencmdTemperatureSensor, None, None))
+
+    for sensor_class, path, name in candidates:
+        try:
+            sensor = sensor_class(path, name) if path else sensor_class()
+            sensor.read()
+            print(f"Temperature sensor: {sensor.name}")
+            return sensor
+        except Exception as e:
+            print(f"Temperature backend {name or sensor_class.name} unusable: {e}")
+
+    if backend != "none":
+        print(f"No temperature sensor available (backend '{backend}'), "
+              f"temperature monitoring disabled")
+    return TemperatureSensor()
+
+class SystemSampler:
+    """CPU/memory/disk sampler backed by /proc
+
+    sample() is called by the scheduler's 'system' collector on its own
+    worker thread, so there is no sampling thread here.
+    """
+
+    def __init__(self, window=10, disk_interval=30,
+                 proc_root="/proc", disk_path="/", temperature_sensor=None):
+        self.temperature_sensor = temperature_sensor or TemperatureSensor()
+        self.disk_interval = disk_interval
+        self.disk_path = disk_path
+
+        # Keep the procfs files open and rewind them on every sample
+        try:
+            self.stat_file = open(os.path.join(proc_root, "stat"), "rb")
+            self.meminfo_file = open(os.path.join(proc_root, "meminfo"), "rb")
+            self.use_proc = True
+        except OSError as e:
+            print(f"/proc not readable ({e}), falling back to psutil")
+            import psutil
+            self.psutil = psutil
+            self.stat_file = self.meminfo_file = None
+            self.use_proc = False
+
+        # Rolling windows with running sums so averages cost O(1) per sample
+        self.history = {'cpu_percent': deque(maxlen=window),
+                        'memory_percent': deque(maxlen=window)}
+        self.sums = {name: 0.0 for name in self.history}
+
+        self.disk_percent = 0.0
+        self.disk_checked = 0.0
+        self.snapshot = None
+
+        # Baseline so the first sample already has a CPU delta to work from
+        self.prev_cpu = self._read_cpu_times()
+
+    def _read_cpu_times(self):
+        """Return (idle, total) jiffies from the aggregate cpu line"""
+        if not self.use_proc:
+            self.psutil.cpu_percent(interval=None)
+            return None
+        self.stat_file.seek(0)
+        fields = [int(value) for value in self.stat_file.readline().split()[1:9]]
+        # idle + iowait; guest time is already counted in user/nice
+        idle = fields[3] + (fields[4] if len(fields) > 4 else 0)
+        return idle, sum(fields)
+
+    def _read_cpu_percent(self):
+        """CPU busy percentage since the previous sample"""
+        if not self.use_proc:
+            return self.psutil.cpu_percent(interval=None)
+        current = self._read_cpu_times()
+        idle_delta = current[0] - self.prev_cpu[0]
+        total_delta = current[1] - self.prev_cpu[1]
+        self.prev_cpu = current
+        if total_delta <= 0:
+            return self.snapshot['cpu_percent'] if self.snapshot else 0.0
+        return 100.0 * (total_delta - idle_delta) / total_delta
+
+    def _read_memory_percent(self):
+        """Memory in use as a percentage, computed like psutil"""
+        if not self.use_proc:
+            return self.psutil.virtual_memory().percent
+        self.meminfo_file.seek(0)
+        meminfo = {}
+        for line in self.meminfo_file.read().splitlines():
+            key, _, rest = line.partition(b":")
+            meminfo[key] = int(rest.split()[0])
+        total = meminfo[b"MemTotal"]
+        available = meminfo.get(b"MemAvailable")
+        if available is None:
+            available = (meminfo.get(b"MemFree", 0) + meminfo.get(b"Buffers", 0)
+                         + meminfo.get(b"Cached", 0))
+        return 100.0 * (total - available) / total
+
+    def _read_disk_percent(self):
+        """Disk usage changes slowly, so statvfs only runs every disk_interval"""
+        now = time.monotonic()
+        if self.disk_checked and now - self.disk_checked < self.disk_interval:
+            return self.disk_percent
+        self.disk_checked = now
+        stat = os.statvfs(self.disk_path)
+        if stat.f_blocks:
+            self.disk_percent = 100.0 * (stat.f_blocks - stat.f_bfree) / stat.f_blocks
+        return self.disk_percent
+
+    def _read_temperature(self):
+        """Temperature from the detected sensor, None when unavailable"""
+        try:
+            return self.temperature_sensor.read()
+        except Exception as e:
+            print(f"Error reading temperature ({self.temperature_sensor.name}): {e}")
+            return None
+
+    def _push(self, name, value):
+        """Add a value to its rolling window and return the window average"""
+        window = self.history[name]
+        if len(window) == window.maxlen:
+            self.sums[name] -= window[0]
+        window.append(value)
+        self.sums[name] += value
+        return self.sums[name] / len(window)
+
+    def sample(self):
+        """Take one sample; CPU is the busy share since the previous call"""
+        cpu_percent = self._read_cpu_percent()
+        memory_percent = self._read_memory_percent()
+        snapshot = {
+            'cpu_percent': cpu_percent,
+            'memory_percent': memory_percent,
+            'disk_percent': self._read_disk_percent(),
+            'temperature': self._read_temperature(),
+            'cpu_avg': self._push('cpu_percent', cpu_percent),
+            'memory_avg': self._push('memory_percent', memory_percent),
+            'timestamp': time.time()
+        }
+        self.snapshot = snapshot
+        return snapshot
+
+    def close(self):
+        """Close procfs handles and the temperature sensor"""
+        for handle in (self.stat_file, self.meminfo_file):
+            if handle is not None:
+                handle.close()
+        self.temperature_sensor.close()
+
+class CounterRing:
+    """Array-backed ring of timestamped counter samples with windowed rates"""
+
+    def __init__(self, capacity=512, windows=(60,)):
+        self.capacity = capacity
+        self.times = array('d', bytes(8 * capacity))
+        self.totals = array('d', bytes(8 * capacity))
+        self.count = 0
+        self.offset = 0
+        self.last_raw = None
+        # Per window, sequence number of the newest sample at or before
+        # (now - window); only ever moves forward, so O(1) amortised
+        self.window_starts = {window: 0 for window in windows}
+
+    def add(self, timestamp, raw):
+        """Record a cumulative counter reading"""
+        if self.last_raw is not None and raw < self.last_raw:
+            if raw < self.last_raw / 2:
+                # Midnight reset: everything since the reset is new traffic
+                self.offset += self.last_raw
+            else:
+                # Older traffic aged out of a rolling counter; nothing new
+                self.offset += self.last_raw - raw
+        self.last_raw = raw
+
+        slot = self.count % self.capacity
+        self.times[slot] = timestamp
+        self.totals[slot] = self.offset + raw
+        self.count += 1
+
+        oldest = max(0, self.count - self.capacity)
+        for window, start in self.window_starts.items():
+            start = max(start, oldest)
+            cutoff = timestamp - window
+            while start + 1 < self.count and self.times[(start + 1) % self.capacity] <= cutoff:
+                start += 1
+            self.window_starts[window] = start
+
+    def rate(self, window, per=60.0):
+        """Increase per `per` seconds over the window, None until two samples exist"""
+        start = self.window_starts[window]
+        newest = self.count - 1
+        if newest <= start:
+            return None
+        elapsed = self.times[newest % self.capacity] - self.times[start % self.capacity]
+        if elapsed <= 0:
+            return None
+        increase = self.totals[newest % self.capacity] - self.totals[start % self.capacity]
+        return increase / elapsed * per
+
+class MetricHistory:
+    """Fixed-size ring of metric snapshots in a memory-mapped file
+
+    The writer maps the file copy-on-write, so an append is a
+    struct.pack_into into private memory and the file is untouched; a
+    shared mapping would be written back by the kernel within about 30 s
+    of every append, msync or not. Every flush_interval seconds the new
+    records and then the header are pwrite()n to the file in one batch,
+    so the SD card sees one write per interval instead of one per sample.
+    Readers see the file as of the last flush, and a crash loses at most
+    one interval. After a restart the ring continues where it stopped.
+    """
+
+    MAGIC = b"PHPGHIS1"
+    # magic, record size, capacity, records written so far
+    HEADER = struct.Struct("<8sHxxIQ")
+    HEADER_SIZE = 32
+    # timestamp, cpu, memory, disk, temperature, queries/min, blocked/min,
+    # queries today, blocked today, status
+    RECORD = struct.Struct("<d6f2IB7x")
+    FIELDS = ('timestamp', 'cpu_percent', 'memory_percent', 'disk_percent', 'temperature',
+              'queries_per_minute', 'blocked_per_minute', 'queries_today', 'blocked_today', 'status')
+    STATUS_CODES = {'enabled': 1, 'disabled': 2, 'error': 3}
+    STATUS_NAMES = {0: None, 1: 'enabled', 2: 'disabled', 3: 'error'}
+
+    def __init__(self, path, capacity=8640, flush_interval=60, readonly=False, clock=time.monotonic):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self.readonly = readonly
+        self.last_flush = clock()
+        self.flushes = 0
+        self.bytes_written = 0
+
+        if readonly:
+            self.file = open(path, "rb")
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, record_size, self.capacity, self.head = self.HEADER.unpack_from(self.map)
+            if magic != self.MAGIC or record_size != self.RECORD.size:
+                raise ValueError(f"{path} is not a metric history file")
+            return
+
+        self.capacity = capacity
+        size = self.HEADER_SIZE + capacity * self.RECORD.size
+        self.file = open(path, "r+b" if os.path.exists(path) else "w+b")
+        existing = os.fstat(self.file.fileno()).st_size
+        if existing == size:
+            self.map = mmap.mmap(self.file.fileno(), size, access=mmap.ACCESS_COPY)
+            magic, record_size, stored_capacity, self.head = self.HEADER.unpack_from(self.map)
+            if (magic, record_size, stored_capacity) == (self.MAGIC, self.RECORD.size, capacity):
+                self.flushed_head = self.head
+                return
+            self.map.close()
+        # New file, or the layout/capacity changed: start an empty ring
+        self.file.truncate(0)
+        self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size, access=mmap.ACCESS_COPY)
+        self.head = 0
+        self.flushed_head = 0
+        self.HEADER.pack_into(self.map, 0, self.MAGIC, self.RECORD.size, capacity, 0)
+        self._write(0, self.HEADER_SIZE)
+
+    def append(self, timestamp, system, pihole, rate):
+        """Store one snapshot; any part may be None when not collected yet"""
+        system = system or {}
+        pihole = pihole or {}
+        queries_per_minute, blocked_per_minute = rate or (float('nan'), float('nan'))
+        temperature = system.get('temperature')
+        offset = self.HEADER_SIZE + (self.head % self.capacity) * self.RECORD.size
+        self.RECORD.pack_into(
+            self.map, offset, timestamp,
+            system.get('cpu_percent', float('nan')), system.get('memory_percent', float('nan')),
+            system.get('disk_percent', float('nan')),
+            float('nan') if temperature is None else temperature,
+            queries_per_minute, blocked_per_minute,
+            min(pihole.get('queries_today', 0), 0xFFFFFFFF), min(pihole.get('blocked_today', 0), 0xFFFFFFFF),
+            self.STATUS_CODES.get(pihole.get('status'), 0))
+        # The count goes in after the record so a reader never sees a
+        # half-written slot as valid
+        self.head += 1
+        struct.pack_into("<Q", self.map, 16, self.head)
+
+        now = self.clock()
+        if now - self.last_flush >= self.flush_interval:
+            self.flush(now)
+
+    def _write(self, offset, length):
+        """Copy one range of the private mapping to the file"""
+        self.bytes_written += os.pwrite(self.file.fileno(), self.map[offset:offset + length], offset)
+
+    def flush(self, now=None):
+        """Write the records appended since the last flush, then the header"""
+        self.last_flush = self.clock() if now is None else now
+        if self.head == self.flushed_head:
+            return
+        # At most two contiguous runs of slots: up to the end of the ring
+        # and from its start
+        first = max(self.flushed_head, self.head - self.capacity)
+        while first < self.head:
+            slot = first % self.capacity
+            count = min(self.head - first, self.capacity - slot)
+            self._write(self.HEADER_SIZE + slot * self.RECORD.size, count * self.RECORD.size)
+            first += count
+        # The count goes last so a reader never sees an unwritten slot as valid
+        self._write(0, self.HEADER_SIZE)
+        self.flushed_head = self.head
+        self.flushes += 1
+
+    def __len__(self):
+        return min(self.head, self.capacity)
+
+    def records(self):
+        """Stored snapshots as dicts, oldest first"""
+        for sequence in range(self.head - len(self), self.head):
+            offset = self.HEADER_SIZE + (sequence % self.capacity) * self.RECORD.size
+            record = dict(zip(self.FIELDS, self.RECORD.unpack_from(self.map, offset)))
+            for key in ('cpu_percent', 'memory_percent', 'disk_percent', 'temperature',
+                        'queries_per_minute', 'blocked_per_minute'):
+                if record[key] != record[key]:
+                    record[key] = None
+            record['status'] = self.STATUS_NAMES.get(record['status'])
+            yield record
+
+    def close(self):
+        if not self.readonly:
+            self.flush()
+        self.map.close()
+        self.file.close()
+
+def downsample(records, bucket):
+    """Average records into bucket-second slots; status is the last one seen"""
+    slots = []
+    for record in records:
+        slot = int(record['timestamp'] // bucket)
+        if not slots or slots[-1][0] != slot:
+            slots.append((slot, []))
+        slots[-1][1].append(record)
+    for slot, members in slots:
+        last = members[-1]
+        merged = {'timestamp': slot * bucket, 'samples': len(members), 'status': last['status'],
+                  'queries_today': last['queries_today'], 'blocked_today': last['blocked_today']}
+        for key in MetricHistory.FIELDS[1:7]:
+            values = [member[key] for member in members if member[key] is not None]
+            merged[key] = sum(values) / len(values) if values else None
+        yield merged
+
+class EWMAStats:
+    """Exponentially weighted mean and variance, O(1) per sample"""
+
+    __slots__ = ('alpha', 'mean', 'var', 'count')
+
+    def __init__(self, alpha):
+        self.alpha = alpha
+        self.mean = 0.0
+        self.var = 0.0
+        self.count = 0
+
+    def update(self, value):
+        if self.count == 0:
+            self.mean = value
+        else:
+            diff = value - self.mean
+            increment = self.alpha * diff
+            self.mean += increment
+            self.var = (1 - self.alpha) * (self.var + diff * increment)
+        self.count += 1
+
+    def zscore(self, value, min_std):
+        """Distance from the mean in standard deviations, std floored at min_std"""
+        return (value - self.mean) / max(math.sqrt(self.var), min_std)
+
+    def seed(self, mean, var, count):
+        self.mean, self.var, self.count = mean, var, count
+
+def ewma_seed(values, alpha):
+    """(mean, var) an EWMAStats would hold after `values`, computed in one pass
+
+    Uses numpy when it is installed: the weights alpha * (1 - alpha)^age are
+    applied to the whole array at once, with the oldest sample carrying the
+    remaining weight just like the recurrence's first value does.
+    """
+    n = len(values)
+    try:
+        import numpy
+    except ImportError:
+        stats = EWMAStats(alpha)
+        for value in values:
+            stats.update(value)
+        return stats.mean, stats.var
+    x = numpy.asarray(values, dtype=float)
+    weights = alpha * (1 - alpha) ** numpy.arange(n - 1, -1, -1, dtype=float)
+    weights[0] = (1 - alpha) ** (n - 1)
+    mean = float(numpy.dot(weights, x))
+    var = float(numpy.dot(weights, (x - mean) ** 2))
+    return mean, var
+
+class MetricBaseline:
+    """Level, step-change and time-of-day baselines for one metric
+
+    The level baseline catches values far from recent behaviour, the change
+    baseline catches sudden jumps, and one EWMA per slot of the day (hour by
+    default) learns that e.g. evenings are busy. Scores come from the slot
+    baseline once it has seen enough samples, otherwise from the level.
+    """
+
+    def __init__(self, alpha, seasonal_alpha, slots, warmup, min_std):
+        self.level = EWMAStats(alpha)
+        self.change = EWMAStats(alpha)
+        self.seasons = [EWMAStats(seasonal_alpha) for _ in range(slots)]
+        self.warmup = warmup
+        self.min_std = min_std
+        self.previous = None
+
+    def observe(self, value, slot):
+        """Score value against the baselines, then learn it; returns (z, change z)"""
+        season = self.seasons[slot]
+        reference = season if season.count >= self.warmup else self.level
+        z = reference.zscore(value, self.min_std) if self.level.count >= self.warmup else 0.0
+        change_z = 0.0
+        if self.previous is not None:
+            delta = value - self.previous
+            if self.change.count >= self.warmup:
+                change_z = self.change.zscore(delta, self.min_std)
+            self.change.update(delta)
+        self.level.update(value)
+        season.update(value)
+        self.previous = value
+        return z, change_z
+
+    def high_water(self, z_threshold):
+        """Value at which the level baseline would call an anomaly"""
+        if self.level.count < self.warmup:
+            return None
+        return self.level.mean + z_threshold * max(math.sqrt(self.level.var), self.min_std)
+
+class AnomalyDetector:
+    """Streaming anomaly scores for a fixed set of metrics"""
+
+    def __init__(self, metrics, alpha=0.05, seasonal_alpha=0.1, season_slots=24,
+                 warmup=30, z_threshold=4.0, min_std=1.0):
+        self.alpha = alpha
+        self.seasonal_alpha = seasonal_alpha
+        self.season_slots = season_slots
+        self.z_threshold = z_threshold
+        self.baselines = {name: MetricBaseline(alpha, seasonal_alpha, season_slots, warmup, min_std)
+                          for name in metrics}
+        # metric -> signed score of the current anomaly
+        self.active = {}
+        self.utc_offset = time.localtime().tm_gmtoff
+
+    def slot(self, timestamp):
+        """Time-of-day slot in local time"""
+        return int((timestamp + self.utc_offset) % 86400 * self.season_slots // 86400)
+
+    def observe(self, name, value, timestamp):
+        """Feed one sample; returns its score when it is anomalous, else None"""
+        baseline = self.baselines.get(name)
+        if baseline is None or value is None:
+            return None
+        z, change_z = baseline.observe(value, self.slot(timestamp))
+        score = z if abs(z) >= abs(change_z) else change_z
+        if abs(score) >= self.z_threshold:
+            self.active[name] = score
+            return score
+        self.active.pop(name, None)
+        return None
+
+    def high_water(self, name):
+        baseline = self.baselines.get(name)
+        return baseline.high_water(self.z_threshold) if baseline else None
+
+    def backfill(self, records):
+        """Seed every baseline from stored history (MetricHistory.records())"""
+        series = {name: ([], []) for name in self.baselines}
+        for record in records:
+            for name, (timestamps, values) in series.items():
+                value = record.get(name)
+                if value is not None:
+                    timestamps.append(record['timestamp'])
+                    values.append(value)
+        for name, (timestamps, values) in series.items():
+            if not values:
+                continue
+            baseline = self.baselines[name]
+            baseline.level.seed(*ewma_seed(values, self.alpha), len(values))
+            deltas = [b - a for a, b in zip(values, values[1:])]
+            if deltas:
+                baseline.change.seed(*ewma_seed(deltas, self.alpha), len(deltas))
+            by_slot = {}
+            for timestamp, value in zip(timestamps, values):
+                by_slot.setdefault(self.slot(timestamp), []).append(value)
+            for slot, slot_values in by_slot.items():
+                baseline.seasons[slot].seed(*ewma_seed(slot_values, self.seasonal_alpha),
+                                            len(slot_values))
+            baseline.previous = values[-1]
+        return sum(len(values) for _, values in series.values())
+
+# PiGlow colour order along each arm; LED index = arm * 6 + colour position
+LED_COLORS = ['red', 'orange', 'yellow', 'green', 'blue', 'white']
+LED_COUNT = 18
+
+class FrameRenderer:
+    """18-LED framebuffer that pushes only changed LEDs to the PiGlow"""
+
+    def __init__(self, piglow):
+        self.piglow = piglow
+        self.frame = bytearray(LED_COUNT)
+        # Hardware state is unknown until the first flush writes every LED
+        self.sent = None
+        self.frames = 0
+        self.led_writes = 0
+        # Drivers exposing set()/show() take the whole frame in one bulk write
+        self.bulk = callable(getattr(piglow, 'set', None)) and callable(getattr(piglow, 'show', None))
+
+    @staticmethod
+    def index(arm, color):
+        """Framebuffer index of one colour on one arm"""
+        return arm * 6 + LED_COLORS.index(color)
+
+    def set(self, arm, color, value):
+        """Set one LED"""
+        self.frame[self.index(arm, color)] = max(0, min(255, int(value)))
+
+    def set_led(self, index, value):
+        """Set one LED by framebuffer index"""
+        self.frame[index] = max(0, min(255, int(value)))
+
+    def set_color(self, color, value):
+        """Set one colour on every arm"""
+        for arm in range(3):
+            self.set(arm, color, value)
+
+    def fill_arm(self, arm, value):
+        """Set every LED on one arm"""
+        value = max(0, min(255, int(value)))
+        self.frame[arm * 6:arm * 6 + 6] = bytes([value]) * 6
+
+    def clear_arm(self, arm):
+        """Turn one arm off"""
+        self.fill_arm(arm, 0)
+
+    def fill(self, value):
+        """Set all 18 LEDs"""
+        value = max(0, min(255, int(value)))
+        self.frame[:] = bytes([value]) * LED_COUNT
+
+    def clear(self):
+        """Turn every LED off"""
+        self.fill(0)
+
+    def flush(self):
+        """Send the LEDs that differ from the last frame sent, return how many"""
+        if self.sent is None:
+            changed = list(range(LED_COUNT))
+        else:
+            changed = [i for i in range(LED_COUNT) if self.frame[i] != self.sent[i]]
+        if not changed:
+            return 0
+
+        if self.bulk:
+            self.piglow.set(0, list(self.frame))
+            self.piglow.show()
+        else:
+            for i in changed:
+                self.piglow.led(i, self.frame[i])
+
+        self.sent = bytes(self.frame)
+        self.frames += 1
+        self.led_writes += len(changed)
+        return len(changed)
+
+# Built-in clips. Each step is one frame: "leds" names what is lit (a target
+# or list of targets at "value", or a {target: value} dict), "hold" is how
+# long the frame stays up. Targets: "all", a colour, "arm0".."arm2", the
+# configured arms "status"/"health"/"network", "<arm>:<colour>" or an LED
+# index; colours may also be keys of the "colors" config block. "mask"
+# limits which LEDs the clip draws over the live display.
+ANIMATIONS = {
+    "startup": {
+        "steps": [{"leds": color, "value": 100, "hold": 0.2} for color in LED_COLORS]
+                 + [{"leds": f"arm{arm}", "value": 100, "hold": 0.2} for arm in range(3)]
+    },
+    "alert": {
+        "steps": [{"leds": "all", "value": 100, "hold": 0.2}, {"hold": 0.2}] * 5
+    },
+    "error_flash": {
+        "loop": True,
+        "mask": "status",
+        "steps": [{"leds": "status:pihole_error", "value": 100, "hold": 0.3}, {"hold": 0.3}]
+    },
+    "anomaly_network": {
+        "mask": "network",
+        "steps": [{"leds": "network", "value": 100, "hold": 0.15}, {"hold": 0.15}] * 4
+    },
+    "anomaly_health": {
+        "mask": "health",
+        "steps": [{"leds": "health", "value": 100, "hold": 0.15}, {"hold": 0.15}] * 4
+    },
+    "test_pattern": {
+        "steps": [{"leds": index, "value": 100, "hold": 0.1} for index in range(LED_COUNT)]
+                 + [{"leds": "all", "value": 100, "hold": 1.0}]
+    },
+    "dominant_client": {
+        "loop": True,
+        "mask": "network:dominant_client",
+        "steps": [{"leds": "network:dominant_client", "value": 100, "hold": 0.5},
+                  {"leds": "network:dominant_client", "value": 30, "hold": 0.5}]
+    }
+}
+
+def _resolve_arm(name, config):
+    arms = {"status": config["led_mapping"]["pihole_status_arm"],
+            "health": config["led_mapping"]["system_health_arm"],
+            "network": config["led_mapping"]["network_activity_arm"]}
+    if name in arms:
+        return arms[name]
+    if name in ("arm0", "arm1", "arm2"):
+        return int(name[3])
+    raise ValueError(f"unknown arm {name!r}")
+
+def _resolve_color(name, config):
+    color = config["colors"].get(name, name)
+    if color not in LED_COLORS:
+        raise ValueError(f"unknown colour {name!r}")
+    return color
+
+def clip_targets(target, config):
+    """Framebuffer indices named by a clip target (see ANIMATIONS)"""
+    if isinstance(target, list):
+        return sorted({index for item in target for index in clip_targets(item, config)})
+    if isinstance(target, int):
+        if not 0 <= target < LED_COUNT:
+            raise ValueError(f"LED index {target} out of range")
+        return [target]
+    if target == "all":
+        return list(range(LED_COUNT))
+    arm_name, _, color_name = target.partition(":")
+    if color_name:
+        return [FrameRenderer.index(_resolve_arm(arm_name, config),
+                                    _resolve_color(color_name, config))]
+    if target in LED_COLORS or target in config["colors"]:
+        color = _resolve_color(target, config)
+        return [FrameRenderer.index(arm, color) for arm in range(3)]
+    arm = _resolve_arm(target, config)
+    return list(range(arm * 6, arm * 6 + 6))
+
+class AnimationClip:
+    """A compiled clip: 18 bytes per frame back to back, plus frame end times"""
+
+    def __init__(self, name, frames, ends, loop=False, mask=None):
+        self.name = name
+        self.frames = frames
+        self.ends = ends
+        self.duration = ends[-1]
+        self.loop = loop
+        # LEDs the clip draws; None means the whole board
+        self.mask = mask
+
+    def frame_at(self, elapsed):
+        """The frame showing `elapsed` seconds in, None once a one-shot clip ends"""
+        if self.loop:
+            elapsed %= self.duration
+        elif elapsed >= self.duration:
+            return None
+        index = min(bisect_right(self.ends, elapsed), len(self.ends) - 1)
+        return self.frames[index * LED_COUNT:(index + 1) * LED_COUNT]
+
+def compile_clip(name, spec, config, lut):
+    """Turn a declarative clip spec into an AnimationClip, values through lut"""
+    frames = bytearray()
+    ends = []
+    elapsed = 0.0
+    for step in spec["steps"]:
+        frame = bytearray(LED_COUNT)
+        leds = step.get("leds", [])
+        if isinstance(leds, dict):
+            assignments = leds.items()
+        else:
+            assignments = [(leds, step.get("value", 100))] if leds != [] else []
+        for target, value in assignments:
+            pwm = lut[max(0, min(100, int(value)))]
+            for index in clip_targets(target, config):
+                frame[index] = pwm
+        hold = float(step.get("hold", 0))
+        if hold < 0:
+            raise ValueError(f"negative hold in clip {name!r}")
+        elapsed += hold
+        frames += frame
+        ends.append(elapsed)
+    if not ends or elapsed <= 0:
+        raise ValueError(f"clip {name!r} needs at least one step with a hold > 0")
+    mask = tuple(clip_targets(spec["mask"], config)) if "mask" in spec else None
+    return AnimationClip(name, bytes(frames), tuple(ends), bool(spec.get("loop", False)), mask)
+
+class AnimationPlayer:
+    """Plays clips over the live frame, one clip per named layer
+
+    The frame shown is picked from the time since the clip started, so a
+    late render tick never stretches the animation. Playing on a busy
+    layer interrupts what was there; higher priorities draw on top.
+    """
+
+    def __init__(self, renderer):
+        self.renderer = renderer
+        # layer -> (priority, clip, start time)
+        self.layers = {}
+
+    def play(self, layer, clip, now, priority=0):
+        """Start clip on layer, replacing whatever that layer was playing"""
+        self.layers[layer] = (priority, clip, now)
+
+    def ensure(self, layer, clip, now, priority=0):
+        """Start clip unless the layer is already playing a clip of that name"""
+        current = self.layers.get(layer)
+        if current is None or current[1].name != clip.name:
+            self.play(layer, clip, now, priority)
+
+    def stop(self, layer):
+        """Interrupt a layer; the live display shows through on the next frame"""
+        self.layers.pop(layer, None)
+
+    def playing(self, layer):
+        return layer in self.layers
+
+    def apply(self, now):
+        """Draw every running clip into the framebuffer, dropping finished ones"""
+        frame_buffer = self.renderer.frame
+        for layer, (priority, clip, start) in sorted(self.layers.items(), key=lambda item: item[1][0]):
+            frame = clip.frame_at(now - start)
+            if frame is None:
+                del self.layers[layer]
+            elif clip.mask is None:
+                frame_buffer[:] = frame
+            else:
+                for index in clip.mask:
+                    frame_buffer[index] = frame[index]
+
+def config_relative(config_file, path):
+    """path as given if absolute (or empty), else relative to config_file's directory"""
+    if not path or os.path.isabs(path):
+        return path
+    return os.path.join(os.path.dirname(os.path.abspath(config_file)), path)
+
+def deep_merge(defaults, overrides):
+    """Copy of defaults with overrides applied recursively, block by block"""
+    merged = dict(defaults)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = deep_merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def config_problems(config):
+    """(key path, message) for every display setting that can't be used"""
+    problems = []
+    for key, color in config["colors"].items():
+        if color not in LED_COLORS:
+            problems.append((("colors", key), f"colors.{key}: unknown colour {color!r}"))
+    arms = list(config["led_mapping"].values())
+    for key, arm in config["led_mapping"].items():
+        if arm not in (0, 1, 2):
+            problems.append((("led_mapping", key), f"led_mapping.{key}: arm must be 0, 1 or 2, not {arm!r}"))
+    if len(set(map(repr, arms))) != len(arms):
+        problems.append((("led_mapping",), "led_mapping: each metric needs its own arm"))
+    if not _is_number(config["brightness_scale"]) or config["brightness_scale"] < 0:
+        problems.append((("brightness_scale",), "brightness_scale must be a number >= 0"))
+    if not _is_number(config["gamma"]) or config["gamma"] <= 0:
+        problems.append((("gamma",), "gamma must be a number > 0"))
+    for key in ("high_queries_per_minute", "dns_p95_ms"):
+        value = config["thresholds"][key]
+        if not _is_number(value) or value <= 0:
+            problems.append((("thresholds", key), f"thresholds.{key} must be a number > 0"))
+    warning, critical = config["temperature_warning"], config["temperature_critical"]
+    if not _is_number(warning) or not _is_number(critical):
+        problems.append((("temperature_warning",), "temperature_warning must be a number"))
+        problems.append((("temperature_critical",), "temperature_critical must be a number"))
+    elif warning > critical:
+        problems.append((("temperature_warning",), "temperature_warning must not exceed temperature_critical"))
+        problems.append((("temperature_critical",), "temperature_critical must not be below temperature_warning"))
+    for name, spec in config["animations"].items():
+        try:
+            compile_clip(name, spec, config, bytes(101))
+        except (KeyError, TypeError, ValueError) as e:
+            problems.append((("animations", name), f"animations.{name}: {e}"))
+    return problems
+
+def validate_config(config):
+    """Raise ValueError listing every display setting that can't be used"""
+    problems = config_problems(config)
+    if problems:
+        raise ValueError("; ".join(message for _, message in problems))
+
+def reset_config_key(config, defaults, path):
+    """Put the default back at path, or drop the key if it has no default"""
+    for key in path[:-1]:
+        config = config[key]
+        defaults = defaults[key]
+    if path[-1] in defaults:
+        config[path[-1]] = defaults[path[-1]]
+    else:
+        config.pop(path[-1], None)
+
+class RenderPlan:
+    """Display settings compiled once per config load and read-only afterwards
+
+    The display methods index LEDs and look up PWM values here instead of
+    walking the config dicts and rescaling on every frame. A reload builds a
+    new plan and swaps it in with one assignment.
+    """
+
+    def __init__(self, config):
+        mapping = config["led_mapping"]
+        colors = config["colors"]
+        features = config["features"]
+
+        self.status_arm = mapping["pihole_status_arm"]
+        self.health_arm = mapping["system_health_arm"]
+        self.network_arm = mapping["network_activity_arm"]
+
+        index = FrameRenderer.index
+        self.status_enabled_led = index(self.status_arm, colors["pihole_enabled"])
+        self.status_disabled_led = index(self.status_arm, colors["pihole_disabled"])
+        self.status_error_led = index(self.status_arm, colors["pihole_error"])
+        self.cpu_led = index(self.health_arm, colors["cpu_usage"])
+        self.memory_led = index(self.health_arm, colors["memory_usage"])
+        self.temperature_warning_led = index(self.health_arm, colors["temperature_warning"])
+        self.temperature_critical_led = index(self.health_arm, colors["temperature_critical"])
+        self.queries_led = index(self.network_arm, colors["network_queries"])
+        self.blocked_led = index(self.network_arm, colors["blocked_queries"])
+        self.dns_slow_led = index(self.status_arm, colors["dns_slow"])
+
+        # 0-100 intensity -> PWM value with gamma and brightness applied;
+        # gamma 1.0 keeps the historical linear scale
+        gamma = config["gamma"]
+        brightness = config["brightness_scale"]
+        self.lut = bytes(min(255, int(round(100 * (percent / 100) ** gamma) * brightness))
+                         for percent in range(101))
+        # Clips are compiled against the same LUT and arm mapping; a config
+        # entry replaces the built-in clip of the same name
+        specs = dict(ANIMATIONS)
+        specs.update(config["animations"])
+        self.clips = MappingProxyType({name: compile_clip(name, spec, config, self.lut)
+                                       for name, spec in specs.items()})
+
+        self.system_enabled = features["enable_system_monitoring"]
+        self.network_enabled = features["enable_network_monitoring"]
+        self.temperature_enabled = features["enable_temperature_monitoring"]
+        self.alerts_enabled = features["enable_error_alerts"]
+        self.startup_enabled = features["enable_startup_sequence"]
+
+        self.temperature_warning = config["temperature_warning"]
+        self.temperature_critical = config["temperature_critical"]
+        self.high_queries_per_minute = config["thresholds"]["high_queries_per_minute"]
+        self.dns_p95_ms = config["thresholds"]["dns_p95_ms"]
+        self.dns_timeout_rate = config["thresholds"]["dns_timeout_rate"]
+        self.dominant_share = config["top_talkers"]["dominant_share"]
+        self.dominant_min_queries = config["top_talkers"]["min_queries"]
+        self.rate_window = config["query_rate"]["display_window"]
+        self.log_window = config["log_tail"]["display_window"]
+        self.frozen = True
+
+    def __setattr__(self, name, value):
+        if getattr(self, 'frozen', False):
+            raise AttributeError("RenderPlan is read-only, compile a new one")
+        object.__setattr__(self, name, value)
+
+def format_stage_table(stages):
+    """Table of {stage: histogram summary} for the journal and the stats command"""
+    lines = [f"{'stage':<28} {'count':>7} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}"]
+    for stage, stats in stages.items():
+        lines.append(f"{stage:<28} {stats['count']:>7} "
+                     + " ".join(f"{stats[key]:>7.2f}ms"
+                                for key in ('mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms')))
+    return "\n".join(lines)
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram with interpolated percentiles"""
+
+    # Bucket upper bounds in nanoseconds, 10 us to 10 s in 1-2-5 steps
+    BOUNDS_NS = [multiplier * 10 ** exponent
+                 for exponent in range(4, 10) for multiplier in (1, 2, 5)] + [10 ** 10]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS_NS) + 1)
+        self.count = 0
+        self.total_ns = 0
+        self.min_ns = None
+        self.max_ns = 0
+
+    def observe(self, elapsed_ns):
+        """Add one sample"""
+        self.counts[bisect_left(self.BOUNDS_NS, elapsed_ns)] += 1
+        self.count += 1
+        self.total_ns += elapsed_ns
+        if elapsed_ns > self.max_ns:
+            self.max_ns = elapsed_ns
+        if self.min_ns is None or elapsed_ns < self.min_ns:
+            self.min_ns = elapsed_ns
+
+    def percentile(self, fraction):
+        """Estimated percentile in nanoseconds, linear within the bucket"""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                # Observed extremes tighten the outermost buckets
+                lower = max(self.BOUNDS_NS[index - 1] if index else 0, self.min_ns)
+                upper = self.BOUNDS_NS[index] if index < len(self.BOUNDS_NS) else self.max_ns
+                upper = min(upper, self.max_ns)
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return float(self.max_ns)
+
+    def summary(self):
+        """Count, mean and p50/p95/p99/max in milliseconds"""
+        return {
+            'count': self.count,
+            'mean_ms': self.total_ns / self.count / 1e6 if self.count else 0.0,
+            'p50_ms': self.percentile(0.50) / 1e6,
+            'p95_ms': self.percentile(0.95) / 1e6,
+            'p99_ms': self.percentile(0.99) / 1e6,
+            'max_ms': self.max_ns / 1e6
+        }
+
+class Instrumentation:
+    """Per-stage timing hooks; when disabled nothing is wrapped at all"""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.histograms = {}
+        self.started = time.time()
+
+    def histogram(self, stage):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = LatencyHistogram()
+        return histogram
+
+    def record(self, stage, elapsed_ns):
+        self.histogram(stage).observe(elapsed_ns)
+
+    def wrap(self, stage, func):
+        """Timed version of func, or func itself when disabled"""
+        if not self.enabled:
+            return func
+        observe = self.histogram(stage).observe
+        clock = time.perf_counter_ns
+
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(clock() - start)
+        return timed
+
+    def summary(self):
+        """{stage: histogram summary} sorted by stage name, idle stages left out"""
+        return {stage: self.histograms[stage].summary()
+                for stage in sorted(self.histograms) if self.histograms[stage].count}
+
+    def report(self):
+        """Human-readable table of the current summary"""
+        return format_stage_table(self.summary())
+
+class MonitorState:
+    """Latest value from every collector, shared with the animation loop"""
+
+    def __init__(self):
+        self.data = {}
+        self.updated = {}
+        self.version = 0
+
+    def update(self, key, value):
+        """Publish a new value; readers holding the old dict are unaffected"""
+        data = dict(self.data)
+        data[key] = value
+        self.data = data
+        self.updated[key] = time.monotonic()
+        self.version += 1
+
+    def snapshot(self):
+        """Current state; treat as read-only"""
+        return self.data
+
+class Collector:
+    """Blocking data source polled by the scheduler on its own interval
+
+    interval and timeout are numbers, or callables returning the current
+    value for sources that adapt them.
+    """
+
+    def __init__(self, name, func, interval, timeout, on_result=None):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.timeout = timeout
+        self.on_result = on_result
+        # Set by the control socket's refresh to cut the current wait short
+        self.wake = None
+        self.pending = None
+        self.timeouts = 0
+        self.errors = 0
+
+    def current_interval(self):
+        return self.interval() if callable(self.interval) else self.interval
+
+    def current_timeout(self):
+        return self.timeout() if callable(self.timeout) else self.timeout
+
+class MonitorScheduler:
+    """asyncio loop running collectors as tasks and animating at a fixed FPS"""
+
+    def __init__(self, monitor, collectors, fps=10):
+        self.monitor = monitor
+        self.collectors = collectors
+        self.frame_period = 1.0 / fps
+        self.state = monitor.state
+        self.executor = None
+        instrumentation = monitor.instrumentation
+        self.instrumentation = instrumentation if instrumentation.enabled else None
+
+    async def _sleep(self, stage, delay, wake=None):
+        """asyncio.sleep, timed when instrumentation is on; setting wake ends it early"""
+        start = time.perf_counter_ns() if self.instrumentation is not None else None
+        if wake is None:
+            await asyncio.sleep(delay)
+        else:
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(wake.wait(), delay)
+            wake.clear()
+        if start is not None:
+            self.instrumentation.record(stage, time.perf_counter_ns() - start)
+
+    async def _run_collector(self, collector):
+        """Poll one collector forever without ever blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        collector.wake = asyncio.Event()
+        while True:
+            started = loop.time()
+            # A call that outlived its timeout keeps running in its thread;
+            # wait for it instead of stacking another one behind it
+            future = collector.pending or loop.run_in_executor(self.executor, collector.func)
+            timeout = collector.current_timeout()
+            done, _ = await asyncio.wait({future}, timeout=timeout)
+            if done:
+                collector.pending = None
+                try:
+                    value = future.result()
+                except Exception as e:
+                    collector.errors += 1
+                    print(f"Collector {collector.name} failed: {e}")
+                    value = None
+            else:
+                collector.pending = future
+                collector.timeouts += 1
+                print(f"Collector {collector.name} timed out after {timeout}s")
+                value = None
+
+            if self.monitor.recorder is not None:
+                self.monitor.recorder.record(collector.name, value)
+            self.state.update(collector.name, value)
+            if collector.on_result:
+                collector.on_result(value)
+
+            delay = collector.current_interval() - (loop.time() - started)
+            await self._sleep(f"sleep:{collector.name}", max(0.0, delay), collector.wake)
+
+    async def _animate(self):
+        """Render the latest state every frame period, correcting for drift"""
+        loop = asyncio.get_running_loop()
+        next_frame = loop.time()
+        while True:
+            self.monitor.render_frame(self.state.snapshot(), time.monotonic())
+            next_frame += self.frame_period
+            delay = next_frame - loop.time()
+            if delay < 0:
+                # Fell behind; drop the missed frames rather than bursting
+                next_frame = loop.time()
+                delay = 0
+            await self._sleep("sleep:frame", delay)
+
+    async def run(self):
+        """Run collectors and animation until cancelled or SIGTERM"""
+        self.executor = ThreadPoolExecutor(max_workers=len(self.collectors) + 1,
+                                           thread_name_prefix="collector")
+        tasks = [asyncio.create_task(self._run_collector(collector))
+                 for collector in self.collectors]
+        tasks.append(asyncio.create_task(self._animate()))
+        control = self.monitor.control
+        if control is not None:
+            try:
+                await control.start()
+                print(f"Control socket listening on {control.path}")
+            except OSError as e:
+                print(f"Control socket disabled: {e}")
+                control = None
+        gathered = asyncio.gather(*tasks)
+        # systemd stops the service with SIGTERM; end the run like Ctrl+C so
+        # the caller's cleanup (LEDs off, logout, history sync) still happens
+        loop = asyncio.get_running_loop()
+        terminated = []
+        def terminate():
+            terminated.append(True)
+            gathered.cancel()
+        handles_sigterm = False
+        if hasattr(signal, 'SIGTERM'):
+            try:
+                loop.add_signal_handler(signal.SIGTERM, terminate)
+                handles_sigterm = True
+            except (NotImplementedError, RuntimeError, ValueError):
+                # No signal handlers outside the main thread or on Windows
+                pass
+        try:
+            await gathered
+        except asyncio.CancelledError:
+            if not terminated:
+                raise
+            print("\nSIGTERM received, shutting down monitor...")
+        finally:
+            if handles_sigterm:
+                loop.remove_signal_handler(signal.SIGTERM)
+            if control is not None:
+                control.stop()
+            for task in tasks:
+                task.cancel()
+            self.executor.shutdown(wait=False)
+
+def _format_labels(labels):
+    """Prometheus label set, escaped"""
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+class MetricsExporter:
+    """Prometheus /metrics endpoint served from the monitor's in-memory state"""
+
+    def __init__(self, monitor, host="0.0.0.0", port=9617):
+        self.monitor = monitor
+        self.host = host
+        self.port = port
+        self.body = b""
+        self.body_key = None
+        self.builds = 0
+        self.scrapes = 0
+        self.lock = threading.Lock()
+        self.server = None
+        self.thread = None
+
+    def _family(self, lines, name, metric_type, help_text, samples):
+        """Append one metric family; samples are (labels, value) pairs"""
+        samples = [(labels, value) for labels, value in samples if value is not None]
+        if not samples:
+            return
+        lines.append(f"# HELP pihole_piglow_{name} {help_text}")
+        lines.append(f"# TYPE pihole_piglow_{name} {metric_type}")
+        for labels, value in samples:
+            lines.append(f"pihole_piglow_{name}{_format_labels(labels)} {float(value):g}")
+
+    def build(self):
+        """Serialize the current state in the Prometheus text format"""
+        monitor = self.monitor
+        state = monitor.state.snapshot()
+        pihole = state.get('pihole')
+        system = state.get('system')
+        lines = []
+
+        instances = monitor.instances
+        self._family(lines, "pihole_up", "gauge", "Whether the last poll of the instance succeeded",
+                     [({'instance': i.name}, 1 if i.healthy else 0) for i in instances])
+        self._family(lines, "pihole_poll_latency_ms", "gauge", "Duration of the last poll",
+                     [({'instance': i.name}, i.latency_ms) for i in instances])
+        self._family(lines, "pihole_poll_failures", "gauge", "Consecutive failed polls",
+                     [({'instance': i.name}, i.failures) for i in instances])
+        self._family(lines, "pihole_polls_total", "counter", "Polls completed",
+                     [({'instance': i.name}, i.polls) for i in instances])
+        self._family(lines, "pihole_circuit_open", "gauge", "Whether the instance circuit breaker is open",
+                     [({'instance': i.name}, 1 if i.controller and i.controller.is_open else 0)
+                      for i in instances])
+
+        if pihole:
+            self._family(lines, "queries_today", "gauge", "DNS queries today (fleet total)",
+                         [({}, pihole['queries_today'])])
+            self._family(lines, "blocked_today", "gauge", "Blocked queries today (fleet total)",
+                         [({}, pihole['blocked_today'])])
+            self._family(lines, "percent_blocked", "gauge", "Share of queries blocked today",
+                         [({}, pihole['percent_blocked'])])
+            self._family(lines, "clients", "gauge", "Unique clients today",
+                         [({}, pihole['clients'])])
+            self._family(lines, "domains_blocked", "gauge", "Domains on the blocklist",
+                         [({}, pihole['domains_blocked'])])
+            self._family(lines, "blocking_enabled", "gauge", "Whether blocking is enabled",
+                         [({}, 1 if pihole['status'] == 'enabled' else 0)])
+            self._family(lines, "data_stale_seconds", "gauge", "Age of the data being shown during an outage",
+                         [({}, pihole.get('stale_age') or 0)])
+
+        rates = state.get('rates') or {}
+        log_rates = state.get('log_rates') or {}
+        self._family(lines, "queries_per_minute", "gauge", "Query rate over the window",
+                     [({'window': f"{window}s", 'source': 'api'}, rate[0]) for window, rate in rates.items()]
+                     + [({'window': f"{window}s", 'source': 'log'}, rate[0]) for window, rate in log_rates.items()])
+        self._family(lines, "blocked_per_minute", "gauge", "Blocked query rate over the window",
+                     [({'window': f"{window}s", 'source': 'api'}, rate[1]) for window, rate in rates.items()]
+                     + [({'window': f"{window}s", 'source': 'log'}, rate[1]) for window, rate in log_rates.items()])
+
+        if system:
+            self._family(lines, "cpu_percent", "gauge", "CPU busy percentage", [({}, system['cpu_percent'])])
+            self._family(lines, "memory_percent", "gauge", "Memory in use", [({}, system['memory_percent'])])
+            self._family(lines, "disk_percent", "gauge", "Root filesystem in use", [({}, system['disk_percent'])])
+            self._family(lines, "temperature_celsius", "gauge", "SoC temperature",
+                         [({}, system['temperature'])])
+
+        api_samples = []
+        for instance in instances:
+            api_stats = instance.source.stats()
+            if 'reuse_rate' in api_stats:
+                api_samples.append((instance.name, api_stats))
+        self._family(lines, "api_connection_reuse_ratio", "gauge", "Share of API requests on a reused connection",
+                     [({'instance': name}, stats['reuse_rate']) for name, stats in api_samples])
+        self._family(lines, "api_endpoint_latency_ms", "gauge", "Average API endpoint latency",
+                     [({'instance': name, 'endpoint': endpoint}, figures['avg_ms'])
+                      for name, stats in api_samples for endpoint, figures in stats['endpoints'].items()])
+
+        collectors = monitor.collectors
+        self._family(lines, "collector_timeouts_total", "counter", "Collector runs that hit their timeout",
+                     [({'collector': c.name}, c.timeouts) for c in collectors])
+        self._family(lines, "collector_errors_total", "counter", "Collector runs that raised",
+                     [({'collector': c.name}, c.errors) for c in collectors])
+
+        stages = state.get('stage_stats') or {}
+        self._family(lines, "stage_latency_ms", "gauge", "Hot-path stage latency percentiles",
+                     [({'stage': stage, 'quantile': quantile}, stats[key])
+                      for stage, stats in stages.items()
+                      for quantile, key in (('0.5', 'p50_ms'), ('0.95', 'p95_ms'), ('0.99', 'p99_ms'))])
+
+        talkers = state.get('top_talkers') or {}
+        self._family(lines, "top_talker_dominant_share", "gauge", "Share of recent traffic from the top client or domain",
+                     [({'kind': kind}, share) for kind, share in (talkers.get('dominant') or {}).items()])
+        self._family(lines, "top_talker_error_bound", "gauge", "Largest possible overcount in the top lists, as a share",
+                     [({'kind': kind}, bound) for kind, bound in (talkers.get('error_bound') or {}).items()])
+        self._family(lines, "top_talker_recent_queries", "gauge", "Decayed query count behind the top lists",
+                     [({}, talkers.get('recent_queries'))])
+        if monitor.config["top_talkers"]["expose_names"]:
+            self._family(lines, "top_talker_queries", "gauge", "Decayed query count of the top clients and domains",
+                         [({'kind': kind, 'name': name}, count)
+                          for kind in ('clients', 'domains', 'blocked_domains')
+                          for name, count, share in talkers.get(kind, [])])
+        dns = state.get('dns_probe') or {}
+        dns_kinds = dns.get('kinds') or {}
+        self._family(lines, "dns_probe_latency_ms", "gauge", "Resolver latency percentiles over the probe window",
+                     [({'kind': kind, 'quantile': quantile}, stats[key])
+                      for kind, stats in dns_kinds.items() if stats['count']
+                      for quantile, key in (('0.5', 'p50_ms'), ('0.95', 'p95_ms'), ('0.99', 'p99_ms'))])
+        self._family(lines, "dns_probe_timeout_ratio", "gauge", "Share of probe queries without an answer",
+                     [({'kind': kind}, stats['timeout_rate']) for kind, stats in dns_kinds.items()])
+        self._family(lines, "dns_probe_blocking_ratio", "gauge", "Share of blocked-name probes answered as blocked",
+                     [({}, dns.get('blocking_rate'))])
+        self._family(lines, "dns_probe_queries_total", "counter", "DNS probe queries sent",
+                     [({}, dns.get('queries'))])
+        anomaly = state.get('anomaly') or {}
+        self._family(lines, "anomaly_score", "gauge", "Signed z-score of metrics currently flagged as anomalous",
+                     [({'metric': name}, score) for name, score in (anomaly.get('active') or {}).items()])
+        self._family(lines, "queries_per_minute_high_water", "gauge", "Learned query rate that counts as anomalous",
+                     [({}, anomaly.get('queries_high'))])
+        self._family(lines, "time_to_first_frame_seconds", "gauge", "Process start to first LED frame",
+                     [({}, monitor.first_frame_ms / 1000 if monitor.first_frame_ms is not None else None)])
+        self._family(lines, "led_frames_total", "counter", "Frames sent to the PiGlow",
+                     [({}, monitor.renderer.frames)])
+        self._family(lines, "led_writes_total", "counter", "LED values written to the PiGlow",
+                     [({}, monitor.renderer.led_writes)])
+        dashboard = monitor.dashboard
+        self._family(lines, "dashboard_clients", "gauge", "Browsers connected to the live dashboard",
+                     [({}, dashboard.clients if dashboard is not None else None)])
+        self._family(lines, "metrics_builds_total", "counter", "Times the /metrics body was rebuilt",
+                     [({}, self.builds + 1)])
+        return ("\n".join(lines) + "\n").encode()
+
+    def current_body(self):
+        """Cached body, rebuilt only when the state or LED output changed"""
+        self.scrapes += 1
+        key = (self.monitor.state.version, self.monitor.renderer.frames)
+        if key != self.body_key:
+            with self.lock:
+                # Concurrent scrapers wait for one rebuild instead of each doing it
+                if key != self.body_key:
+                    self.body = self.build()
+                    self.body_key = key
+                    self.builds += 1
+        return self.body
+
+    def start(self):
+        """Serve /metrics from a daemon thread"""
+        # http.server costs ~20 ms to import; only pay for it when serving
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = exporter.current_body()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True)
+        self.thread.start()
+        print(f"Metrics available at http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+# State keys streamed to the dashboard; everything else stays server-side
+DASHBOARD_KEYS = ('pihole', 'system', 'rates', 'log_rates', 'top_talkers', 'anomaly', 'dns_probe')
+
+class DashboardServer:
+    """Live LED frame and metrics pushed to browsers over Server-Sent Events
+
+    The render loop publishes into one shared backlog of encoded events and
+    never touches a socket: each client thread copies what it has not seen
+    yet and writes it out on its own time. A client that falls further
+    behind than the backlog gets a full snapshot instead of the deltas.
+    """
+
+    def __init__(self, monitor, host="0.0.0.0", port=9618, backlog=256,
+                 metrics_interval=1.0, keepalive=15, page="", talker_names=False):
+        self.monitor = monitor
+        self.host = host
+        self.port = port
+        self.metrics_interval = metrics_interval
+        self.talker_names = talker_names
+        self.keepalive = keepalive
+        self.page_path = page or os.path.join(SCRIPT_DIR, "docs", "index.html")
+        self.page = None
+        self.events = deque(maxlen=backlog)
+        self.seq = 0
+        self.cond = threading.Condition()
+        self.closed = False
+        # What the clients have been told so far, to diff against
+        self.frame = bytes(LED_COUNT)
+        self.metrics = {}
+        self.sources = {}
+        self.state_version = None
+        self.last_metrics = None
+        self.snapshot_cache = (None, b"")
+        self.clients = 0
+        self.published = 0
+        self.resyncs = 0
+        self.server = None
+        self.thread = None
+
+    def _append(self, event, data):
+        """Frame one JSON payload once and hand it to every client"""
+        with self.cond:
+            self.seq += 1
+            self.events.append((self.seq, f"id: {self.seq}\nevent: {event}\ndata: {data}\n\n".encode()))
+            self.published += 1
+            self.cond.notify_all()
+
+    def publish_frame(self, frame):
+        """Queue the LEDs that changed since the last published frame"""
+        if frame is None or frame == self.frame:
+            return
+        previous = self.frame
+        leds = [[i, frame[i]] for i in range(LED_COUNT) if frame[i] != previous[i]]
+        self.frame = bytes(frame)
+        self._append("frame", json.dumps({"leds": leds}, separators=(",", ":")))
+
+    def publish_state(self, state, version, now):
+        """Queue the state keys whose values changed, at most once per metrics_interval"""
+        if version == self.state_version:
+            return
+        if self.last_metrics is not None and now - self.last_metrics < self.metrics_interval:
+            return
+        self.state_version = version
+        self.last_metrics = now
+        changed = {}
+        for key in DASHBOARD_KEYS:
+            value = state.get(key)
+            # Collectors publish a fresh object per sample, so an unchanged
+            # identity skips the encode entirely
+            if key in self.sources and value is self.sources[key]:
+                continue
+            self.sources[key] = value
+            if key == 'top_talkers' and not self.talker_names:
+                value = talker_summary(value)
+            encoded = json.dumps(value, default=str, separators=(",", ":"))
+            if encoded != self.metrics.get(key):
+                self.metrics[key] = encoded
+                changed[key] = encoded
+        if changed:
+            self._append("metrics", "{" + ",".join(f'"{key}":{encoded}' for key, encoded in changed.items()) + "}")
+
+    def _snapshot(self):
+        """Full frame and metrics as one event; call with the condition held"""
+        seq, body = self.snapshot_cache
+        if seq != self.seq:
+            metrics = ",".join(f'"{key}":{encoded}' for key, encoded in self.metrics.items())
+            data = f'{{"frame":{json.dumps(list(self.frame), separators=(",", ":"))},"metrics":{{{metrics}}}}}'
+            body = f"id: {self.seq}\nevent: snapshot\ndata: {data}\n\n".encode()
+            self.snapshot_cache = (self.seq, body)
+        return body
+
+    def pending(self, seq):
+        """Encoded events after seq and the new position (None when closed)"""
+        with self.cond:
+            self.cond.wait_for(lambda: self.seq != seq or self.closed, timeout=self.keepalive)
+            if self.closed:
+                return None, seq
+            if self.seq == seq:
+                return b": keepalive\n\n", seq
+            if not self.events or seq is None or self.events[0][0] > seq + 1 or seq > self.seq:
+                if seq is not None:
+                    self.resyncs += 1
+                return self._snapshot(), self.seq
+            return b"".join(body for event_seq, body in self.events if event_seq > seq), self.seq
+
+    def stream(self, wfile, seq=None):
+        """Write events to one client until it goes away or the server stops"""
+        while True:
+            body, seq = self.pending(seq)
+            if body is None:
+                return
+            wfile.write(body)
+            wfile.flush()
+
+    def load_page(self):
+        try:
+            with open(self.page_path, 'rb') as f:
+                return f.read()
+        except OSError as e:
+            print(f"Dashboard page unavailable: {e}")
+            return None
+
+    def start(self):
+        """Serve the page and the /events stream from a daemon thread"""
+        # Lazy for the same reason as in MetricsExporter.start
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        dashboard = self
+        self.page = self.load_page()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                if path == "/events":
+                    self.send_events()
+                elif path in ("/", "/index.html") and dashboard.page is not None:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/html; charset=utf-8")
+                    self.send_header("Content-Length", str(len(dashboard.page)))
+                    self.end_headers()
+                    self.wfile.write(dashboard.page)
+                else:
+                    self.send_error(404)
+
+            def send_events(self):
+                last_id = self.headers.get("Last-Event-ID")
+                seq = int(last_id) if last_id and last_id.isdigit() else None
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                # A client that stops reading is dropped once its socket
+                # buffer fills, instead of holding the thread forever
+                self.connection.settimeout(dashboard.keepalive * 2)
+                with dashboard.cond:
+                    dashboard.clients += 1
+                try:
+                    dashboard.stream(self.wfile, seq)
+                except OSError:
+                    pass
+                finally:
+                    with dashboard.cond:
+                        dashboard.clients -= 1
+                    self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="dashboard", daemon=True)
+        self.thread.start()
+        print(f"Dashboard available at http://{self.host}:{self.port}/")
+
+    def stop(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+# Runtime display toggles: mode name -> "features" key
+MODES = {
+    "system": "enable_system_monitoring",
+    "network": "enable_network_monitoring",
+    "temperature": "enable_temperature_monitoring",
+    "alerts": "enable_error_alerts"
+}
+
+class ControlServer:
+    """Commands for the running monitor on a Unix socket
+
+    One JSON object per line in each direction: {"command": "stats"} is
+    answered with {"ok": true, "result": ...} or {"ok": false, "error": ...}.
+    Commands run on the event loop, between frames, so they can swap the
+    render plan or start clips without locking.
+    """
+
+    def __init__(self, monitor, path="control.sock"):
+        self.monitor = monitor
+        self.path = path
+        self.server = None
+        self.requests = 0
+        self.commands = {
+            "ping": self.ping,
+            "snapshot": self.snapshot,
+            "stats": self.stats,
+            "brightness": self.brightness,
+            "mode": self.mode,
+            "test": self.test,
+            "refresh": self.refresh
+        }
+
+    async def start(self):
+        """Listen on the socket; raises OSError if another monitor owns it"""
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except OSError:
+                # Left behind by a monitor that didn't shut down cleanly
+                os.unlink(self.path)
+            else:
+                raise OSError(f"{self.path} is in use by another monitor")
+            finally:
+                probe.close()
+        self.server = await asyncio.start_unix_server(self._handle, path=self.path)
+        os.chmod(self.path, 0o660)
+
+    def stop(self):
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+            with contextlib.suppress(OSError):
+                os.unlink(self.path)
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = json.dumps(self.dispatch(line), default=str)
+                writer.write(response.encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, ValueError):
+            # ValueError: a line longer than the stream limit
+            pass
+        finally:
+            writer.close()
+
+    def dispatch(self, line):
+        """Run one request line, never raising"""
+        self.requests += 1
+        try:
+            request = json.loads(line)
+            command = self.commands[request["command"]]
+        except (ValueError, KeyError, TypeError):
+            return {"ok": False, "error": f"expected {{\"command\": ...}} with one of {', '.join(self.commands)}"}
+        try:
+            return {"ok": True, "result": command(request)}
+        except KeyError as e:
+            return {"ok": False, "error": f"{request['command']} needs {e.args[0]!r}"}
+        except (TypeError, ValueError) as e:
+            return {"ok": False, "error": str(e)}
+
+    def ping(self, request):
+        return {"pid": os.getpid(), "uptime": time.monotonic() - PROCESS_START}
+
+    def snapshot(self, request):
+        """Latest state and the LED frame on the PiGlow"""
+        monitor = self.monitor
+        sent = monitor.renderer.sent
+        return {"version": monitor.state.version,
+                "frame": list(sent) if sent is not None else None,
+                "state": {key: value for key, value in monitor.state.snapshot().items()
+                          if key in DASHBOARD_KEYS}}
+
+    def stats(self, request):
+        """Health of the daemon itself"""
+        monitor = self.monitor
+        return {"pid": os.getpid(),
+                "uptime": time.monotonic() - PROCESS_START,
+                "first_frame_ms": monitor.first_frame_ms,
+                "frames": monitor.renderer.frames,
+                "led_writes": monitor.renderer.led_writes,
+                "instances": {instance.name: instance.health() for instance in monitor.instances},
+                "collectors": {c.name: {"timeouts": c.timeouts, "errors": c.errors}
+                               for c in monitor.collectors},
+                "stages": monitor.instrumentation.summary() if monitor.instrumentation.enabled else None,
+                "overrides": monitor.overrides,
+                "dashboard_clients": monitor.dashboard.clients if monitor.dashboard is not None else None}
+
+    def brightness(self, request):
+        """Set brightness_scale until the next restart"""
+        value = request["value"]
+        self.monitor.apply_overrides({"brightness_scale": value})
+        return {"brightness_scale": value}
+
+    def mode(self, request):
+        """Turn one of MODES on or off until the next restart"""
+        name = request["name"]
+        if name not in MODES:
+            raise ValueError(f"unknown mode {name!r}, expected one of {', '.join(MODES)}")
+        enabled = request["enabled"]
+        if not isinstance(enabled, bool):
+            raise ValueError("enabled must be true or false")
+        self.monitor.apply_overrides({"features": {MODES[name]: enabled}})
+        return {name: enabled}
+
+    def test(self, request):
+        self.monitor.test_pattern()
+        return {"duration": self.monitor.plan.clips['test_pattern'].duration}
+
+    def refresh(self, request):
+        """Poll every collector now and re-read the config"""
+        return {"collectors": self.monitor.refresh()}
+
+class TraceRecorder:
+    """Records collector inputs to a gzip'd JSON-lines trace for replay_trace
+
+    Only inputs are kept: each Pi-hole poll result, the system samples,
+    the log-tail rates and the top-talker snapshots, with their offset from
+    the start of the session. Everything derived from them (fleet merge,
+    rates, anomalies, animations) is recomputed on replay.
+    """
+
+    INPUTS = ('system', 'log_rates', 'top_talkers', 'dns_probe')
+
+    def __init__(self, path, config, clock=time.monotonic):
+        self.clock = clock
+        self.start = clock()
+        self.events = 0
+        # Secrets stay out of trace files that get passed around
+        config = dict(config, pihole_password="",
+                      pihole_instances=[{key: value for key, value in instance.items() if key != "password"}
+                                        for instance in config["pihole_instances"]])
+        import gzip
+        self.file = gzip.open(path, "wt", compresslevel=6)
+        self.file.write(json.dumps({'trace': 1, 'started': time.time(), 'config': config}) + "\n")
+
+    def record(self, name, value):
+        if name not in self.INPUTS and not name.startswith("pihole:"):
+            return
+        self.file.write(json.dumps([round(self.clock() - self.start, 4), name, value],
+                                   separators=(',', ':')) + "\n")
+        self.events += 1
+
+    def close(self):
+        self.file.close()
+
+class HeadlessPiGlow:
+    """PiGlow stand-in with the bulk set()/show() interface and no hardware"""
+
+    def __init__(self):
+        self.values = [0] * LED_COUNT
+        self.shows = 0
+
+    def set(self, start, values):
+        self.values[start:start + len(values)] = list(values)
+
+    def show(self):
+        self.shows += 1
+
+    def led(self, index, value):
+        self.values[index] = value
+
+    def all(self, value):
+        self.values = [value] * LED_COUNT
+
+def sd_notify(message):
+    """Send a state change to systemd; a no-op unless run as Type=notify"""
+    address = os.environ.get("NOTIFY_SOCKET")
+    if not address:
+        return False
+    if address.startswith("@"):
+        # Abstract namespace socket
+        address = "\0" + address[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.sendto(message.encode(), address)
+        return True
+    except OSError as e:
+        print(f"sd_notify failed: {e}")
+        return False
+
+def watchdog_interval():
+    """Seconds between WATCHDOG=1 pings (half of WatchdogSec), None when off"""
+    usec = os.environ.get("WATCHDOG_USEC")
+    pid = os.environ.get("WATCHDOG_PID")
+    if not usec or (pid and int(pid) != os.getpid()):
+        return None
+    return int(usec) / 1e6 / 2
 
 class PiHolePiGlowMonitor:
-    def __init__(self, config_file="config.json"):
-        self.piglow = PiGlow()
+    def __init__(self, config_file=DEFAULT_CONFIG, piglow=None):
+        # An injected driver lets benchmarks and headless runs skip the hardware
+        if piglow is None:
+            from piglow import PiGlow
+            piglow = PiGlow()
+        self.piglow = piglow
+        self.renderer = FrameRenderer(self.piglow)
+        self.player = AnimationPlayer(self.renderer)
+        self.state = MonitorState()
+        # Trace replay swaps these for a virtual clock
+        self.clock = time.monotonic
+        self.wall_clock = time.time
+        self.first_frame_ms = None
+        # Pinged from the render loop, so a stalled display gets restarted
+        self.watchdog_interval = watchdog_interval()
+        self.last_watchdog = 0.0
+        self.config_file = config_file
+        self.config_mtime = self.config_stamp()
+        self.reload_requested = False
         self.config = self.load_config(config_file)
+        self.plan = RenderPlan(self.config)
         self.pihole_api_url = self.config.get("pihole_api_url", "http://localhost/admin/api.php")
+        self.instances = self.create_instances()
+        self.update_interval = self.config["update_interval"]
+        self.last_log = 0.0
+        self.collectors = []
+        self.instrumentation = Instrumentation(self.config["instrumentation"]["enabled"])
+        sampler_config = self.config["system_sampler"]
+        if self.config["features"]["enable_temperature_monitoring"]:
+            temperature_sensor = detect_temperature_sensor(self.config["temperature_sensor"])
+        else:
+            temperature_sensor = TemperatureSensor()
+        self.sampler = SystemSampler(window=sampler_config["window"],
+                                     disk_interval=sampler_config["disk_interval"],
+                                     temperature_sensor=temperature_sensor)
         
-        # LED mapping for different metrics
-        self.status_colors = {
-            'enabled': self.config["colors"]["pihole_enabled"],
-            'disabled': self.config["colors"]["pihole_disabled"],
-            'error': self.config["colors"]["pihole_error"]
-        }
+        # Query and block rates from the cumulative daily counters
+        rate_config = self.config["query_rate"]
+        self.rate_windows = rate_config["windows"]
+        self.query_ring = CounterRing(rate_config["capacity"], self.rate_windows)
+        self.blocked_ring = CounterRing(rate_config["capacity"], self.rate_windows)
         
-        # Arms: 0=top-right, 1=bottom, 2=top-left
-        self.metric_arms = {
-            'pihole_status': self.config["led_mapping"]["pihole_status_arm"],
-            'system_health': self.config["led_mapping"]["system_health_arm"],
-            'network_activity': self.config["led_mapping"]["network_activity_arm"]
-        }
+        # Optional pihole.log follower for second-level activity
+        log_config = self.config["log_tail"]
+        self.log_tail = (PiholeLogTail(log_config["path"], history=max(log_config["windows"], default=60))
+                         if log_config["enabled"] else None)
         
-    def load_config(self, config_file):
-        """Load configuration from JSON file"""
-        default_config = {
+        # Snapshot history that outlives restarts
+        self.history = None
+        history_config = self.config["history"]
+        if history_config["enabled"]:
+            try:
+                self.history = MetricHistory(self.data_path(history_config["path"]), history_config["capacity"],
+                                             history_config["flush_interval"])
+            except (OSError, ValueError) as e:
+                print(f"Metric history disabled: {e}")
+        
+        # Learned baselines for the anomaly alerts
+        self.anomaly_detector = None
+        self.anomaly_seen = {}
+        self.anomaly_seeded = False
+        self.anomalies_shown = set()
+        anomaly_config = self.config["anomaly"]
+        if anomaly_config["enabled"]:
+            self.anomaly_detector = AnomalyDetector(
+                anomaly_config["metrics"], alpha=anomaly_config["alpha"],
+                seasonal_alpha=anomaly_config["seasonal_alpha"],
+                season_slots=anomaly_config["season_slots"], warmup=anomaly_config["warmup"],
+                z_threshold=anomaly_config["z_threshold"], min_std=anomaly_config["min_std"])
+        
+        self.instrument_stages()
+        
+        # Top clients/domains need per-query data: the log tail if it is on,
+        # otherwise any FTL database sources
+        self.aggregator = None
+        talkers_config = self.config["top_talkers"]
+        feeds = [self.log_tail] if self.log_tail else [
+            instance.source for instance in self.instances if isinstance(instance.source, FTLDatabaseSource)]
+        if talkers_config["enabled"] and feeds:
+            self.aggregator = QueryAggregator(talkers_config["capacity"], talkers_config["half_life"])
+            for feed in feeds:
+                feed.aggregator = self.aggregator
+        
+        # Active resolver latency probe
+        self.dns_probe = None
+        probe_config = self.config["dns_probe"]
+        if probe_config["enabled"]:
+            try:
+                self.dns_probe = DNSProbe(probe_config["server"], probe_config["port"],
+                                          {kind: probe_config[kind] for kind in DNSProbe.KINDS},
+                                          timeout=probe_config["timeout"], window=probe_config["window"])
+            except ValueError as e:
+                print(f"DNS probe disabled: {e}")
+        
+        trace_path = self.data_path(self.config["trace"]["record_path"])
+        self.recorder = TraceRecorder(trace_path, self.config) if trace_path else None
+        # Set by run_monitor when the live dashboard is enabled
+        self.dashboard = None
+        self.control = None
+        # Settings changed over the control socket, kept across reloads
+        self.overrides = {}
+        
+    def default_config(self):
+        """Built-in defaults for every setting"""
+        return {
             "pihole_api_url": "http://localhost/admin/api.php",
+            "api_timeout": 5,
+            "pihole_api_version": "auto",
+            "pihole_password": "",
+            "data_source": "api",
+            "pihole_instances": [],
+            "polling": {
+                "adaptive": True,
+                "min_interval": 2,
+                "max_interval": 60,
+                "failure_threshold": 3,
+                "max_backoff": 300,
+                "jitter": 0.2,
+                "probe_timeout": 2,
+                "stale_max_age": 300
+            },
+            "ftl_db": {
+                "path": "/etc/pihole/pihole-FTL.db",
+                "gravity_path": "/etc/pihole/gravity.db",
+                "setup_vars": "/etc/pihole/setupVars.conf",
+                "pihole_toml": "/etc/pihole/pihole.toml"
+            },
             "update_interval": 10,
             "temperature_warning": 60,
             "temperature_critical": 70,
+            "temperature_sensor": "auto",
             "cpu_warning": 80,
             "memory_warning": 85,
             "brightness_scale": 1.0,
+            "gamma": 1.0,
             "enable_startup_animation": True,
+            "animation_fps": 10,
             "led_mapping": {
                 "pihole_status_arm": 0,
                 "system_health_arm": 1,
@@ -63,13 +3113,104 @@ class PiHolePiGlowMonitor:
                 "temperature_warning": "orange",
                 "temperature_critical": "red",
                 "network_queries": "yellow",
-                "blocked_queries": "red"
+                "blocked_queries": "red",
+                "dominant_client": "white",
+                "dns_slow": "yellow"
             },
             "thresholds": {
                 "high_cpu": 75,
                 "high_memory": 80,
                 "high_disk": 90,
-                "high_queries_per_minute": 100
+                "high_queries_per_minute": 100,
+                "dns_p95_ms": 250,
+                "dns_timeout_rate": 0.2
+            },
+            "query_rate": {
+                "windows": [60, 300],
+                "display_window": 60,
+                "capacity": 512
+            },
+            "log_tail": {
+                "enabled": False,
+                "path": "/var/log/pihole/pihole.log",
+                "interval": 0.5,
+                "windows": [10, 60],
+                "display_window": 10
+            },
+            "instrumentation": {
+                "enabled": False,
+                "summary_interval": 300,
+                "stats_file": "stats.json"
+            },
+            "metrics": {
+                "enabled": False,
+                "host": "0.0.0.0",
+                "port": 9617
+            },
+            "control": {
+                "enabled": True,
+                "path": "control.sock"
+            },
+            "dashboard": {
+                "enabled": False,
+                "host": "0.0.0.0",
+                "port": 9618,
+                "metrics_interval": 1.0,
+                "backlog": 256,
+                "page": ""
+            },
+            "system_sampler": {
+                "interval": 1.0,
+                "window": 10,
+                "disk_interval": 30
+            },
+            "config_reload": {
+                "enabled": True,
+                "interval": 2
+            },
+            "animations": {},
+            "anomaly": {
+                "enabled": True,
+                "metrics": ["queries_per_minute", "blocked_per_minute", "cpu_percent", "temperature"],
+                "interval": 1,
+                "alpha": 0.05,
+                "seasonal_alpha": 0.1,
+                "season_slots": 24,
+                "warmup": 30,
+                "z_threshold": 4.0,
+                "min_std": 1.0,
+                "backfill": True
+            },
+            "trace": {
+                "record_path": ""
+            },
+            "dns_probe": {
+                "enabled": False,
+                "server": "127.0.0.1",
+                "port": 53,
+                "interval": 10,
+                "timeout": 1.0,
+                "window": 60,
+                "cached": ["pi.hole", "example.com"],
+                "uncached": ["example.com"],
+                "blocked": []
+            },
+            "top_talkers": {
+                "enabled": True,
+                "capacity": 64,
+                "half_life": 300,
+                "interval": 5,
+                "top": 10,
+                "dominant_share": 0.5,
+                "min_queries": 50,
+                "expose_names": False
+            },
+            "history": {
+                "enabled": True,
+                "path": "history.bin",
+                "interval": 10,
+                "capacity": 8640,
+                "flush_interval": 60
             },
             "features": {
                 "enable_system_monitoring": True,
@@ -79,150 +3220,339 @@ class PiHolePiGlowMonitor:
                 "enable_startup_sequence": True
             }
         }
-        
-        try:
-            if os.path.exists(config_file):
-                with open(config_file, 'r') as f:
-                    user_config = json.load(f)
-                # Merge user config with defaults
-                config = default_config.copy()
-                config.update(user_config)
+    
+    def merged_config(self, config_file):
+        """Defaults deep-merged with config_file, not yet validated"""
+        default_config = self.default_config()
+        if not os.path.exists(config_file):
+            print(f"Config file {config_file} not found, using defaults")
+            return default_config
+        with open(config_file, 'r') as f:
+            user_config = json.load(f)
+        # Merge per block so a partial "colors" keeps the other defaults
+        return deep_merge(default_config, user_config)
+    
+    def read_config(self, config_file):
+        """Defaults deep-merged with config_file, validated; raises on bad input"""
+        config = self.merged_config(config_file)
+        validate_config(config)
+        return config
+    
+    def load_config(self, config_file):
+        """Startup config: invalid display settings fall back to their defaults
+
+        Everything else in the file (Pi-hole URLs, passwords, instances) is
+        kept. A file that can't be read or parsed raises instead, since
+        running without it would poll the wrong Pi-hole.
+        """
+        config = self.merged_config(config_file)
+        for _ in range(3):
+            problems = config_problems(config)
+            if not problems:
                 return config
-            else:
-                print(f"Config file {config_file} not found, using defaults")
-                return default_config
+            # Resetting one key can expose another (e.g. a now-duplicate
+            # arm), hence the second pass
+            defaults = self.default_config()
+            for path, message in problems:
+                print(f"Config: {message}, using the default")
+                reset_config_key(config, defaults, path)
+        validate_config(config)
+        return config
+    
+    def config_stamp(self):
+        """mtime of the config file, None if it doesn't exist"""
+        try:
+            return os.stat(self.config_file).st_mtime_ns
+        except (OSError, TypeError):
+            return None
+    
+    def data_path(self, path):
+        """A path from the config, relative ones resolved next to the config file"""
+        return config_relative(self.config_file, path)
+    
+    def request_reload(self, signum=None, frame=None):
+        """SIGHUP handler: reload on the next config check"""
+        self.reload_requested = True
+    
+    def reload_config(self):
+        """Re-read the config and swap in a new render plan, keeping the old one on error"""
+        config = self.read_reloaded_config()
+        return config is not None and self.apply_config(config)
+    
+    def read_reloaded_config(self):
+        """The validated config file, None (logged) if it is missing or invalid"""
+        try:
+            if not os.path.exists(self.config_file):
+                raise FileNotFoundError(f"{self.config_file} not found")
+            return self.read_config(self.config_file)
         except Exception as e:
-            print(f"Error loading config: {e}, using defaults")
-            return default_config
+            print(f"Config reload failed, keeping current settings: {e}")
+            return None
+    
+    def apply_config(self, config):
+        """Swap in a re-read config with the runtime overrides on top"""
+        try:
+            if self.overrides:
+                config = deep_merge(config, self.overrides)
+                validate_config(config)
+            plan = RenderPlan(config)
+        except Exception as e:
+            print(f"Config reload failed, keeping current settings: {e}")
+            return False
+        self.config = config
+        self.plan = plan
+        print(f"Reloaded {self.config_file}")
+        return True
+    
+    def apply_overrides(self, overrides):
+        """Change display settings at runtime; raises ValueError and keeps the current ones if invalid"""
+        config = deep_merge(self.config, overrides)
+        validate_config(config)
+        self.plan = RenderPlan(config)
+        self.config = config
+        self.overrides = deep_merge(self.overrides, overrides)
+        print(f"Runtime settings changed: {json.dumps(overrides)}")
+    
+    def refresh(self):
+        """Wake every collector for an immediate poll and re-read the config"""
+        self.reload_requested = True
+        woken = []
+        for collector in self.collectors:
+            if collector.wake is not None:
+                collector.wake.set()
+                woken.append(collector.name)
+        return woken
+    
+    def check_config(self):
+        """Collector: re-read the file when it changed or SIGHUP asked for it
+
+        Runs in a worker thread, so it only reads and validates; on_config
+        does the swap on the event loop, where the control socket changes
+        the overrides too.
+        """
+        stamp = self.config_stamp()
+        if self.reload_requested or stamp != self.config_mtime:
+            self.reload_requested = False
+            self.config_mtime = stamp
+            return self.read_reloaded_config()
+        return None
+    
+    def on_config(self, config):
+        if config is not None:
+            self.apply_config(config)
+        
+    def instrument_stages(self):
+        """Wrap the hot-path stages in timers (no-op unless enabled)"""
+        instrumentation = self.instrumentation
+        if not instrumentation.enabled:
+            return
+        for instance in self.instances:
+            instance.poll = instrumentation.wrap(f"poll:{instance.name}", instance.poll)
+            if hasattr(instance.source, 'instrumentation'):
+                instance.source.instrumentation = instrumentation
+        sampler = self.sampler
+        sampler._read_cpu_percent = instrumentation.wrap("sample:cpu", sampler._read_cpu_percent)
+        sampler._read_memory_percent = instrumentation.wrap("sample:memory", sampler._read_memory_percent)
+        sampler._read_disk_percent = instrumentation.wrap("sample:disk", sampler._read_disk_percent)
+        sampler._read_temperature = instrumentation.wrap("sample:temperature", sampler._read_temperature)
+        self.display_pihole_status = instrumentation.wrap("display:pihole_status", self.display_pihole_status)
+        self.display_system_health = instrumentation.wrap("display:system_health", self.display_system_health)
+        self.display_network_activity = instrumentation.wrap("display:network_activity",
+                                                             self.display_network_activity)
+        self.renderer.flush = instrumentation.wrap("led:flush", self.renderer.flush)
+    
+    def report_stage_stats(self):
+        """Collector: log the stage summary and persist it for the stats command"""
+        summary = self.instrumentation.summary()
+        print(f"\n--- Stage timings since {time.strftime('%H:%M:%S', time.localtime(self.instrumentation.started))} ---")
+        print(self.instrumentation.report())
         
+        stats_file = self.data_path(self.config["instrumentation"]["stats_file"])
+        tmp_file = f"{stats_file}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump({'written': time.time(), 'since': self.instrumentation.started,
+                       'stages': summary}, f)
+        os.replace(tmp_file, stats_file)
+        return summary
+    
+    def create_pihole_source(self, data_source, url, timeout, api_version="auto", password=""):
+        """Build one Pi-hole data source"""
+        if data_source == "ftl_db":
+            ftl_config = self.config["ftl_db"]
+            return FTLDatabaseSource(ftl_config["path"], ftl_config["gravity_path"],
+                                     ftl_config["setup_vars"], ftl_config["pihole_toml"])
+        if str(api_version) == "6":
+            return PiHoleV6Client(url, password, timeout=timeout)
+        if str(api_version) == "5":
+            return PiHoleAPIClient(url, timeout=timeout)
+        return AutoDetectAPIClient(url, password, timeout=timeout)
+    
+    def create_instances(self):
+        """One PiHoleInstance per configured Pi-hole (the local one by default)"""
+        instances_config = self.config["pihole_instances"] or [
+            {"name": "local", "url": self.pihole_api_url}]
+        instances = []
+        for index, instance_config in enumerate(instances_config):
+            name = instance_config.get("name", f"pihole{index}")
+            timeout = instance_config.get("timeout", self.config["api_timeout"])
+            data_source = instance_config.get("data_source", self.config["data_source"])
+            source = self.create_pihole_source(
+                data_source, instance_config.get("url"), timeout,
+                api_version=instance_config.get("api_version", self.config["pihole_api_version"]),
+                password=instance_config.get("password", self.config["pihole_password"]))
+            instances.append(PiHoleInstance(name, source, timeout))
+        return instances
+    
     def get_pihole_status(self):
-        """Get Pi-hole status and statistics"""
+        """Get Pi-hole status and statistics, merged across all instances"""
+        executor = ThreadPoolExecutor(max_workers=len(self.instances))
+        pending = {executor.submit(instance.poll): instance for instance in self.instances}
+        # Two requests at most, each bounded by its timeout
+        deadline = max(instance.timeout * 2 + 1 for instance in self.instances)
         try:
-            # Basic status
-            response = requests.get(self.pihole_api_url, timeout=5)
-            data = response.json()
-            
-            # Extended stats
-            stats_response = requests.get(f"{self.pihole_api_url}?summaryRaw", timeout=5)
-            stats_data = stats_response.json()
-            
-            return {
-                'status': data.get('status', 'unknown'),
-                'domains_blocked': int(data.get('domains_being_blocked', 0)),
-                'queries_today': int(stats_data.get('dns_queries_today', 0)),
-                'blocked_today': int(stats_data.get('ads_blocked_today', 0)),
-                'percent_blocked': float(stats_data.get('ads_percentage_today', 0)),
-                'clients': int(stats_data.get('unique_clients', 0))
-            }
-        except Exception as e:
-            print(f"Error getting Pi-hole status: {e}")
-            return None
+            # Each result is recorded as it arrives, so a refused connection
+            # is reported at once rather than after the slowest instance
+            for future in as_completed(pending, timeout=deadline):
+                instance = pending.pop(future)
+                try:
+                    instance.record(future.result())
+                except Exception as e:
+                    print(f"Error getting Pi-hole status from {instance.name}: {e}")
+                    instance.record(None)
+        except FutureTimeoutError:
+            for instance in pending.values():
+                print(f"Error getting Pi-hole status from {instance.name}: no answer within {deadline:g}s")
+                instance.record(None)
+        finally:
+            # Don't wait for a hung request: its thread finishes on its own.
+            # One worker per instance means nothing is queued to cancel.
+            executor.shutdown(wait=False)
+        return merge_fleet(self.instances)
     
     def get_system_metrics(self):
         """Get system health metrics"""
         try:
-            # CPU usage
-            cpu_percent = psutil.cpu_percent(interval=1)
-            
-            # Memory usage
-            memory = psutil.virtual_memory()
-            memory_percent = memory.percent
-            
-            # Temperature (Raspberry Pi specific)
-            try:
-                temp_output = subprocess.check_output(['vcgencmd', 'measure_temp'])
-                temp_celsius = float(temp_output.decode().strip().split('=')[1].split("'")[0])
-            except:
-                temp_celsius = 0
-            
-            # Disk usage
-            disk = psutil.disk_usage('/')
-            disk_percent = (disk.used / disk.total) * 100
+            # Rewound /proc reads only; runs on the 'system' collector's thread
+            snapshot = self.sampler.sample()
             
             return {
-                'cpu_percent': cpu_percent,
-                'memory_percent': memory_percent,
-                'temperature': temp_celsius,
-                'disk_percent': disk_percent
+                'cpu_percent': snapshot['cpu_percent'],
+                'memory_percent': snapshot['memory_percent'],
+                'temperature': snapshot['temperature'],
+                'disk_percent': snapshot['disk_percent'],
+                'cpu_avg': snapshot['cpu_avg'],
+                'memory_avg': snapshot['memory_avg']
             }
         except Exception as e:
             print(f"Error getting system metrics: {e}")
             return None
     
-    def display_pihole_status(self, pihole_data):
-        """Display Pi-hole status on designated arm"""
-        arm = self.metric_arms['pihole_status']
+    def display_pihole_status(self, pihole_data, now=None, dns=None):
+        """Display Pi-hole status on designated arm, with DNS probe warnings"""
+        plan = self.plan
+        lut = plan.lut
         
         if not pihole_data:
-            # Error state - flash orange
-            self.piglow.arm(arm, 0)
-            for _ in range(3):
-                self.piglow.color(self.status_colors['error'], 100)
-                time.sleep(0.3)
-                self.piglow.color(self.status_colors['error'], 0)
-                time.sleep(0.3)
+            # Error state - the looping orange flash is drawn over this arm
+            if now is None:
+                now = self.clock()
+            self.renderer.clear_arm(plan.status_arm)
+            self.player.ensure('status', plan.clips['error_flash'], now)
             return
+        self.player.stop('status')
         
-        # Clear arm first
-        self.piglow.arm(arm, 0)
+        # Clear arm first (in the framebuffer, nothing is sent yet)
+        self.renderer.clear_arm(plan.status_arm)
         
-        if pihole_data['status'] == 'enabled':
+        if pihole_data['status'] == 'error':
+            # Part of the fleet is unreachable: steady warning colour
+            self.renderer.set_led(plan.status_error_led, lut[100])
+        elif pihole_data['status'] == 'enabled':
             # Green intensity based on blocking percentage
             intensity = min(100, max(20, int(pihole_data['percent_blocked'] * 2)))
-            intensity = int(intensity * self.config["brightness_scale"])
-            self.piglow.color(self.status_colors['enabled'], intensity)
+            self.renderer.set_led(plan.status_enabled_led, lut[intensity])
         else:
             # Red if disabled
-            intensity = int(100 * self.config["brightness_scale"])
-            self.piglow.color(self.status_colors['disabled'], intensity)
+            self.renderer.set_led(plan.status_disabled_led, lut[100])
+        
+        if dns and dns['timeout_rate'] is not None:
+            if dns['timeout_rate'] >= plan.dns_timeout_rate:
+                # The API answers but the resolver doesn't
+                self.renderer.set_led(plan.status_error_led, lut[100])
+            elif dns['p95_ms'] > plan.dns_p95_ms:
+                # Slow lookups: brighter the further over the limit
+                intensity = min(100, int(50 * dns['p95_ms'] / plan.dns_p95_ms))
+                self.renderer.set_led(plan.dns_slow_led, lut[intensity])
     
     def display_system_health(self, system_data):
         """Display system health on designated arm"""
-        arm = self.metric_arms['system_health']
+        plan = self.plan
+        lut = plan.lut
         
-        if not system_data or not self.config["features"]["enable_system_monitoring"]:
+        if not system_data or not plan.system_enabled:
             return
         
-        # Clear arm first
-        self.piglow.arm(arm, 0)
+        # Clear arm first (in the framebuffer, nothing is sent yet)
+        self.renderer.clear_arm(plan.health_arm)
         
         # Temperature check first (highest priority)
-        if (self.config["features"]["enable_temperature_monitoring"] and 
-            system_data['temperature'] > self.config["temperature_critical"]):
-            intensity = int(100 * self.config["brightness_scale"])
-            self.piglow.color(self.config["colors"]["temperature_critical"], intensity)
+        temperature = system_data['temperature']
+        if temperature is None:
+            temperature = 0
+        if plan.temperature_enabled and temperature > plan.temperature_critical:
+            self.renderer.set_led(plan.temperature_critical_led, lut[100])
             return
-        elif (self.config["features"]["enable_temperature_monitoring"] and 
-              system_data['temperature'] > self.config["temperature_warning"]):
-            intensity = int(80 * self.config["brightness_scale"])
-            self.piglow.color(self.config["colors"]["temperature_warning"], intensity)
+        elif plan.temperature_enabled and temperature > plan.temperature_warning:
+            self.renderer.set_led(plan.temperature_warning_led, lut[80])
             return
         
         # Normal operation - show CPU and memory
-        # CPU usage (blue)
         cpu_intensity = min(100, max(10, int(system_data['cpu_percent'])))
-        cpu_intensity = int(cpu_intensity * self.config["brightness_scale"])
-        
-        # Memory usage (white)
         memory_intensity = min(100, max(10, int(system_data['memory_percent'])))
-        memory_intensity = int(memory_intensity * self.config["brightness_scale"])
         
         # Show both CPU and memory
-        self.piglow.color(self.config["colors"]["cpu_usage"], cpu_intensity)
-        time.sleep(0.1)
-        self.piglow.color(self.config["colors"]["memory_usage"], memory_intensity)
+        self.renderer.set_led(plan.cpu_led, lut[cpu_intensity])
+        self.renderer.set_led(plan.memory_led, lut[memory_intensity])
+    
+    def current_rate(self, state):
+        """(queries/min, blocked/min) for the network arm, log tail first"""
+        log_rates = state.get('log_rates')
+        if log_rates:
+            return log_rates.get(self.plan.log_window)
+        rates = state.get('rates')
+        if rates:
+            return rates.get(self.plan.rate_window)
+        return None
     
-    def display_network_activity(self, pihole_data):
-        """Display network activity on designated arm"""
-        arm = self.metric_arms['network_activity']
+    def display_network_activity(self, pihole_data, rate=None, high_qpm=None):
+        """Display network activity on designated arm
+
+        high_qpm is the learned anomaly level for the query rate; without
+        one the configured thresholds.high_queries_per_minute is used.
+        """
+        plan = self.plan
+        lut = plan.lut
         
-        if not pihole_data or not self.config["features"]["enable_network_monitoring"]:
+        if not pihole_data or not plan.network_enabled:
             return
         
-        # Clear arm first
-        self.piglow.arm(arm, 0)
+        # Clear arm first (in the framebuffer, nothing is sent yet)
+        self.renderer.clear_arm(plan.network_arm)
+        
+        if rate is not None:
+            # Live load: queries/min against the configured high-water mark,
+            # blocked/min against half of it (blocking is a fraction of traffic)
+            high_qpm = high_qpm or plan.high_queries_per_minute
+            queries_per_minute, blocked_per_minute = rate
+            if queries_per_minute > 0:
+                query_intensity = min(100, max(10, int(queries_per_minute / high_qpm * 100)))
+                self.renderer.set_led(plan.queries_led, lut[query_intensity])
+            if blocked_per_minute > 0:
+                blocked_intensity = min(100, max(10, int(blocked_per_minute / high_qpm * 200)))
+                self.renderer.set_led(plan.blocked_led, lut[blocked_intensity])
+            return
         
-        # Query activity visualization
+        # No rate yet (first poll): fall back to the daily totals
         queries = pihole_data['queries_today']
         blocked = pihole_data['blocked_today']
         
@@ -230,174 +3560,712 @@ class PiHolePiGlowMonitor:
         if queries > 0:
             # Yellow for total queries (scaled)
             query_intensity = min(100, max(10, int(queries / 100)))
-            query_intensity = int(query_intensity * self.config["brightness_scale"])
-            self.piglow.color(self.config["colors"]["network_queries"], query_intensity)
-            
-            time.sleep(0.1)
+            self.renderer.set_led(plan.queries_led, lut[query_intensity])
             
             # Red for blocked queries
             if blocked > 0:
                 blocked_intensity = min(100, max(10, int(blocked / 50)))
-                blocked_intensity = int(blocked_intensity * self.config["brightness_scale"])
-                self.piglow.color(self.config["colors"]["blocked_queries"], blocked_intensity)
+                self.renderer.set_led(plan.blocked_led, lut[blocked_intensity])
+    
+    def dominant_client(self, talkers):
+        """(client, share) when one client has most of the recent traffic"""
+        plan = self.plan
+        if not talkers or not talkers['clients'] or talkers['recent_queries'] < plan.dominant_min_queries:
+            return None
+        client, count, share = talkers['clients'][0]
+        return (client, share) if share >= plan.dominant_share else None
     
-    def startup_sequence(self):
-        """Fun startup animation"""
-        if not self.config["features"]["enable_startup_sequence"]:
+    def display_dominant_client(self, talkers, now):
+        """Pulse the network arm's white LED while a single client dominates"""
+        if self.dominant_client(talkers) and self.plan.network_enabled:
+            self.player.ensure('dominant', self.plan.clips['dominant_client'], now)
+        else:
+            self.player.stop('dominant')
+    
+    def startup_sequence(self, now=None):
+        """Fun startup animation, played over the first frames"""
+        if not self.plan.startup_enabled:
             return
             
         print("Pi-hole PiGlow Monitor Starting...")
+        if now is None:
+            now = self.clock()
+        self.player.play('startup', self.plan.clips['startup'], now, priority=1)
+    
+    def error_alert(self, now=None):
+        """Flash error pattern over the next frames"""
+        if not self.plan.alerts_enabled:
+            return
         
-        # Rainbow startup
-        colors = ['red', 'orange', 'yellow', 'green', 'blue', 'white']
-        for color in colors:
-            intensity = int(100 * self.config["brightness_scale"])
-            self.piglow.color(color, intensity)
-            time.sleep(0.2)
-            self.piglow.color(color, 0)
+        if now is None:
+            now = self.clock()
+        self.player.play('alert', self.plan.clips['alert'], now, priority=2)
+    
+    def test_pattern(self, now=None):
+        """Light each LED in turn, then all of them, over the live display"""
+        if now is None:
+            now = self.clock()
+        self.player.play('test', self.plan.clips['test_pattern'], now, priority=2)
+    
+    def render_frame(self, state, now):
+        """Draw the latest snapshot into the framebuffer and flush it"""
+        # Every frame is drawn from scratch so a finished clip leaves nothing
+        # behind; flush() still only sends what changed
+        self.renderer.clear()
+        if 'pihole' in state:
+            self.display_pihole_status(state['pihole'], now, state.get('dns_probe'))
+        if 'system' in state:
+            self.display_system_health(state['system'])
+        if 'pihole' in state:
+            anomaly = state.get('anomaly')
+            self.display_network_activity(state['pihole'], self.current_rate(state),
+                                          anomaly['queries_high'] if anomaly else None)
+        self.display_dominant_client(state.get('top_talkers'), now)
         
-        # Arm sweep
-        for arm in range(3):
-            intensity = int(100 * self.config["brightness_scale"])
-            self.piglow.arm(arm, intensity)
-            time.sleep(0.2)
-            self.piglow.arm(arm, 0)
+        # Running clips (startup, alerts, error flash) draw over the metrics
+        self.player.apply(now)
+        changed = self.renderer.flush()
+        if self.dashboard is not None:
+            if changed:
+                self.dashboard.publish_frame(self.renderer.sent)
+            self.dashboard.publish_state(state, self.state.version, now)
         
-        print("Monitor active!")
+        if self.first_frame_ms is None:
+            self.on_first_frame()
+        elif self.watchdog_interval and now - self.last_watchdog >= self.watchdog_interval:
+            self.last_watchdog = now
+            sd_notify("WATCHDOG=1")
+        return changed
+    
+    def on_first_frame(self):
+        """Report time-to-first-frame and tell systemd the service is up"""
+        self.first_frame_ms = (time.monotonic() - PROCESS_START) * 1000
+        print(f"First frame {self.first_frame_ms:.0f} ms after start")
+        sd_notify(f"READY=1\nSTATUS=First frame after {self.first_frame_ms:.0f} ms")
+        self.last_watchdog = time.monotonic()
     
-    def error_alert(self):
-        """Flash error pattern"""
-        if not self.config["features"]["enable_error_alerts"]:
+    def record_rates(self, pihole_data, now=None):
+        """Feed the daily counters into the rate rings and publish the rates"""
+        if not pihole_data:
             return
-            
-        for _ in range(5):
-            intensity = int(100 * self.config["brightness_scale"])
-            self.piglow.all(intensity)
-            time.sleep(0.2)
-            self.piglow.all(0)
-            time.sleep(0.2)
+        if now is None:
+            now = self.clock()
+        self.query_ring.add(now, pihole_data['queries_today'])
+        self.blocked_ring.add(now, pihole_data['blocked_today'])
+        
+        rates = {}
+        for window in self.rate_windows:
+            queries_per_minute = self.query_ring.rate(window)
+            if queries_per_minute is not None:
+                rates[window] = (queries_per_minute, self.blocked_ring.rate(window) or 0.0)
+        self.state.update('rates', rates)
+    
+    def on_instance_update(self, instance, data):
+        """Collector callback for one instance: merge the fleet, update rates, log"""
+        instance.record(data)
+        previous = self.state.snapshot().get('pihole')
+        pihole_data = merge_fleet(self.instances, self.config["polling"]["stale_max_age"])
+        self.state.update('pihole', pihole_data)
+        if pihole_data is None and previous is not None:
+            # Alert once when the display loses its data, not on every retry
+            self.error_alert()
+        self.record_rates(pihole_data)
+        
+        # With several instances reporting on their own schedules, log at
+        # most about once per update interval
+        now = self.clock()
+        if now - self.last_log >= self.update_interval / 2:
+            self.last_log = now
+            self.log_update(pihole_data)
+    
+    def log_update(self, pihole_data):
+        """Print the periodic status lines after each Pi-hole poll"""
+        print(f"\n--- Update at {time.strftime('%H:%M:%S')} ---")
+        
+        if pihole_data:
+            if pihole_data.get('stale_age') is not None:
+                print(f"Pi-hole: STALE - showing data from {pihole_data['stale_age']:.0f}s ago")
+            print(f"Pi-hole: {pihole_data['status']} | "
+                  f"Queries: {pihole_data['queries_today']} | "
+                  f"Blocked: {pihole_data['blocked_today']} "
+                  f"({pihole_data['percent_blocked']:.1f}%)")
+            rates = self.state.snapshot().get('rates')
+            if rates:
+                print("Rate: " + " | ".join(
+                    f"{window}s {qpm:.0f} q/min, {bpm:.0f} blocked/min"
+                    for window, (qpm, bpm) in sorted(rates.items())))
+            talkers = self.state.snapshot().get('top_talkers')
+            if talkers and talkers['clients']:
+                dominant = self.dominant_client(talkers)
+                print("Top clients: " + ", ".join(
+                    f"{client} {share * 100:.0f}%" for client, count, share in talkers['clients'][:3])
+                      + (" (dominant)" if dominant else ""))
+            for instance in self.instances:
+                health = instance.health()
+                prefix = f"[{instance.name}] " if len(self.instances) > 1 else ""
+                if health['healthy']:
+                    print(f"{prefix}{instance.source.stats_line()}")
+                else:
+                    print(f"{prefix}DOWN ({health['failures']} failed polls, "
+                          f"circuit {health['circuit'] or 'n/a'}, "
+                          f"retry in {health['interval'] or 0:.0f}s)")
+        else:
+            print("Pi-hole: ERROR - Cannot connect to API")
+        
+        dns = self.state.snapshot().get('dns_probe')
+        if dns and dns['timeout_rate'] is not None:
+            print(f"DNS: p50 {dns['p50_ms']:.1f}ms | p95 {dns['p95_ms']:.1f}ms | "
+                  f"timeouts {dns['timeout_rate'] * 100:.0f}%")
+        
+        system_data = self.state.snapshot().get('system')
+        if system_data:
+            temperature = system_data['temperature']
+            temp_text = f"{temperature:.1f}°C" if temperature is not None else "n/a"
+            print(f"System: CPU {system_data['cpu_percent']:.1f}% | "
+                  f"Memory {system_data['memory_percent']:.1f}% | "
+                  f"Temp {temp_text}")
+    
+    def check_anomalies(self):
+        """Collector: score samples that arrived since the last run"""
+        detector = self.anomaly_detector
+        if not self.anomaly_seeded:
+            # First run: seed from stored history, off the startup path
+            self.anomaly_seeded = True
+            if self.config["anomaly"]["backfill"] and self.history is not None:
+                seeded = detector.backfill(self.history.records())
+                print(f"Anomaly baselines seeded from {seeded} stored samples")
+        
+        state = self.state.snapshot()
+        now = self.wall_clock()
+        # Each collector publishes a fresh dict, so identity tells new samples
+        # from ones already scored
+        system = state.get('system')
+        if system is not None and system is not self.anomaly_seen.get('system'):
+            self.anomaly_seen['system'] = system
+            for name in ('cpu_percent', 'memory_percent', 'temperature'):
+                detector.observe(name, system.get(name), now)
+        rates = state.get('log_rates') or state.get('rates')
+        rate = self.current_rate(state)
+        if rate is not None and rates is not self.anomaly_seen.get('rates'):
+            self.anomaly_seen['rates'] = rates
+            detector.observe('queries_per_minute', rate[0], now)
+            detector.observe('blocked_per_minute', rate[1], now)
+        return {'active': dict(detector.active),
+                'queries_high': detector.high_water('queries_per_minute')}
+    
+    def on_anomalies(self, result):
+        """Flash the arm of each metric that just turned anomalous"""
+        if not result:
+            return
+        active = result['active']
+        started = set(active) - self.anomalies_shown
+        self.anomalies_shown = set(active)
+        if not started:
+            return
+        print("Anomaly: " + ", ".join(f"{name} z={active[name]:+.1f}" for name in sorted(started)))
+        if not self.plan.alerts_enabled:
+            return
+        now = self.clock()
+        if started & {'queries_per_minute', 'blocked_per_minute'}:
+            self.player.play('anomaly:network', self.plan.clips['anomaly_network'], now, priority=2)
+        if started - {'queries_per_minute', 'blocked_per_minute'}:
+            self.player.play('anomaly:health', self.plan.clips['anomaly_health'], now, priority=2)
+    
+    def record_history(self):
+        """Collector: append the current snapshot to the history file"""
+        state = self.state.snapshot()
+        self.history.append(self.wall_clock(), state.get('system'), state.get('pihole'),
+                            self.current_rate(state))
+        return len(self.history)
+    
+    def poll_log_tail(self):
+        """Collector: read new pihole.log lines and return the per-second rates"""
+        self.log_tail.poll()
+        log_config = self.config["log_tail"]
+        return self.log_tail.rates(log_config["windows"])
+    
+    def build_collectors(self, update_interval):
+        """Collectors for the scheduler, each with its own cadence and timeout"""
+        sampler_config = self.config["system_sampler"]
+        collectors = []
+        if self.log_tail:
+            log_interval = self.config["log_tail"]["interval"]
+            collectors.append(Collector('log_rates', self.poll_log_tail, log_interval,
+                                        timeout=max(1.0, log_interval * 4)))
+        polling = self.config["polling"]
+        for instance in self.instances:
+            instance.controller = PollController(
+                update_interval, min_interval=polling["min_interval"],
+                max_interval=polling["max_interval"],
+                failure_threshold=polling["failure_threshold"],
+                max_backoff=polling["max_backoff"], jitter=polling["jitter"],
+                adaptive=polling["adaptive"])
+            instance.probe_timeout = polling["probe_timeout"]
+            # Each instance polls on its own so a dead one can't hold up the
+            # others; two requests at most, each bounded by its timeout
+            collectors.append(Collector(
+                f"pihole:{instance.name}", instance.poll, instance.next_delay,
+                timeout=lambda instance=instance: instance.current_timeout() * 2 + 1,
+                on_result=lambda data, instance=instance: self.on_instance_update(instance, data)))
+        instrumentation_config = self.config["instrumentation"]
+        if self.instrumentation.enabled:
+            collectors.append(Collector('stage_stats', self.report_stage_stats,
+                                        instrumentation_config["summary_interval"], timeout=5))
+        if self.aggregator is not None:
+            talkers_config = self.config["top_talkers"]
+            collectors.append(Collector('top_talkers', lambda: self.aggregator.snapshot(talkers_config["top"]),
+                                        talkers_config["interval"], timeout=5))
+        if self.anomaly_detector is not None:
+            collectors.append(Collector('anomaly', self.check_anomalies,
+                                        self.config["anomaly"]["interval"], timeout=10,
+                                        on_result=self.on_anomalies))
+        if self.dns_probe is not None:
+            probe_config = self.config["dns_probe"]
+            collectors.append(Collector('dns_probe', self.dns_probe.probe, probe_config["interval"],
+                                        timeout=probe_config["timeout"] + 2))
+        if self.history is not None:
+            collectors.append(Collector('history', self.record_history,
+                                        self.config["history"]["interval"], timeout=5))
+        reload_config = self.config["config_reload"]
+        if reload_config["enabled"]:
+            collectors.append(Collector('config', self.check_config,
+                                        reload_config["interval"], timeout=5,
+                                        on_result=self.on_config))
+        return collectors + [
+            Collector('system', self.get_system_metrics, sampler_config["interval"],
+                      timeout=max(2.0, sampler_config["interval"] * 2))
+        ]
     
     def run_monitor(self, update_interval=None):
         """Main monitoring loop"""
         if update_interval is None:
             update_interval = self.config["update_interval"]
             
+        self.update_interval = update_interval
         self.startup_sequence()
         
+        self.collectors = self.build_collectors(update_interval)
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, self.request_reload)
+        scheduler = MonitorScheduler(self, self.collectors, fps=self.config["animation_fps"])
+        
+        exporter = None
+        metrics_config = self.config["metrics"]
+        if metrics_config["enabled"]:
+            exporter = MetricsExporter(self, metrics_config["host"], metrics_config["port"])
+            exporter.start()
+        dashboard_config = self.config["dashboard"]
+        if dashboard_config["enabled"]:
+            self.dashboard = DashboardServer(self, dashboard_config["host"], dashboard_config["port"],
+                                             backlog=dashboard_config["backlog"],
+                                             metrics_interval=dashboard_config["metrics_interval"],
+                                             page=self.data_path(dashboard_config["page"]),
+                                             talker_names=self.config["top_talkers"]["expose_names"])
+            self.dashboard.start()
+        control_config = self.config["control"]
+        if control_config["enabled"] and hasattr(socket, 'AF_UNIX'):
+            self.control = ControlServer(self, self.data_path(control_config["path"]))
+        
         try:
-            while True:
-                print(f"\n--- Update at {time.strftime('%H:%M:%S')} ---")
-                
-                # Get data
-                pihole_data = self.get_pihole_status()
-                system_data = self.get_system_metrics()
-                
-                # Display status
-                if pihole_data:
-                    print(f"Pi-hole: {pihole_data['status']} | "
-                          f"Queries: {pihole_data['queries_today']} | "
-                          f"Blocked: {pihole_data['blocked_today']} "
-                          f"({pihole_data['percent_blocked']:.1f}%)")
-                else:
-                    print("Pi-hole: ERROR - Cannot connect to API")
-                    self.error_alert()
-                
-                if system_data:
-                    print(f"System: CPU {system_data['cpu_percent']:.1f}% | "
-                          f"Memory {system_data['memory_percent']:.1f}% | "
-                          f"Temp {system_data['temperature']:.1f}°C")
-                
-                # Update display
-                self.display_pihole_status(pihole_data)
-                time.sleep(0.5)
-                self.display_system_health(system_data)
-                time.sleep(0.5)
-                self.display_network_activity(pihole_data)
-                
-                # Wait for next update
-                time.sleep(update_interval)
-                
+            asyncio.run(scheduler.run())
         except KeyboardInterrupt:
             print("\nShutting down monitor...")
         finally:
-            self.piglow.all(0)
+            sd_notify("STOPPING=1")
+            self.close()
+            if exporter:
+                exporter.stop()
+            if self.dashboard is not None:
+                self.dashboard.stop()
             print("All LEDs turned off. Goodbye!")
+    
+    def close(self):
+        """Turn the LEDs off and release every data source"""
+        self.renderer.clear()
+        self.renderer.flush()
+        for instance in self.instances:
+            instance.source.close()
+        if self.log_tail:
+            self.log_tail.close()
+        if self.history is not None:
+            self.history.close()
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.dns_probe is not None:
+            self.dns_probe.close()
+        self.sampler.close()
 
 # Additional utility functions
-def test_pihole_connection():
-    """Test if Pi-hole API is accessible"""
+def test_pihole_connection(monitor):
+    """Poll each configured Pi-hole once through the monitor's own clients"""
+    reachable = False
+    for instance in monitor.instances:
+        try:
+            data = instance.source.fetch_status(instance.timeout)
+            print(f"✓ Pi-hole {instance.name} accessible ({data['status']}, "
+                  f"{data['queries_today']} queries today)")
+            reachable = True
+        except Exception as e:
+            print(f"✗ Cannot connect to Pi-hole {instance.name}: {e}")
+    return reachable
+
+def test_piglow_hardware(monitor, flash=True):
+    """Test PiGlow hardware through the monitor's own driver"""
     try:
-        response = requests.get("http://localhost/admin/api.php", timeout=5)
-        if response.status_code == 200:
-            print("✓ Pi-hole API accessible")
-            return True
-        else:
-            print("✗ Pi-hole API returned error")
-            return False
+        # The first flush writes all 18 LEDs, so a bad bus fails here
+        monitor.renderer.fill(50 if flash else 0)
+        monitor.renderer.flush()
+        if flash:
+            time.sleep(1)
+            monitor.renderer.clear()
+            monitor.renderer.flush()
+        print("✓ PiGlow hardware accessible")
+        return True
     except Exception as e:
-        print(f"✗ Cannot connect to Pi-hole API: {e}")
+        print(f"✗ PiGlow hardware error: {e}")
         return False
 
-def test_piglow_hardware():
-    """Test PiGlow hardware"""
+def show_history(config_file=DEFAULT_CONFIG, window=None, bucket=None):
+    """Print recorded snapshots: the last `window` seconds, averaged per `bucket` seconds"""
+    history_file = "history.bin"
     try:
-        piglow = PiGlow()
-        print("✓ PiGlow hardware accessible")
-        
-        # Quick test
-        piglow.all(50)
-        time.sleep(1)
-        piglow.all(0)
-        return True
+        with open(config_file) as f:
+            history_file = json.load(f).get("history", {}).get("path", history_file)
+    except (OSError, ValueError):
+        pass
+    history_file = config_relative(config_file, history_file)
+    
+    try:
+        history = MetricHistory(history_file, readonly=True)
+    except (OSError, ValueError) as e:
+        print(f"Cannot read metric history: {e}")
+        return False
+    
+    records = history.records()
+    if window:
+        cutoff = time.time() - window
+        records = (record for record in records if record['timestamp'] >= cutoff)
+    if bucket:
+        records = downsample(records, bucket)
+    
+    def cell(value, fmt):
+        return format(value, fmt) if value is not None else format("-", ">" + fmt.split(".")[0])
+    
+    print(f"{'time':<19} {'cpu%':>6} {'mem%':>6} {'disk%':>6} {'temp':>6} "
+          f"{'q/min':>8} {'b/min':>8} {'queries':>9} {'blocked':>8} status")
+    for record in records:
+        print(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record['timestamp']))} "
+              f"{cell(record['cpu_percent'], '6.1f')} {cell(record['memory_percent'], '6.1f')} "
+              f"{cell(record['disk_percent'], '6.1f')} {cell(record['temperature'], '6.1f')} "
+              f"{cell(record['queries_per_minute'], '8.1f')} {cell(record['blocked_per_minute'], '8.1f')} "
+              f"{record['queries_today']:>9} {record['blocked_today']:>8} {record['status'] or '-'}")
+    history.close()
+    return True
+
+def replay_trace(trace_path, output=None, speed=0.0):
+    """Feed a recorded trace through the display pipeline on a virtual clock
+
+    Writes "<seconds> <18 LED values as hex>" for every frame that changed,
+    which makes two renderings of the same trace easy to diff. speed 0 runs
+    as fast as possible, N paces the replay at N times real time.
+    """
+    import gzip
+    import tempfile
+    output = output or sys.stdout
+    with gzip.open(trace_path, "rt") as f:
+        header = json.loads(f.readline())
+        events = [json.loads(line) for line in f]
+    
+    # Same display settings as the recorded session, but nothing that would
+    # touch the network, /proc or files on disk. "auto" API clients only
+    # import requests on their first poll, which replay never makes.
+    config = deep_merge(header['config'], {
+        "data_source": "api", "pihole_api_version": "auto",
+        "log_tail": {"enabled": False}, "history": {"enabled": False},
+        "metrics": {"enabled": False}, "config_reload": {"enabled": False},
+        "instrumentation": {"enabled": False}, "temperature_sensor": "none",
+        "anomaly": {"backfill": False}, "trace": {"record_path": ""}, "dns_probe": {"enabled": False}})
+    config["pihole_instances"] = [dict(instance, data_source="api", api_version="auto")
+                                  for instance in config["pihole_instances"]]
+    
+    with tempfile.TemporaryDirectory() as config_dir, contextlib.redirect_stdout(sys.stderr):
+        config_file = os.path.join(config_dir, "config.json")
+        with open(config_file, "w") as f:
+            json.dump(config, f)
+        monitor = PiHolePiGlowMonitor(config_file, piglow=HeadlessPiGlow())
+    
+    virtual_now = [0.0]
+    monitor.clock = lambda: virtual_now[0]
+    monitor.wall_clock = lambda: header['started'] + virtual_now[0]
+    for instance in monitor.instances:
+        instance.clock = monitor.clock
+    instances = {f"pihole:{instance.name}": instance for instance in monitor.instances}
+    
+    frame_period = 1.0 / config["animation_fps"]
+    anomaly_interval = config["anomaly"]["interval"]
+    frame_index = 0
+    next_anomaly = anomaly_interval
+    frames_written = 0
+    real_start = time.monotonic()
+    
+    def render_until(until):
+        """Render every frame tick before `until` (virtual seconds)"""
+        nonlocal frame_index, next_anomaly, frames_written
+        while frame_index * frame_period < until:
+            now = frame_index * frame_period
+            virtual_now[0] = now
+            if monitor.anomaly_detector is not None and now >= next_anomaly:
+                result = monitor.check_anomalies()
+                monitor.state.update('anomaly', result)
+                monitor.on_anomalies(result)
+                next_anomaly += anomaly_interval
+            if monitor.render_frame(monitor.state.snapshot(), now):
+                output.write(f"{now:.3f} {bytes(monitor.renderer.frame).hex()}\n")
+                frames_written += 1
+            if speed:
+                delay = now / speed - (time.monotonic() - real_start)
+                if delay > 0:
+                    time.sleep(delay)
+            frame_index += 1
+    
+    with contextlib.redirect_stdout(sys.stderr):
+        monitor.startup_sequence(now=0.0)
+        for offset, name, value in events:
+            render_until(offset)
+            virtual_now[0] = offset
+            monitor.state.update(name, value)
+            if name in instances:
+                monitor.on_instance_update(instances[name], value)
+        # One more tick so the last input shows up
+        render_until((events[-1][0] if events else 0.0) + frame_period)
+        monitor.close()
+    return frames_written
+
+def open_monitor():
+    """Build the monitor, or exit if the config or the PiGlow can't be used"""
+    try:
+        return PiHolePiGlowMonitor()
+    except ValueError as e:
+        # Includes config.json that isn't valid JSON
+        print(f"✗ Cannot use config.json: {e}")
+        sys.exit(1)
     except Exception as e:
         print(f"✗ PiGlow hardware error: {e}")
+        sys.exit(1)
+
+def show_stage_stats(config_file=DEFAULT_CONFIG):
+    """Print the stage timings last written by the running monitor"""
+    stats_file = "stats.json"
+    try:
+        with open(config_file) as f:
+            stats_file = json.load(f).get("instrumentation", {}).get("stats_file", stats_file)
+    except (OSError, ValueError):
+        pass
+    stats_file = config_relative(config_file, stats_file)
+    
+    try:
+        with open(stats_file) as f:
+            stats = json.load(f)
+    except FileNotFoundError:
+        print(f"No stage timings in {stats_file}; set instrumentation.enabled in config.json")
         return False
+    
+    print(f"Stage timings since {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(stats['since']))}, "
+          f"written {time.strftime('%H:%M:%S', time.localtime(stats['written']))}")
+    print(format_stage_table(stats['stages']))
+    return True
+
+def control_path(config_file=DEFAULT_CONFIG):
+    """Control socket path from the config, the default if it can't be read"""
+    path = "control.sock"
+    try:
+        with open(config_file) as f:
+            path = json.load(f).get("control", {}).get("path", path)
+    except (OSError, ValueError):
+        pass
+    return config_relative(config_file, path)
+
+def control_request(path, command, timeout=5, **args):
+    """Send one command to the running monitor and return its result
+
+    Raises OSError when no monitor is listening and ValueError when the
+    monitor rejected the command.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall(json.dumps(dict(args, command=command)).encode() + b"\n")
+        with sock.makefile("rb") as f:
+            line = f.readline()
+    if not line:
+        raise OSError("monitor closed the control connection")
+    response = json.loads(line)
+    if not response["ok"]:
+        raise ValueError(response["error"])
+    return response["result"]
+
+def running_daemon(config_file=DEFAULT_CONFIG):
+    """Control socket of the running monitor, None if none answers"""
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    path = control_path(config_file)
+    try:
+        control_request(path, "ping", timeout=1)
+    except (OSError, ValueError):
+        return None
+    return path
+
+def check_daemon(path):
+    """test_pihole_connection/test_piglow_hardware, answered by the running monitor"""
+    stats = control_request(path, "stats")
+    reachable = False
+    for name, health in stats["instances"].items():
+        if health["healthy"]:
+            latency = f", {health['latency_ms']:.0f} ms" if health["latency_ms"] is not None else ""
+            print(f"✓ Pi-hole {name} accessible ({health['status']}{latency})")
+            reachable = True
+        else:
+            print(f"✗ Cannot connect to Pi-hole {name} ({health['failures']} failed polls)")
+    print(f"✓ PiGlow driven by the running monitor (pid {stats['pid']}, "
+          f"{stats['frames']} frames, {stats['led_writes']} LED writes)")
+    return reachable
+
+def show_daemon_status(path):
+    """Print what the running monitor is showing, from its in-memory state"""
+    snapshot = control_request(path, "snapshot")
+    state = snapshot["state"]
+    pihole = state.get("pihole")
+    system = state.get("system")
+    if pihole:
+        print(f"Pi-hole: {pihole['status']} | Queries: {pihole['queries_today']} | "
+              f"Blocked: {pihole['blocked_today']} ({pihole['percent_blocked']:.1f}%)")
+    else:
+        print("Pi-hole: unreachable")
+    rates = state.get("log_rates") or state.get("rates")
+    if rates:
+        print("Rate: " + " | ".join(f"{window}s {rate[0]:.0f} q/min, {rate[1]:.0f} blocked/min"
+                                     for window, rate in rates.items()))
+    dns = state.get("dns_probe")
+    if dns and dns["timeout_rate"] is not None:
+        print(f"DNS: p50 {dns['p50_ms']:.1f}ms | p95 {dns['p95_ms']:.1f}ms | "
+              f"timeouts {dns['timeout_rate'] * 100:.0f}%")
+    if system:
+        temperature = f"{system['temperature']:.1f}°C" if system["temperature"] is not None else "n/a"
+        print(f"System: CPU {system['cpu_percent']:.1f}% | Memory {system['memory_percent']:.1f}% | "
+              f"Temp {temperature}")
+    frame = snapshot["frame"]
+    if frame:
+        print("LEDs: " + " | ".join(
+            f"arm {arm} " + " ".join(f"{color}={frame[arm * 6 + i]}" for i, color in enumerate(LED_COLORS))
+            for arm in range(3)))
 
 def quick_status_check():
     """Quick one-time status display"""
-    monitor = PiHolePiGlowMonitor()
+    monitor = open_monitor()
     
-    if not test_pihole_connection():
+    if not test_pihole_connection(monitor):
         print("Please ensure Pi-hole is running and accessible")
+        monitor.close()
         return
     
-    if not test_piglow_hardware():
+    if not test_piglow_hardware(monitor, flash=False):
         print("Please check PiGlow hardware connection")
+        monitor.close()
         return
     
     pihole_data = monitor.get_pihole_status()
     system_data = monitor.get_system_metrics()
     
     # Show status for 10 seconds
-    monitor.display_pihole_status(pihole_data)
-    monitor.display_system_health(system_data)
-    monitor.display_network_activity(pihole_data)
+    monitor.render_frame({'pihole': pihole_data, 'system': system_data}, time.monotonic())
     
     print("Status displayed for 10 seconds...")
     time.sleep(10)
-    monitor.piglow.all(0)
+    monitor.close()
 
 if __name__ == "__main__":
     import sys
     
     if len(sys.argv) > 1:
-        if sys.argv[1] == "test":
+        # While the service runs it owns the PiGlow and the API sessions;
+        # test/check/status ask it over the control socket instead
+        daemon = running_daemon() if sys.argv[1] in ("test", "check", "status", "stats") else None
+        if sys.argv[1] == "test" and daemon:
+            check_daemon(daemon)
+            control_request(daemon, "test")
+            print("Test pattern playing on the running monitor")
+            show_daemon_status(daemon)
+        elif sys.argv[1] == "test":
             # Quick test mode
             quick_status_check()
+        elif sys.argv[1] == "check" and daemon:
+            print("Checking the running monitor...")
+            check_daemon(daemon)
         elif sys.argv[1] == "check":
             # Check dependencies
             print("Checking system requirements...")
-            test_pihole_connection()
-            test_piglow_hardware()
+            monitor = open_monitor()
+            test_pihole_connection(monitor)
+            test_piglow_hardware(monitor)
+            monitor.close()
+        elif sys.argv[1] == "status":
+            if not daemon:
+                print("Monitor is not running")
+                sys.exit(3)
+            show_daemon_status(daemon)
+        elif sys.argv[1] in ("brightness", "mode", "refresh"):
+            # Runtime changes to the running monitor, kept until it restarts
+            args = {}
+            if sys.argv[1] == "brightness" and len(sys.argv) > 2:
+                args = {"value": float(sys.argv[2])}
+            elif sys.argv[1] == "mode" and len(sys.argv) > 3:
+                args = {"name": sys.argv[2], "enabled": sys.argv[3] == "on"}
+            try:
+                print(json.dumps(control_request(control_path(), sys.argv[1], **args)))
+            except OSError as e:
+                print(f"Monitor is not running ({e})")
+                sys.exit(3)
+            except ValueError as e:
+                print(f"Rejected: {e}")
+                sys.exit(1)
+        elif sys.argv[1] == "stats":
+            # Stage timings from the running monitor: live over the control
+            # socket, else as last written to the stats file
+            stages = control_request(daemon, "stats")["stages"] if daemon else None
+            if stages:
+                print(format_stage_table(stages))
+            else:
+                show_stage_stats()
+        elif sys.argv[1] == "record" and len(sys.argv) > 2:
+            # Full monitoring mode, recording the inputs for replay
+            monitor = open_monitor()
+            if monitor.recorder is not None:
+                # trace.record_path already opened one; the command line wins.
+                # Closing it leaves a valid (empty) trace instead of a cut-off gzip.
+                print(f"Recording to {sys.argv[2]} instead of trace.record_path")
+                monitor.recorder.close()
+            monitor.recorder = TraceRecorder(sys.argv[2], monitor.config)
+            monitor.run_monitor()
+        elif sys.argv[1] == "replay" and len(sys.argv) > 2:
+            # Trace through the display pipeline, frames to stdout
+            speed = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+            frames = replay_trace(sys.argv[2], speed=speed)
+            print(f"{frames} frames", file=sys.stderr)
+        elif sys.argv[1] == "history":
+            # Recorded snapshots: [last N seconds] [bucket seconds]
+            window = float(sys.argv[2]) if len(sys.argv) > 2 else None
+            bucket = float(sys.argv[3]) if len(sys.argv) > 3 else None
+            show_history(window=window, bucket=bucket)
         else:
-            print("Usage: python3 pihole_monitor.py [test|check]")
+            print("Usage: python3 pihole_monitor.py [test|check|status|stats|history [seconds] [bucket]|"
+                  "record <trace>|replay <trace> [speed]|brightness <scale>|mode <name> on|off|refresh]")
     else:
-        # Full monitoring mode
-        monitor = PiHolePiGlowMonitor()
-        
-        # Test connection first
-        if test_pihole_connection() and test_piglow_hardware():
+        # Full monitoring mode. The hardware check is the first (blank)
+        # frame; Pi-hole problems show up on the status arm from the first
+        # poll instead of holding up startup
+        monitor = open_monitor()
+        if test_piglow_hardware(monitor, flash=False):
             monitor.run_monitor()
         else:
-            print("Cannot start monitor - check Pi-hole and PiGlow")
+            print("Cannot start monitor - check PiGlow")
             sys.exit(1)
\ No newline at end of file
@@ -0,0 +1,153 @@
+"""Shared fixtures: local stand-in servers, a DNS resolver and a PiGlow that records writes"""
+
+import json
+import os
+import socket
+import struct
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+class JSONHandler(BaseHTTPRequestHandler):
+    """Base handler for stand-in APIs: answer with send_json()"""
+
+    protocol_version = "HTTP/1.1"
+
+    def send_json(self, code, body):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length)) if length else None
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def serve():
+    """serve(handler_class) -> running server on a free localhost port"""
+    servers = []
+
+    def start(handler_class):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+        server.daemon_threads = True
+        # Clients that gave up on a slow handler are expected; keep it quiet
+        server.handle_error = lambda request, client_address: None
+        server.calls = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+class FakePiGlow:
+    """Records LED writes instead of talking to the I2C bus"""
+
+    def __init__(self):
+        self.values = [0] * 18
+
+    def led(self, index, value):
+        self.values[index] = value
+
+    def all(self, value):
+        self.values = [value] * 18
+
+
+@pytest.fixture
+def piglow():
+    return FakePiGlow()
+
+
+class FakeResolver:
+    """Stand-in DNS server on a free localhost UDP port
+
+    Answers A queries with 192.0.2.1 unless `modes` maps the name (or, for
+    the probe's uncached queries, the name without its random first label)
+    to one of: "zero" (0.0.0.0), "nxdomain", "wrong_txid", "garbage",
+    "truncated" (TC set, answer cut off). `delays` maps names the same way
+    to seconds before answering.
+    """
+
+    def __init__(self, modes=None, delays=None):
+        self.modes = modes or {}
+        self.delays = delays or {}
+        self.queries = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def lookup(self, table, name):
+        return table.get(name, table.get(name.partition(".")[2]))
+
+    def reply(self, query, client, name):
+        txid = struct.unpack_from("!H", query)[0]
+        question = query[12:query.index(b"\x00", 12) + 5]
+        mode = self.lookup(self.modes, name)
+        if mode == "garbage":
+            packet = b"\xff"
+        elif mode == "nxdomain":
+            packet = struct.pack("!6H", txid, 0x8183, 1, 0, 0, 0) + question
+        elif mode == "truncated":
+            packet = struct.pack("!6H", txid, 0x8380, 1, 1, 0, 0) + question + b"\xc0\x0c\x00"
+        else:
+            if mode == "wrong_txid":
+                txid ^= 0xFFFF
+            address = "0.0.0.0" if mode == "zero" else "192.0.2.1"
+            packet = (struct.pack("!6H", txid, 0x8180, 1, 1, 0, 0) + question
+                      + struct.pack("!HHHIH", 0xC00C, 1, 1, 60, 4) + socket.inet_aton(address))
+        try:
+            self.sock.sendto(packet, client)
+        except OSError:
+            pass
+
+    def serve(self):
+        while True:
+            try:
+                query, client = self.sock.recvfrom(512)
+            except OSError:
+                return
+            self.queries += 1
+            labels, offset = [], 12
+            while query[offset]:
+                labels.append(query[offset + 1:offset + 1 + query[offset]].decode())
+                offset += query[offset] + 1
+            name = ".".join(labels)
+            delay = self.lookup(self.delays, name)
+            if delay:
+                threading.Timer(delay, self.reply, (query, client, name)).start()
+            else:
+                self.reply(query, client, name)
+
+    def close(self):
+        self.sock.close()
+
+
+@pytest.fixture
+def resolver():
+    """resolver(modes, delays) -> running FakeResolver"""
+    resolvers = []
+
+    def start(modes=None, delays=None):
+        fake = FakeResolver(modes, delays)
+        resolvers.append(fake)
+        return fake
+
+    yield start
+    for fake in resolvers:
+        fake.close()
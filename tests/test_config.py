@@ -0,0 +1,67 @@
+"""Config loading: bad display settings fall back per key, reloads never half-apply"""
+
+import json
+
+import pytest
+
+import pihole_monitor
+
+
+@pytest.fixture
+def make_monitor(tmp_path, monkeypatch, piglow):
+    monkeypatch.chdir(tmp_path)
+    config_file = tmp_path / "config.json"
+
+    def make(config):
+        if isinstance(config, str):
+            config_file.write_text(config)
+        else:
+            config_file.write_text(json.dumps(config))
+        return pihole_monitor.PiHolePiGlowMonitor(str(config_file), piglow=piglow)
+
+    make.config_file = config_file
+    return make
+
+
+def test_invalid_display_key_keeps_the_rest(make_monitor):
+    monitor = make_monitor({
+        "pihole_api_url": "http://192.0.2.10/admin/api.php",
+        "pihole_password": "secret",
+        "colors": {"cpu_usage": "purple", "memory_usage": "red"},
+        "temperature_sensor": "none"
+    })
+    config = monitor.config
+    assert config["pihole_api_url"] == "http://192.0.2.10/admin/api.php"
+    assert config["pihole_password"] == "secret"
+    assert config["colors"]["cpu_usage"] == "blue"
+    assert config["colors"]["memory_usage"] == "red"
+    monitor.close()
+
+
+def test_duplicate_arm_resets_mapping(make_monitor):
+    monitor = make_monitor({"led_mapping": {"pihole_status_arm": 1}, "temperature_sensor": "none"})
+    assert sorted(monitor.config["led_mapping"].values()) == [0, 1, 2]
+    monitor.close()
+
+
+def test_unparseable_file_refuses_to_start(make_monitor):
+    with pytest.raises(ValueError):
+        make_monitor('{"pihole_api_url": ')
+
+
+def test_reload_of_deleted_file_keeps_settings(make_monitor):
+    monitor = make_monitor({"brightness_scale": 0.5, "temperature_sensor": "none"})
+    plan = monitor.plan
+    make_monitor.config_file.unlink()
+    assert monitor.reload_config() is False
+    assert monitor.plan is plan
+    assert monitor.config["brightness_scale"] == 0.5
+    monitor.close()
+
+
+def test_reload_rejects_invalid_file(make_monitor):
+    monitor = make_monitor({"temperature_sensor": "none"})
+    make_monitor.config_file.write_text(json.dumps({"gamma": -1}))
+    assert monitor.reload_config() is False
+    assert monitor.config["gamma"] == 1.0
+    monitor.close()
@@ -0,0 +1,53 @@
+"""CounterRing rates across midnight resets of the daily counters"""
+
+import pytest
+
+import pihole_monitor
+
+
+def test_steady_counter_gives_steady_rate():
+    ring = pihole_monitor.CounterRing(64, windows=(60,))
+    assert ring.rate(60) is None
+    for step in range(20):
+        ring.add(step * 10.0, 1000 + step * 10)
+    assert ring.rate(60) == pytest.approx(60.0)
+
+
+def test_midnight_reset_keeps_the_rate_sensible():
+    ring = pihole_monitor.CounterRing(64, windows=(60, 300))
+    raw = 50000
+    rates = []
+    for step in range(60):
+        if step == 30:
+            # 00:00: the daily counter starts over; 10 queries since
+            raw = 10
+        else:
+            raw += 10
+        ring.add(step * 10.0, raw)
+        if step >= 1:
+            rates.append((ring.rate(60), ring.rate(300)))
+
+    for short, long in rates:
+        assert 0 <= short <= 120
+        assert 0 <= long <= 120
+    # Right after the reset and once the windows are past it: still ~60/min
+    assert rates[29][0] == pytest.approx(60.0)
+    assert rates[-1] == (pytest.approx(60.0), pytest.approx(60.0))
+
+
+def test_reset_at_low_traffic_is_not_a_spike():
+    ring = pihole_monitor.CounterRing(64, windows=(60,))
+    ring.add(0.0, 40)
+    ring.add(10.0, 42)
+    ring.add(20.0, 1)
+    ring.add(30.0, 3)
+    assert 0 <= ring.rate(60) <= 12 * 60 / 30
+
+
+def test_rolling_counter_dip_reads_as_no_traffic():
+    ring = pihole_monitor.CounterRing(64, windows=(60,))
+    ring.add(0.0, 1000)
+    ring.add(10.0, 990)
+    assert ring.rate(60) == 0.0
+    ring.add(20.0, 1000)
+    assert ring.rate(60) == pytest.approx(30.0)
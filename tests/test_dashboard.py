@@ -0,0 +1,127 @@
+"""DashboardServer SSE stream read with a local HTTP client"""
+
+import http.client
+import json
+import socket
+import time
+
+import pytest
+
+import pihole_monitor
+
+LED_COUNT = pihole_monitor.LED_COUNT
+
+
+@pytest.fixture
+def dashboard():
+    """Dashboard on a free localhost port with a short keepalive"""
+    servers = []
+
+    def start(**kwargs):
+        kwargs.setdefault("keepalive", 2)
+        server = pihole_monitor.DashboardServer(None, "127.0.0.1", 0, page="/nonexistent", **kwargs)
+        server.start()
+        server.port = server.server.server_port
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def connect(server, last_event_id=None):
+    conn = http.client.HTTPConnection("127.0.0.1", server.port, timeout=5)
+    headers = {"Last-Event-ID": str(last_event_id)} if last_event_id is not None else {}
+    conn.request("GET", "/events", headers=headers)
+    response = conn.getresponse()
+    assert response.status == 200
+    assert response.getheader("Content-Type") == "text/event-stream"
+    return response
+
+
+def read_event(response):
+    """Next (id, event, data) from the stream, skipping keepalives"""
+    fields = {}
+    while True:
+        line = response.fp.readline().decode().rstrip("\n")
+        if line:
+            if not line.startswith(":"):
+                name, _, value = line.partition(": ")
+                fields[name] = value
+        elif fields:
+            return int(fields["id"]), fields["event"], json.loads(fields["data"])
+
+
+def frame(*lit):
+    values = bytearray(LED_COUNT)
+    for index, value in lit:
+        values[index] = value
+    return bytes(values)
+
+
+def test_first_event_is_a_full_snapshot(dashboard):
+    server = dashboard()
+    server.publish_frame(frame((0, 10), (5, 200)))
+    server.publish_state({"pihole": {"status": "enabled"}, "system": {"cpu_percent": 12.5}}, 1, 0.0)
+
+    seq, event, data = read_event(connect(server))
+    assert (seq, event) == (server.seq, "snapshot")
+    assert data["frame"] == list(frame((0, 10), (5, 200)))
+    assert data["metrics"]["pihole"] == {"status": "enabled"}
+    assert data["metrics"]["system"] == {"cpu_percent": 12.5}
+
+
+def test_deltas_carry_only_changes(dashboard):
+    server = dashboard(metrics_interval=0)
+    server.publish_frame(frame((0, 10)))
+    server.publish_state({"pihole": {"status": "enabled"}, "system": {"cpu_percent": 1.0}}, 1, 0.0)
+    response = connect(server)
+    assert read_event(response)[1] == "snapshot"
+
+    server.publish_frame(frame((0, 10), (7, 99)))
+    server.publish_frame(frame((0, 10), (7, 99)))
+    server.publish_state({"pihole": {"status": "enabled"}, "system": {"cpu_percent": 2.0}}, 2, 1.0)
+
+    assert read_event(response)[1:] == ("frame", {"leds": [[7, 99]]})
+    assert read_event(response)[1:] == ("metrics", {"system": {"cpu_percent": 2.0}})
+
+
+def test_stale_last_event_id_gets_a_resync_snapshot(dashboard):
+    server = dashboard(backlog=4)
+    for value in range(1, 11):
+        server.publish_frame(frame((1, value)))
+
+    seq, event, data = read_event(connect(server, last_event_id=2))
+    assert (seq, event) == (10, "snapshot")
+    assert data["frame"][1] == 10
+    assert server.resyncs == 1
+
+    # An id from before a restart (ahead of the server) also resyncs
+    assert read_event(connect(server, last_event_id=500))[1] == "snapshot"
+    # One still in the backlog gets only what it missed
+    seq, event, data = read_event(connect(server, last_event_id=8))
+    assert (seq, event, data) == (9, "frame", {"leds": [[1, 9]]})
+
+
+def test_client_that_never_reads_blocks_nothing(dashboard):
+    server = dashboard(metrics_interval=0)
+    stuck = socket.socket()
+    stuck.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    stuck.connect(("127.0.0.1", server.port))
+    stuck.sendall(b"GET /events HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    reader = connect(server)
+    assert read_event(reader)[1] == "snapshot"
+
+    # Far more than the stuck client's socket buffers can take
+    start = time.monotonic()
+    for version in range(1, 101):
+        server.publish_frame(frame((version % LED_COUNT, version)))
+        server.publish_state({"system": {"blob": "x" * 50000, "version": version}}, version, version)
+    assert time.monotonic() - start < 1.0
+
+    seen = 0
+    while seen != server.seq:
+        seen = read_event(reader)[0]
+    assert server.clients == 2
+    stuck.close()
@@ -0,0 +1,101 @@
+"""DNSProbe against a local stand-in resolver"""
+
+import socket
+import struct
+
+import pytest
+
+import pihole_monitor
+
+
+def probe_for(fake, names, timeout=0.3):
+    return pihole_monitor.DNSProbe("127.0.0.1", fake.port, names, timeout=timeout)
+
+
+def test_reply_with_wrong_id_is_ignored(resolver):
+    fake = resolver({"spoofed.example": "wrong_txid"})
+    probe = probe_for(fake, {"cached": ["ok.example", "spoofed.example"]})
+    summary = probe.probe()
+    assert summary["timeouts"] == 1
+    assert summary["kinds"]["cached"]["timeout_rate"] == 0.5
+    assert probe.late == 1
+    probe.close()
+
+
+def test_latency_percentiles_per_kind(resolver):
+    fake = resolver(delays={"slow.example": 0.05})
+    probe = probe_for(fake, {"cached": ["fast.example"], "uncached": ["slow.example"]}, timeout=1.0)
+    for _ in range(5):
+        summary = probe.probe()
+    kinds = summary["kinds"]
+    assert kinds["cached"]["p95_ms"] < 40
+    assert 45 <= kinds["uncached"]["p50_ms"] < 500
+    assert summary["timeout_rate"] == 0.0
+    assert summary["p50_ms"] <= summary["p95_ms"]
+    probe.close()
+
+
+def test_uncached_names_get_a_fresh_label(resolver):
+    fake = resolver()
+    probe = probe_for(fake, {"uncached": ["example.org"]})
+    probe.probe()
+    probe.probe()
+    assert fake.queries == 2
+    assert probe.summary()["kinds"]["uncached"]["timeout_rate"] == 0.0
+    probe.close()
+
+
+def test_dead_port_times_out():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    probe = pihole_monitor.DNSProbe("127.0.0.1", port, {"cached": ["a.example", "b.example"]},
+                                    timeout=0.2)
+    for _ in range(2):
+        summary = probe.probe()
+    assert summary["timeout_rate"] == 1.0
+    # Port unreachable from one send can surface on the next one instead
+    assert summary["timeouts"] + summary["errors"] == 4
+    assert summary["kinds"]["cached"]["count"] == 0
+    probe.close()
+
+
+def test_blocking_rate(resolver):
+    fake = resolver({"zero.example": "zero", "nx.example": "nxdomain"})
+    probe = probe_for(fake, {"blocked": ["zero.example", "nx.example", "leaks.example"]})
+    summary = probe.probe()
+    assert summary["blocking_rate"] == pytest.approx(2 / 3)
+    assert summary["timeouts"] == 0
+    probe.close()
+
+
+@pytest.mark.parametrize("mode", ["garbage", "truncated"])
+def test_unusable_reply_is_an_error_not_a_block(resolver, mode):
+    fake = resolver({"bad.example": mode})
+    probe = probe_for(fake, {"blocked": ["bad.example"], "cached": ["ok.example"]})
+    summary = probe.probe()
+    assert summary["errors"] == 1
+    assert summary["blocking_rate"] is None
+    assert summary["kinds"]["blocked"]["timeout_rate"] == 1.0
+    assert summary["kinds"]["cached"]["timeout_rate"] == 0.0
+    probe.close()
+
+
+def test_truncated_reply_settles_its_query_at_once(resolver):
+    fake = resolver({"bad.example": "truncated"})
+    probe = probe_for(fake, {"cached": ["bad.example"]}, timeout=5)
+    summary = probe.probe()
+    # Counted as an error when it arrived, not as a timeout after 5 s
+    assert summary["timeouts"] == 0
+    assert summary["errors"] == 1
+
+
+def test_parse_rejects_malformed_packets():
+    with pytest.raises(ValueError):
+        pihole_monitor.parse_dns_response(b"\x00")
+    query = pihole_monitor.encode_dns_query(7, "example.com")
+    with pytest.raises(ValueError, match="not a DNS response"):
+        pihole_monitor.parse_dns_response(query)
+    cut = struct.pack("!6H", 7, 0x8180, 1, 1, 0, 0) + query[12:] + b"\xc0\x0c\x00\x01"
+    with pytest.raises(ValueError, match="malformed"):
+        pihole_monitor.parse_dns_response(cut)
@@ -0,0 +1,188 @@
+"""Fleet polling with one slow and one dead Pi-hole behind local stand-ins"""
+
+import asyncio
+import json
+import socket
+import time
+
+import pytest
+
+pytest.importorskip("requests")
+
+import pihole_monitor
+from conftest import JSONHandler
+
+
+class FakeV5(JSONHandler):
+    """api.php whose counters grow by 10 queries per request"""
+
+    def do_GET(self):
+        server = self.server
+        server.calls.append(self.path)
+        if server.delay:
+            time.sleep(server.delay)
+        queries = server.queries = server.queries + 10
+        self.send_json(200, {"status": server.status, "domains_being_blocked": 1000,
+                             "dns_queries_today": queries, "ads_blocked_today": queries // 10,
+                             "ads_percentage_today": 10.0, "unique_clients": 3})
+
+
+@pytest.fixture
+def fake_pihole(serve):
+    def start(status="enabled", queries=0, delay=0):
+        server = serve(FakeV5)
+        server.status = status
+        server.queries = queries
+        server.delay = delay
+        server.url = f"http://127.0.0.1:{server.server_port}/admin/api.php"
+        return server
+    return start
+
+
+@pytest.fixture
+def dead_url():
+    """A localhost port nothing listens on"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}/admin/api.php"
+
+
+@pytest.fixture
+def fleet_monitor(tmp_path, monkeypatch, piglow):
+    monkeypatch.chdir(tmp_path)
+    monitors = []
+
+    def make(instances):
+        config_file = tmp_path / "config.json"
+        config_file.write_text(json.dumps({
+            "pihole_instances": [dict(instance, api_version=5, timeout=0.5)
+                                 for instance in instances],
+            "polling": {"adaptive": False, "min_interval": 1, "jitter": 0},
+            "features": {"enable_startup_sequence": False}
+        }))
+        monitor = pihole_monitor.PiHolePiGlowMonitor(str(config_file), piglow=piglow)
+        monitors.append(monitor)
+        return monitor
+
+    yield make
+    for monitor in monitors:
+        monitor.close()
+
+
+def run_pihole_collectors(monitor, seconds, on_update):
+    """Run only the Pi-hole collectors on the real scheduler for a while"""
+    monitor.update_interval = 1
+    collectors = [collector for collector in monitor.build_collectors(1)
+                  if collector.name.startswith("pihole:")]
+    for collector in collectors:
+        callback = collector.on_result
+        collector.on_result = lambda data, callback=callback: (callback(data), on_update())
+    scheduler = pihole_monitor.MonitorScheduler(monitor, collectors, fps=5)
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(asyncio.wait_for(scheduler.run(), seconds))
+
+
+def test_healthy_instance_keeps_updating(fleet_monitor, fake_pihole, dead_url):
+    healthy = fake_pihole()
+    slow = fake_pihole(delay=5)
+    monitor = fleet_monitor([{"name": "healthy", "url": healthy.url},
+                             {"name": "slow", "url": slow.url},
+                             {"name": "dead", "url": dead_url}])
+    merged = []
+    run_pihole_collectors(monitor, 3.5, lambda: merged.append(monitor.state.snapshot()['pihole']))
+
+    by_name = {instance.name: instance for instance in monitor.instances}
+    # Polled about once a second while the slow one never answered
+    assert by_name["healthy"].polls >= 3
+    assert by_name["healthy"].healthy
+    assert not by_name["slow"].healthy
+    assert not by_name["dead"].healthy
+    # The dead instance can report before the healthy one's first answer;
+    # from then on the fleet always has data, with the worst status
+    first = next(index for index, data in enumerate(merged) if data)
+    assert all(merged[first:])
+    assert {data['status'] for data in merged[first:]} == {'error'}
+
+
+def test_outage_keeps_totals(fleet_monitor, fake_pihole):
+    primary = fake_pihole(queries=1000)
+    secondary = fake_pihole(queries=500)
+    monitor = fleet_monitor([{"name": "primary", "url": primary.url},
+                             {"name": "secondary", "url": secondary.url}])
+    totals = []
+
+    def on_update():
+        totals.append(monitor.state.snapshot()['pihole']['queries_today'])
+        if len(totals) == 4:
+            # The secondary stops answering within its timeout from here on
+            secondary.delay = 5
+
+    run_pihole_collectors(monitor, 4.5, on_update)
+
+    secondary_instance = monitor.instances[1]
+    assert not secondary_instance.healthy
+    assert secondary_instance.data['queries_today'] >= 510
+    assert monitor.state.snapshot()['pihole']['status'] == 'error'
+    assert len(totals) > 6
+    assert totals == sorted(totals)
+
+
+@pytest.mark.parametrize("statuses, worst", [
+    (("enabled", "enabled"), "enabled"),
+    (("enabled", "disabled"), "disabled"),
+    (("disabled", None), "error"),
+])
+def test_merge_fleet_reports_worst_status(statuses, worst):
+    instances = []
+    for index, status in enumerate(statuses):
+        instance = pihole_monitor.PiHoleInstance(f"pihole{index}", None, 1, clock=lambda: 100.0)
+        instance.record({"status": status or "enabled", "domains_blocked": 10,
+                         "queries_today": 100, "blocked_today": 10, "clients": 2})
+        if status is None:
+            instance.record(None)
+        instances.append(instance)
+
+    merged = pihole_monitor.merge_fleet(instances)
+    assert merged['status'] == worst
+    assert merged['queries_today'] == 200
+
+
+class HungSource:
+    """Data source whose request outlives every timeout"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def fetch_status(self, timeout=None):
+        time.sleep(self.seconds)
+        return None
+
+    def close(self):
+        pass
+
+
+def test_one_shot_status_does_not_wait_for_a_hung_instance(fleet_monitor, fake_pihole, dead_url):
+    healthy = fake_pihole()
+    monitor = fleet_monitor([{"name": "healthy", "url": healthy.url},
+                             {"name": "dead", "url": dead_url},
+                             {"name": "hung", "url": healthy.url}])
+    by_name = {instance.name: instance for instance in monitor.instances}
+    by_name["hung"].source = HungSource(5)
+    recorded = {}
+    start = time.monotonic()
+    for instance in monitor.instances:
+        record = instance.record
+        instance.record = lambda data, name=instance.name, record=record: (
+            recorded.setdefault(name, time.monotonic() - start), record(data))
+
+    merged = monitor.get_pihole_status()
+    elapsed = time.monotonic() - start
+
+    # timeout 0.5: the hung instance is given up on after 2 s, not 5
+    assert elapsed < 3
+    assert recorded["dead"] < 1
+    assert recorded["healthy"] < 1
+    assert set(recorded) == {"healthy", "dead", "hung"}
+    assert merged["status"] == "error"
+    assert merged["queries_today"] == 10
@@ -0,0 +1,139 @@
+"""FTLDatabaseSource against a generated pihole-FTL.db"""
+
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+import pihole_monitor
+
+
+class FakeClock(datetime):
+    """datetime whose now() the test moves forward"""
+    current = datetime(2026, 3, 14, 12, 0, 0)
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.current
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    FakeClock.current = datetime(2026, 3, 14, 12, 0, 0)
+    monkeypatch.setattr(pihole_monitor, "datetime", FakeClock)
+    return FakeClock
+
+
+@pytest.fixture
+def ftl(tmp_path, clock):
+    """Writable FTL database plus a source reading it read-only"""
+    db_path = tmp_path / "pihole-FTL.db"
+    db = sqlite3.connect(db_path)
+    db.execute("CREATE TABLE queries (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp INTEGER, "
+               "type INTEGER, status INTEGER, domain TEXT, client TEXT, forward TEXT)")
+    db.commit()
+
+    gravity = sqlite3.connect(tmp_path / "gravity.db")
+    gravity.execute("CREATE TABLE info (property TEXT PRIMARY KEY, value TEXT)")
+    gravity.execute("INSERT INTO info VALUES ('gravity_count', '123456')")
+    gravity.commit()
+    gravity.close()
+
+    def add(status, client="192.168.1.10", domain="example.com", at=None):
+        at = at or clock.current
+        db.execute("INSERT INTO queries (timestamp, type, status, domain, client) VALUES (?, 1, ?, ?, ?)",
+                   (int(at.timestamp()), status, domain, client))
+        db.commit()
+
+    source = pihole_monitor.FTLDatabaseSource(str(db_path), str(tmp_path / "gravity.db"),
+                                              str(tmp_path / "setupVars.conf"),
+                                              str(tmp_path / "pihole.toml"))
+    source.add = add
+    source.dir = tmp_path
+    yield source
+    source.close()
+    db.close()
+
+
+def test_only_new_rows_are_read(ftl):
+    ftl.add(2)
+    ftl.add(3, client="192.168.1.11")
+    status = ftl.fetch_status()
+    assert status['queries_today'] == 2
+    assert status['clients'] == 2
+    assert status['domains_blocked'] == 123456
+    assert ftl.rows_read == 2
+
+    status = ftl.fetch_status()
+    assert status['new_queries'] == 0
+    assert ftl.rows_read == 2
+
+    ftl.add(1)
+    status = ftl.fetch_status()
+    assert status['new_queries'] == 1
+    assert status['queries_today'] == 3
+    assert ftl.rows_read == 3
+
+
+def test_rows_before_midnight_are_skipped(ftl, clock):
+    ftl.add(2, at=clock.current - timedelta(days=1))
+    ftl.add(2)
+    assert ftl.fetch_status()['queries_today'] == 1
+
+
+def test_midnight_resets_totals(ftl, clock):
+    ftl.add(2)
+    ftl.add(1)
+    assert ftl.fetch_status()['queries_today'] == 2
+
+    clock.current = datetime(2026, 3, 15, 0, 0, 30)
+    ftl.add(3, client="192.168.1.20")
+    status = ftl.fetch_status()
+    assert ftl.day == clock.current.date()
+    assert status['queries_today'] == 1
+    assert status['blocked_today'] == 0
+    assert status['cached_today'] == 1
+    assert status['clients'] == 1
+
+
+@pytest.mark.parametrize("code, bucket", [
+    (1, 'blocked'), (4, 'blocked'), (5, 'blocked'), (9, 'blocked'), (16, 'blocked'),
+    (2, 'forwarded'), (14, 'forwarded'),
+    (3, 'cached'), (17, 'cached'),
+])
+def test_status_codes_are_classified(ftl, code, bucket):
+    ftl.add(code)
+    status = ftl.fetch_status()
+    counts = {'blocked': status['blocked_today'],
+              'forwarded': status['forwarded_today'],
+              'cached': status['cached_today']}
+    assert counts == {key: int(key == bucket) for key in counts}
+    assert status['queries_today'] == 1
+
+
+def test_unknown_status_only_counts_as_query(ftl):
+    ftl.add(0)
+    status = ftl.fetch_status()
+    assert status['queries_today'] == 1
+    assert status['blocked_today'] == status['forwarded_today'] == status['cached_today'] == 0
+
+
+def test_blocking_status_from_v5_setup_vars(ftl):
+    (ftl.dir / "setupVars.conf").write_text("PIHOLE_INTERFACE=eth0\nBLOCKING_ENABLED=false\n")
+    assert ftl.fetch_status()['status'] == 'disabled'
+
+
+def test_blocking_status_from_v6_toml(ftl):
+    (ftl.dir / "pihole.toml").write_text(
+        "[dns]\n"
+        "  upstreams = [\"1.1.1.1\"]\n"
+        "  [dns.blocking]\n"
+        "    active = false ### CHANGED, default = true\n"
+        "    mode = \"NULL\"\n"
+        "[webserver]\n"
+        "  active = true\n")
+    assert ftl.fetch_status()['status'] == 'disabled'
+
+
+def test_blocking_status_without_either_file(ftl):
+    assert ftl.fetch_status()['status'] == 'enabled'
@@ -0,0 +1,37 @@
+"""Metric history: appends batch in memory until flush, the ring survives a restart"""
+
+import pihole_monitor
+
+
+def append(history, timestamp):
+    history.append(timestamp, {"cpu_percent": 1.0}, {"status": "enabled", "queries_today": timestamp}, None)
+
+
+def test_appends_reach_the_file_only_on_flush(tmp_path):
+    path = str(tmp_path / "history.bin")
+    now = [0.0]
+    history = pihole_monitor.MetricHistory(path, capacity=10, flush_interval=60, clock=lambda: now[0])
+    before = (tmp_path / "history.bin").read_bytes()
+    for second in range(0, 60, 10):
+        now[0] = second
+        append(history, second)
+    assert (tmp_path / "history.bin").read_bytes() == before
+    assert len(pihole_monitor.MetricHistory(path, readonly=True)) == 0
+
+    now[0] = 60
+    append(history, 60)
+    assert history.flushes == 1
+    assert len(pihole_monitor.MetricHistory(path, readonly=True)) == 7
+    history.close()
+
+
+def test_wrapped_ring_survives_reopen(tmp_path):
+    path = str(tmp_path / "history.bin")
+    history = pihole_monitor.MetricHistory(path, capacity=4, flush_interval=60, clock=lambda: 0.0)
+    for timestamp in range(6):
+        append(history, timestamp)
+    history.close()
+
+    reader = pihole_monitor.MetricHistory(path, readonly=True)
+    assert [record["timestamp"] for record in reader.records()] == [2, 3, 4, 5]
+    reader.close()
@@ -0,0 +1,16 @@
+"""Module import stays lean: optional features load their modules on use"""
+
+import os
+import subprocess
+import sys
+
+LAZY = ("sqlite3", "gzip", "tempfile", "http.server", "requests", "psutil", "numpy")
+
+
+def test_optional_modules_are_not_imported_up_front():
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    code = ("import sys, pihole_monitor; "
+            f"print(' '.join(name for name in {LAZY!r} if name in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True,
+                            text=True, check=True)
+    assert result.stdout.split() == []
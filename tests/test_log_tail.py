@@ -0,0 +1,137 @@
+"""PiholeLogTail against a synthetic pihole.log: rotation, truncation, partial lines"""
+
+import os
+
+import pytest
+
+import pihole_monitor
+
+
+def query(n, client="192.168.1.10"):
+    return f"Mar 14 12:00:00 dnsmasq[812]: query[A] host{n}.example.com from {client}\n".encode()
+
+
+def blocked(n):
+    return f"Mar 14 12:00:00 dnsmasq[812]: gravity blocked ads{n}.example.com is 0.0.0.0\n".encode()
+
+
+@pytest.fixture
+def log(tmp_path):
+    path = tmp_path / "pihole.log"
+    path.write_bytes(query(0) + query(1))
+
+    def append(data):
+        with open(path, "ab") as f:
+            f.write(data)
+
+    tail = pihole_monitor.PiholeLogTail(str(path), clock=lambda: 1000.0)
+    tail.path_obj = path
+    tail.append = append
+    # The first poll skips what is already in the file
+    assert tail.poll() == 0
+    yield tail
+    tail.close()
+
+
+def test_appended_lines_are_counted(log):
+    log.append(query(2) + blocked(3) + query(4))
+    assert log.poll() == 3
+    assert log.count('query', 10) == 2
+    assert log.count('blocked', 10) == 1
+    assert log.poll() == 0
+
+
+def test_partial_line_waits_for_its_end(log):
+    line = query(2)
+    log.append(line[:20])
+    assert log.poll() == 0
+    log.append(line[20:40])
+    assert log.poll() == 0
+    log.append(line[40:] + query(3))
+    assert log.poll() == 2
+    assert log.lines_read == 2
+
+
+def test_rename_rotation_drains_old_file_then_reads_new(log):
+    path = log.path_obj
+    log.append(query(2))
+    os.rename(path, str(path) + ".1")
+    path.write_bytes(query(3) + query(4))
+    assert log.poll() == 3
+    assert log.rotations == 1
+
+    log.append(query(5))
+    assert log.poll() == 1
+
+
+def test_rotated_away_without_new_file(log):
+    path = log.path_obj
+    log.append(query(2))
+    os.rename(path, str(path) + ".1")
+    assert log.poll() == 1
+    path.write_bytes(query(3))
+    assert log.poll() == 1
+    assert log.rotations == 1
+
+
+def test_copytruncate_shorter_file(log):
+    path = log.path_obj
+    log.append(query(2) + query(3))
+    assert log.poll() == 2
+    with open(path, "r+b") as f:
+        f.truncate(0)
+    log.append(blocked(4))
+    assert log.poll() == 1
+    assert log.count('blocked', 10) == 1
+    assert log.rotations == 1
+
+
+def test_copytruncate_regrown_to_same_size(log):
+    path = log.path_obj
+    size = path.stat().st_size
+    with open(path, "r+b") as f:
+        f.truncate(0)
+    # Same length as before, different content: only the bytes give it away
+    log.append(query(8) + query(9))
+    assert path.stat().st_size == size
+    assert log.poll() == 2
+    assert log.rotations == 1
+
+
+def test_copytruncate_regrown_past_offset(log):
+    path = log.path_obj
+    with open(path, "r+b") as f:
+        f.truncate(0)
+    log.append(b"".join(query(n, client="10.0.0.1") for n in range(10, 20)))
+    assert log.poll() == 10
+    assert log.rotations == 1
+    assert log.lines_read == 10
+
+
+def test_windows_longer_than_the_history_are_complete(tmp_path):
+    path = tmp_path / "pihole.log"
+    path.write_bytes(b"")
+    now = [1000.0]
+    tail = pihole_monitor.PiholeLogTail(str(path), clock=lambda: now[0])
+    tail.poll()
+    # One query per second for ten minutes
+    with open(path, "ab") as f:
+        for n in range(600):
+            now[0] += 1
+            f.write(query(n))
+            f.flush()
+            tail.poll()
+            if n == 0:
+                tail.rates([10, 60, 300])
+
+    rates = tail.rates([10, 60, 300])
+    assert {window: qpm for window, (qpm, bpm) in rates.items()} == {10: 60.0, 60: 60.0, 300: 60.0}
+    assert tail.history == 300
+    tail.close()
+
+
+def test_growing_the_history_keeps_recent_counts(log):
+    log.append(query(2) + query(3))
+    log.poll()
+    log.cover(120)
+    assert log.count('query', 10) == 2
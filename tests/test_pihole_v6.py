@@ -0,0 +1,144 @@
+"""PiHoleV6Client and API version detection against a local fake FTL"""
+
+import pytest
+
+pytest.importorskip("requests")
+
+import pihole_monitor
+from conftest import JSONHandler
+
+SUMMARY = {
+    "queries": {"total": 100, "blocked": 25, "percent_blocked": 25.0},
+    "clients": {"active": 4},
+    "gravity": {"domains_being_blocked": 1234}
+}
+
+
+class FakeFTLv6(JSONHandler):
+    """Pi-hole v6 REST API: password "secret", one SID per login"""
+
+    def do_POST(self):
+        if self.path != "/api/auth":
+            return self.send_json(404, {"error": {"key": "not_found"}})
+        server = self.server
+        server.calls.append("login")
+        if self.read_json().get("password") != "secret":
+            return self.send_json(401, {"session": {"valid": False, "sid": None,
+                                                    "message": "password incorrect"}})
+        server.sid = f"sid{len([c for c in server.calls if c == 'login'])}"
+        self.send_json(200, {"session": {"valid": True, "sid": server.sid, "validity": 300}})
+
+    def do_DELETE(self):
+        self.server.calls.append(("logout", self.headers.get("X-FTL-SID")))
+        self.send_json(204 if self.headers.get("X-FTL-SID") == self.server.sid else 401, {})
+
+    def do_GET(self):
+        server = self.server
+        server.calls.append(self.path)
+        if self.path == "/api/auth":
+            return self.send_json(401, {"session": {"valid": False}})
+        if self.headers.get("X-FTL-SID") != server.sid:
+            return self.send_json(401, {"error": {"key": "unauthorized"}})
+        if self.path == "/api/stats/summary":
+            return self.send_json(200, SUMMARY)
+        if self.path == "/api/dns/blocking":
+            return self.send_json(200, {"blocking": "enabled"})
+        self.send_json(404, {"error": {"key": "not_found"}})
+
+
+class FakeV5(JSONHandler):
+    """Legacy api.php: /api/auth is a 404 page"""
+
+    def do_GET(self):
+        self.server.calls.append(self.path)
+        if self.path.startswith("/admin/api.php"):
+            return self.send_json(200, {"status": "enabled", "domains_being_blocked": 10,
+                                        "dns_queries_today": 50, "ads_blocked_today": 5,
+                                        "ads_percentage_today": 10.0, "unique_clients": 2})
+        self.send_response(404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+def v6_server(serve):
+    server = serve(FakeFTLv6)
+    server.sid = None
+    return server
+
+
+def url(server, path="/admin/api.php"):
+    return f"http://127.0.0.1:{server.server_port}{path}"
+
+
+def test_logs_in_once_across_polls(serve):
+    server = v6_server(serve)
+    client = pihole_monitor.PiHoleV6Client(url(server, ""), "secret", timeout=2)
+    for _ in range(5):
+        data = client.fetch_status()
+    client.close()
+
+    assert data == {'status': 'enabled', 'domains_blocked': 1234, 'queries_today': 100,
+                    'blocked_today': 25, 'percent_blocked': 25.0, 'clients': 4}
+    assert server.calls.count("login") == 1
+    assert server.calls.count("/api/stats/summary") == 5
+    # Blocking state is refreshed once a minute, not every poll
+    assert server.calls.count("/api/dns/blocking") == 1
+
+
+def test_relogs_in_once_after_401(serve):
+    server = v6_server(serve)
+    client = pihole_monitor.PiHoleV6Client(url(server, ""), "secret", timeout=2)
+    client.fetch_status()
+    # FTL restarted or expired the session
+    server.sid = "gone"
+    client.fetch_status()
+    client.fetch_status()
+    client.close()
+
+    assert server.calls.count("login") == 2
+    assert client.auths == 2
+
+
+def test_close_logs_out(serve):
+    server = v6_server(serve)
+    client = pihole_monitor.PiHoleV6Client(url(server, ""), "secret", timeout=2)
+    client.fetch_status()
+    client.close()
+
+    assert server.calls[-1] == ("logout", "sid1")
+    assert client.sid is None
+
+
+def test_wrong_password_raises(serve):
+    server = v6_server(serve)
+    client = pihole_monitor.PiHoleV6Client(url(server, ""), "wrong", timeout=2)
+    with pytest.raises(Exception):
+        client.fetch_status()
+    client.close()
+    assert not any(isinstance(call, tuple) for call in server.calls)
+
+
+def test_detects_v6(serve):
+    server = v6_server(serve)
+    assert pihole_monitor.detect_api_version(url(server), timeout=2) == 6
+
+
+def test_detects_v5(serve):
+    server = serve(FakeV5)
+    assert pihole_monitor.detect_api_version(url(server), timeout=2) == 5
+
+
+@pytest.mark.parametrize("handler, client_class", [
+    (FakeFTLv6, pihole_monitor.PiHoleV6Client),
+    (FakeV5, pihole_monitor.PiHoleAPIClient)
+])
+def test_autodetect_probes_once_and_delegates(serve, handler, client_class):
+    server = serve(handler)
+    server.sid = None
+    client = pihole_monitor.AutoDetectAPIClient(url(server), "secret", timeout=2)
+    client.fetch_status()
+    client.fetch_status()
+    client.close()
+
+    assert type(client.client) is client_class
+    assert server.calls.count("/api/auth") == 1
@@ -0,0 +1,126 @@
+"""PollController: adaptive interval, backoff with jitter, circuit breaker"""
+
+import pytest
+
+import pihole_monitor
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def advance(self, seconds):
+        self.now += seconds
+        return self.now
+
+
+def controller(**kwargs):
+    kwargs.setdefault("min_interval", 2)
+    kwargs.setdefault("max_interval", 60)
+    kwargs.setdefault("jitter", 0)
+    return pihole_monitor.PollController(10, **kwargs)
+
+
+def feed(poll, clock, rate, polls, status="enabled", queries=0, noise=()):
+    """Poll at the controller's own pace with `rate` queries/s; returns
+    (queries so far, intervals used)"""
+    intervals = []
+    for index in range(polls):
+        delay = poll.next_delay()
+        intervals.append(delay)
+        queries += round(rate * delay) + (noise[index % len(noise)] if noise else 0)
+        poll.record_success({"queries_today": queries, "status": status}, now=clock.advance(delay))
+    return queries, intervals
+
+
+@pytest.mark.parametrize("rate", [0.5, 2, 20])
+def test_steady_traffic_stretches_the_interval(rate):
+    clock, poll = FakeClock(), controller()
+    poll.record_success({"queries_today": 0, "status": "enabled"}, now=clock.now)
+    # Counts wobble by about one standard deviation of Poisson noise
+    _, intervals = feed(poll, clock, rate, 40, noise=(3, -2, 1, -3, 2))
+    assert min(intervals) >= 10
+    assert intervals[-1] == 60
+
+
+def test_step_change_returns_to_the_configured_interval():
+    clock, poll = FakeClock(), controller()
+    poll.record_success({"queries_today": 0, "status": "enabled"}, now=clock.now)
+    queries, _ = feed(poll, clock, 2, 20)
+    assert poll.interval == 60
+
+    feed(poll, clock, 10, 1, queries=queries)
+    assert poll.interval == 10
+
+
+def test_rate_change_never_polls_faster_than_configured():
+    clock, poll = FakeClock(), controller()
+    poll.record_success({"queries_today": 0, "status": "enabled"}, now=clock.now)
+    queries, _ = feed(poll, clock, 1, 5)
+    for rate in (20, 1, 20, 1):
+        queries, intervals = feed(poll, clock, rate, 1, queries=queries)
+        assert min(intervals) >= 10
+        assert poll.interval == 10
+
+
+def test_status_change_polls_faster():
+    clock, poll = FakeClock(), controller()
+    poll.record_success({"queries_today": 0, "status": "enabled"}, now=clock.now)
+    queries, _ = feed(poll, clock, 1, 3)
+    queries, _ = feed(poll, clock, 1, 1, status="disabled", queries=queries)
+    assert poll.interval == 5
+    feed(poll, clock, 1, 1, status="enabled", queries=queries)
+    assert poll.interval == 2.5
+
+
+def test_midnight_reset_is_not_a_change():
+    clock, poll = FakeClock(), controller()
+    poll.record_success({"queries_today": 0, "status": "enabled"}, now=clock.now)
+    feed(poll, clock, 2, 10)
+    interval = poll.interval
+    poll.record_success({"queries_today": 3, "status": "enabled"}, now=clock.advance(interval))
+    assert poll.interval == interval
+
+
+def test_backoff_doubles_with_jitter_and_caps():
+    draws = iter([0.0, 1.0, 0.5, 0.5, 0.5, 0.5, 0.5])
+    poll = controller(jitter=0.2, max_backoff=60, rng=lambda: next(draws))
+    delays = []
+    for _ in range(5):
+        poll.record_failure()
+        delays.append(poll.next_delay())
+    assert delays == [pytest.approx(8.0), pytest.approx(24.0), 40.0, 60.0, 60.0]
+
+
+def test_open_half_open_closed():
+    poll = controller(failure_threshold=3)
+    for _ in range(2):
+        poll.record_failure()
+        assert poll.state == poll.CLOSED
+    poll.record_failure()
+    assert poll.state == poll.OPEN and poll.is_open
+
+    poll.start_poll()
+    assert poll.state == poll.HALF_OPEN and poll.is_open
+    poll.record_success({"queries_today": 10, "status": "enabled"}, now=100.0)
+    assert poll.state == poll.CLOSED and not poll.is_open
+    assert poll.next_delay() == 10
+
+
+def test_failed_probe_reopens_at_once():
+    poll = controller(failure_threshold=3)
+    for _ in range(3):
+        poll.record_failure()
+    poll.start_poll()
+    poll.record_failure()
+    assert poll.state == poll.OPEN
+
+
+def test_probe_timeout_never_exceeds_the_configured_timeout():
+    poll = controller(failure_threshold=1)
+    instance = pihole_monitor.PiHoleInstance("slow", None, 1.5, controller=poll, probe_timeout=2)
+    assert instance.current_timeout() == 1.5
+    poll.record_failure()
+    assert instance.current_timeout() == 1.5
+    instance.timeout = 5
+    assert instance.current_timeout() == 2
@@ -0,0 +1,73 @@
+"""replay_trace renders a recorded session without touching the network"""
+
+import io
+import json
+import sys
+
+import pihole_monitor
+
+PIHOLE = {"status": "enabled", "domains_blocked": 1000, "queries_today": 500,
+          "blocked_today": 50, "percent_blocked": 10.0, "clients": 3}
+SYSTEM = {"cpu_percent": 12.0, "memory_percent": 40.0, "temperature": 48.0,
+          "disk_percent": 20.0, "cpu_avg": 12.0, "memory_avg": 40.0}
+
+
+def test_replay_of_v6_session_does_not_import_requests(tmp_path, monkeypatch, piglow):
+    monkeypatch.chdir(tmp_path)
+    config_file = tmp_path / "config.json"
+    config_file.write_text(json.dumps({"features": {"enable_startup_sequence": False}}))
+    monitor = pihole_monitor.PiHolePiGlowMonitor(str(config_file), piglow=piglow)
+    config = dict(monitor.config, pihole_api_version=6,
+                  pihole_instances=[{"name": "primary", "url": "http://192.0.2.1", "api_version": 6},
+                                    {"name": "secondary", "url": "http://192.0.2.2/admin/api.php",
+                                     "api_version": 5}])
+    monitor.close()
+
+    now = [0.0]
+    trace_path = str(tmp_path / "trace.jsonl.gz")
+    recorder = pihole_monitor.TraceRecorder(trace_path, config, clock=lambda: now[0])
+    for second in range(5):
+        now[0] = float(second)
+        recorder.record("system", SYSTEM)
+        recorder.record("pihole:primary", dict(PIHOLE, queries_today=500 + second * 20))
+        recorder.record("pihole:secondary", PIHOLE)
+    recorder.close()
+
+    # Any attempt to import requests now fails
+    monkeypatch.setitem(sys.modules, "requests", None)
+    output = io.StringIO()
+    pihole_monitor.replay_trace(trace_path, output=output)
+    frames = output.getvalue().splitlines()
+    assert frames
+    assert all(len(frame.split()) == 2 for frame in frames)
+
+
+def test_replay_is_deterministic(tmp_path, monkeypatch, piglow):
+    monkeypatch.chdir(tmp_path)
+    config_file = tmp_path / "config.json"
+    config_file.write_text(json.dumps({"features": {"enable_startup_sequence": False}}))
+    monitor = pihole_monitor.PiHolePiGlowMonitor(str(config_file), piglow=piglow)
+    config = monitor.config
+    monitor.close()
+
+    now = [0.0]
+    trace_path = str(tmp_path / "trace.jsonl.gz")
+    recorder = pihole_monitor.TraceRecorder(trace_path, config, clock=lambda: now[0])
+    for second in range(30):
+        now[0] = second * 0.7
+        recorder.record("system", dict(SYSTEM, cpu_percent=10.0 + (second * 37) % 80,
+                                       temperature=45.0 + second % 20))
+        if second % 3 == 0:
+            status = "disabled" if 12 <= second < 18 else "enabled"
+            recorder.record("pihole:local", dict(PIHOLE, status=status, queries_today=500 + second * second))
+        if second == 21:
+            recorder.record("pihole:local", None)
+    recorder.close()
+
+    outputs = []
+    for _ in range(2):
+        output = io.StringIO()
+        pihole_monitor.replay_trace(trace_path, output=output)
+        outputs.append(output.getvalue())
+    assert len(outputs[0].splitlines()) > 10
+    assert outputs[0] == outputs[1]
@@ -0,0 +1,100 @@
+"""Temperature backend detection against a fake sysfs tree"""
+
+import pytest
+
+import pihole_monitor
+
+
+@pytest.fixture
+def sysfs(tmp_path):
+    """Builds thermal_zone / hwmon entries under a temporary sysfs root"""
+
+    def thermal_zone(index, zone_type, millidegrees):
+        zone = tmp_path / "class" / "thermal" / f"thermal_zone{index}"
+        zone.mkdir(parents=True)
+        (zone / "type").write_text(f"{zone_type}\n")
+        (zone / "temp").write_text(f"{millidegrees}\n")
+
+    def hwmon(index, millidegrees):
+        device = tmp_path / "class" / "hwmon" / f"hwmon{index}"
+        device.mkdir(parents=True)
+        (device / "temp1_input").write_text(f"{millidegrees}\n")
+
+    sysfs = type("Sysfs", (), {})()
+    sysfs.root = str(tmp_path)
+    sysfs.thermal_zone = thermal_zone
+    sysfs.hwmon = hwmon
+    return sysfs
+
+
+@pytest.fixture(autouse=True)
+def no_vcgencmd(monkeypatch):
+    monkeypatch.setattr(pihole_monitor.shutil, "which", lambda name: None)
+
+
+def test_cpu_zone_preferred_over_earlier_zone(sysfs):
+    sysfs.thermal_zone(0, "acpitz", 30000)
+    sysfs.thermal_zone(1, "x86_pkg_temp", 35000)
+    sysfs.thermal_zone(2, "cpu-thermal", 52150)
+
+    sensor = pihole_monitor.detect_temperature_sensor(sysfs_root=sysfs.root)
+    assert sensor.name == "thermal:thermal_zone2"
+    assert sensor.read() == pytest.approx(52.15)
+    sensor.close()
+
+
+def test_soc_zone_counts_as_preferred(sysfs):
+    sysfs.thermal_zone(0, "gpu-thermal", 40000)
+    sysfs.thermal_zone(1, "soc_thermal", 47000)
+
+    sensor = pihole_monitor.detect_temperature_sensor(sysfs_root=sysfs.root)
+    assert sensor.name == "thermal:thermal_zone1"
+    sensor.close()
+
+
+def test_hwmon_is_the_fallback(sysfs):
+    sysfs.hwmon(0, 44000)
+
+    sensor = pihole_monitor.detect_temperature_sensor(sysfs_root=sysfs.root)
+    assert sensor.name == "hwmon:hwmon0"
+    assert sensor.read() == pytest.approx(44.0)
+    sensor.close()
+
+
+def test_unreadable_zone_falls_through_to_hwmon(sysfs):
+    sysfs.thermal_zone(0, "cpu-thermal", "not a number")
+    sysfs.hwmon(0, 44000)
+
+    sensor = pihole_monitor.detect_temperature_sensor(sysfs_root=sysfs.root)
+    assert sensor.name == "hwmon:hwmon0"
+    sensor.close()
+
+
+def test_empty_tree_disables_temperature(sysfs):
+    sensor = pihole_monitor.detect_temperature_sensor(sysfs_root=sysfs.root)
+    assert type(sensor) is pihole_monitor.TemperatureSensor
+    assert sensor.read() is None
+
+
+def test_vcgencmd_not_used_when_sysfs_works(sysfs, monkeypatch):
+    monkeypatch.setattr(pihole_monitor.shutil, "which", lambda name: "/usr/bin/" + name)
+
+    def forbidden(*args, **kwargs):
+        raise AssertionError("vcgencmd must not run when sysfs works")
+
+    monkeypatch.setattr(pihole_monitor.subprocess, "check_output", forbidden)
+    sysfs.thermal_zone(0, "cpu-thermal", 50000)
+
+    sensor = pihole_monitor.detect_temperature_sensor(sysfs_root=sysfs.root)
+    assert isinstance(sensor, pihole_monitor.SysfsTemperatureSensor)
+    sensor.close()
+
+
+def test_vcgencmd_is_the_last_resort(sysfs, monkeypatch):
+    monkeypatch.setattr(pihole_monitor.shutil, "which", lambda name: "/usr/bin/" + name)
+    monkeypatch.setattr(pihole_monitor.subprocess, "check_output",
+                        lambda *args, **kwargs: b"temp=48.3'C\n")
+
+    sensor = pihole_monitor.detect_temperature_sensor(sysfs_root=sysfs.root)
+    assert sensor.name == "vcgencmd"
+    assert sensor.read() == pytest.approx(48.3)
@@ -0,0 +1,71 @@
+"""Top talkers: aggregates by default, names only when opted in"""
+
+import json
+
+import pytest
+
+import pihole_monitor
+
+
+def aggregator_with_traffic():
+    now = [0.0]
+    aggregator = pihole_monitor.QueryAggregator(capacity=4, clock=lambda: now[0])
+    for index in range(60):
+        aggregator.add('query', b"tracker.example", b"192.168.1.23")
+        aggregator.add('query', f"site{index % 6}.example".encode(), f"192.168.1.{index % 3}".encode())
+    aggregator.add('blocked', b"ads.example", b"192.168.1.23")
+    return aggregator
+
+
+def test_snapshot_carries_dominant_share_and_error_bound():
+    snapshot = aggregator_with_traffic().snapshot(3)
+    assert snapshot['dominant']['clients'] == pytest.approx(0.5)
+    assert snapshot['dominant']['domains'] == pytest.approx(0.5, abs=0.1)
+    assert snapshot['dominant']['blocked_domains'] == 1.0
+    # Six rotating domains in a 4-slot sketch: counts are estimates
+    assert 0 < snapshot['error_bound']['domains'] <= 1 / 4
+    assert snapshot['error_bound']['clients'] == 0.0
+
+
+def test_summary_drops_names():
+    summary = pihole_monitor.talker_summary(aggregator_with_traffic().snapshot())
+    assert set(summary) == {'recent_queries', 'dominant', 'error_bound'}
+    assert "192.168.1" not in json.dumps(summary)
+
+
+@pytest.fixture
+def exporter(tmp_path, monkeypatch, piglow):
+    monkeypatch.chdir(tmp_path)
+
+    def make(expose_names):
+        config_file = tmp_path / "config.json"
+        config_file.write_text(json.dumps({"top_talkers": {"expose_names": expose_names}}))
+        monitor = pihole_monitor.PiHolePiGlowMonitor(str(config_file), piglow=piglow)
+        monitor.collectors = []
+        monitor.state.update('top_talkers', aggregator_with_traffic().snapshot())
+        return pihole_monitor.MetricsExporter(monitor).build().decode()
+
+    return make
+
+
+def test_exporter_publishes_aggregates_only_by_default(exporter):
+    body = exporter(False)
+    assert 'pihole_piglow_top_talker_dominant_share{kind="clients"} 0.5' in body
+    assert "top_talker_error_bound" in body
+    assert "192.168.1.23" not in body
+    assert "tracker.example" not in body
+
+
+def test_exporter_names_need_opt_in(exporter):
+    body = exporter(True)
+    assert 'name="192.168.1.23"' in body
+    assert 'name="tracker.example"' in body
+
+
+@pytest.mark.parametrize("talker_names", [False, True])
+def test_dashboard_names_need_opt_in(talker_names):
+    dashboard = pihole_monitor.DashboardServer(None, talker_names=talker_names)
+    dashboard.publish_state({'top_talkers': aggregator_with_traffic().snapshot()}, 1, 0.0)
+    published = dashboard.metrics['top_talkers']
+    assert ("192.168.1.23" in published) == talker_names
+    assert '"dominant"' in published